@@ -0,0 +1,59 @@
+import os
+from functools import lru_cache
+
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.databases.routing import engine
+
+#Serve the /async routes next to the sync ones ("1" to enable)
+ASYNC_ROUTES_ENABLED = os.getenv("RUNML_ASYNC_ROUTES", "0") == "1"
+
+#Async driver used for each backend when RUNML_ASYNC_DATABASE_URL is not given
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+#Pool sizing of the async engine
+ASYNC_POOL_SIZE = int(os.getenv("RUNML_ASYNC_POOL_SIZE", "20"))
+ASYNC_MAX_OVERFLOW = int(os.getenv("RUNML_ASYNC_MAX_OVERFLOW", "10"))
+ASYNC_POOL_TIMEOUT = float(os.getenv("RUNML_ASYNC_POOL_TIMEOUT", "30"))
+ASYNC_POOL_RECYCLE = int(os.getenv("RUNML_ASYNC_POOL_RECYCLE", "1800"))
+
+
+def async_database_url():
+    """
+    It returns the URL of the async engine: RUNML_ASYNC_DATABASE_URL when set, otherwise the URL of
+    the sync engine with its driver swapped for the async one, so both modes hit the same database
+    """
+    url = os.getenv("RUNML_ASYNC_DATABASE_URL")
+    if url:
+        return url
+    return engine.url.set(drivername=ASYNC_DRIVERS[engine.url.get_backend_name()])
+
+
+@lru_cache(maxsize=None)
+def get_async_engine():
+    """
+    It creates the async engine on first use, so the async driver is only needed in async mode
+    """
+    url = async_database_url()
+    options = {"pool_pre_ping": True}
+    if not str(url).startswith("sqlite"):
+        options.update(pool_size=ASYNC_POOL_SIZE, max_overflow=ASYNC_MAX_OVERFLOW,
+                       pool_timeout=ASYNC_POOL_TIMEOUT, pool_recycle=ASYNC_POOL_RECYCLE)
+    return create_async_engine(url, **options)
+
+
+@lru_cache(maxsize=None)
+def get_async_sessionmaker():
+    return sessionmaker(bind=get_async_engine(), class_=AsyncSession, expire_on_commit=False)
+
+
+async def get_async_db():
+    """
+    The async counterpart of get_db: it yields an AsyncSession and closes it after the request
+    """
+    async with get_async_sessionmaker()() as db:
+        yield db
@@ -0,0 +1,286 @@
+import logging
+import os
+import re
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import func, inspect, select, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.exc import IntegrityError
+
+import app.models.table_model as models
+from app.models.partition_model import ResultPartition
+
+#"auto" partitions the results tables natively on Postgres and keeps the catalog layout (ranges of
+#created_at rows of the single table) on the other databases, "catalog" keeps the catalog layout on
+#Postgres too, "off" turns the partitions and the retention off
+PARTITIONING = os.getenv("RUNML_PARTITIONING", "auto")
+#Length of the range of one partition: "day", "week" or "month"
+PARTITION_INTERVAL = os.getenv("RUNML_PARTITION_INTERVAL", "month")
+#Partitions created ahead of the current one, so that inserts never wait for one to be created
+PARTITION_PREMAKE = int(os.getenv("RUNML_PARTITION_PREMAKE", "3"))
+#The background maintenance converts a results table to native partitions when it holds at most this
+#many rows, 0 leaves every table to POST /partitions/{source}/convert. The copy locks the table, the
+#size check before it does not.
+PARTITION_CONVERT_ROWS = int(os.getenv("RUNML_PARTITION_CONVERT_ROWS", "0"))
+
+#The results tables partitioned by created_at, by the name used in the /partitions endpoints
+PARTITIONED_SOURCES = {
+    "metadata": models.MetadataIngestionEntity,
+    "usage": models.UsageIngestionEntity,
+    "profiling": models.ProfilingEntity,
+    "drift": models.DriftService_Dump,
+}
+INTERVALS = ("day", "week", "month")
+
+#The bound of a range partition as printed by pg_get_expr
+_RANGE_BOUND = re.compile(r"FROM \('([^']+)'\) TO \('([^']+)'\)")
+
+partition_log = logging.getLogger("runml.partitions")
+
+
+def period_start(moment: datetime, interval: str = PARTITION_INTERVAL) -> datetime:
+    day = datetime(moment.year, moment.month, moment.day)
+    if interval == "day":
+        return day
+    if interval == "week":
+        return day - timedelta(days=day.weekday())
+    if interval == "month":
+        return day.replace(day=1)
+    raise ValueError(f"Partition interval must be one of {list(INTERVALS)}")
+
+
+def next_period(start: datetime, interval: str = PARTITION_INTERVAL) -> datetime:
+    if interval == "month":
+        return start.replace(year=start.year + start.month // 12, month=start.month % 12 + 1)
+    return start + timedelta(days=7 if interval == "week" else 1)
+
+
+def periods(first: datetime, last: datetime, interval: str = PARTITION_INTERVAL) -> List[Tuple[datetime, datetime]]:
+    """
+    It returns the (start, end) ranges of the partitions covering `first` to `last`, both included
+    """
+    ranges = []
+    start = period_start(first, interval)
+    while start <= last:
+        end = next_period(start, interval)
+        ranges.append((start, end))
+        start = end
+    return ranges
+
+
+def partition_name(table_name: str, start: datetime) -> str:
+    return f"{table_name}_p{start:%Y%m%d}"
+
+
+def default_partition_name(table_name: str) -> str:
+    return f"{table_name}_pdefault"
+
+
+def _ahead(now: datetime) -> datetime:
+    """
+    It returns the end of the last partition created ahead: the current period and
+    RUNML_PARTITION_PREMAKE more
+    """
+    end = next_period(period_start(now))
+    for _ in range(PARTITION_PREMAKE):
+        end = next_period(end)
+    return end
+
+
+def native_partitioning(conn: Connection) -> bool:
+    return PARTITIONING == "auto" and conn.dialect.name == "postgresql"
+
+
+def _quote(conn: Connection, name: str) -> str:
+    return conn.dialect.identifier_preparer.quote(name)
+
+
+def _literal(moment: datetime) -> str:
+    return f"'{moment:%Y-%m-%d %H:%M:%S}'"
+
+
+def is_partitioned(conn: Connection, table_name: str) -> bool:
+    if conn.dialect.name != "postgresql":
+        return False
+    return bool(conn.execute(text("SELECT count(*) FROM pg_partitioned_table WHERE partrelid = to_regclass(:name)"),
+                             {"name": _quote(conn, table_name)}).scalar())
+
+
+def native_partitions(conn: Connection, table_name: str) -> List[Dict[str, Any]]:
+    """
+    It returns the partitions attached to a partitioned table on Postgres, with their range (None
+    for the default partition)
+    """
+    rows = conn.execute(text("SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits i "
+                             "JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = to_regclass(:name) "
+                             "ORDER BY c.relname"), {"name": _quote(conn, table_name)})
+    partitions = []
+    for name, bound in rows:
+        match = _RANGE_BOUND.search(bound or "")
+        partitions.append({
+            "name": name,
+            "range_start": datetime.fromisoformat(match.group(1)) if match else None,
+            "range_end": datetime.fromisoformat(match.group(2)) if match else None,
+        })
+    return partitions
+
+
+def create_partition(conn: Connection, table, start: datetime, end: datetime) -> str:
+    """
+    It creates the partition of `table` for created_at in [start, end). The rows of that range that
+    were inserted into the default partition meanwhile (late or clock skewed results) are moved into
+    the new partition, which Postgres requires before attaching it.
+    """
+    name = partition_name(table.name, start)
+    parent, partition = _quote(conn, table.name), _quote(conn, name)
+    default = _quote(conn, default_partition_name(table.name))
+    created_at = _quote(conn, table.c.created_at.name)
+    bounds = f"FROM ({_literal(start)}) TO ({_literal(end)})"
+    in_range = f"{created_at} >= :start AND {created_at} < :end"
+    stray = conn.execute(text(f"SELECT count(*) FROM {default} WHERE {in_range}"), {"start": start, "end": end}).scalar()
+    if not stray:
+        conn.execute(text(f"CREATE TABLE IF NOT EXISTS {partition} PARTITION OF {parent} FOR VALUES {bounds}"))
+        return name
+    conn.execute(text(f"CREATE TABLE {partition} (LIKE {parent} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+    conn.execute(text(f"WITH moved AS (DELETE FROM {default} WHERE {in_range} RETURNING *) "
+                      f"INSERT INTO {partition} SELECT * FROM moved"), {"start": start, "end": end})
+    conn.execute(text(f"ALTER TABLE {parent} ATTACH PARTITION {partition} FOR VALUES {bounds}"))
+    partition_log.info("Moved %s rows of %s from the default partition to %s", stray, table.name, name)
+    return name
+
+
+def convert_to_partitioned(conn: Connection, table, max_rows: Optional[int] = None,
+                           now: Optional[datetime] = None) -> Dict[str, Any]:
+    """
+    It turns a results table into a table partitioned by range of created_at on Postgres: the rows
+    are copied into a new partitioned table, one partition per period from the oldest row, which
+    then replaces the table. The table is locked for the duration of the copy, and the primary key
+    becomes (id, created_at) since Postgres requires it to hold the partition key.
+    
+    :param conn: A connection inside the transaction of the conversion
+    :type conn: Connection
+    :param table: The Table of the results model
+    :param max_rows: Leave the table as it is when it holds more rows, checked before the lock by
+    reading at most max_rows + 1 rows
+    :type max_rows: Optional[int]
+    :return: A dictionary with the action taken, the rows copied and the partitions created
+    """
+    name, staging = table.name, f"{table.name}__partitioned"
+    quoted, quoted_staging = _quote(conn, name), _quote(conn, staging)
+    created_at = _quote(conn, table.c.created_at.name)
+    if max_rows is not None:
+        probed = conn.execute(text(f"SELECT count(*) FROM (SELECT 1 FROM {quoted} LIMIT :limit) AS probe"),
+                              {"limit": max_rows + 1}).scalar()
+        if probed > max_rows:
+            return {"action": "skipped",
+                    "reason": f"More than {max_rows} rows, convert it with POST /partitions/{{source}}/convert"}
+    conn.execute(text(f"LOCK TABLE {quoted} IN ACCESS EXCLUSIVE MODE"))
+    rows, oldest = conn.execute(text(f"SELECT count(*), min({created_at}) FROM {quoted}")).one()
+
+    now = now or datetime.utcnow()
+    conn.execute(text(f"CREATE TABLE {quoted_staging} (LIKE {quoted} INCLUDING DEFAULTS INCLUDING CONSTRAINTS "
+                      f"INCLUDING STORAGE INCLUDING COMMENTS) PARTITION BY RANGE ({created_at})"))
+    #Every row has to fall into a range, so the rows inserted without created_at get the insert time
+    conn.execute(text(f"ALTER TABLE {quoted_staging} ALTER COLUMN {created_at} SET DEFAULT now()"))
+    key = ", ".join(_quote(conn, column.name) for column in table.primary_key.columns)
+    conn.execute(text(f"ALTER TABLE {quoted_staging} ADD CONSTRAINT {_quote(conn, staging + '_pkey')} "
+                      f"PRIMARY KEY ({key}, {created_at})"))
+    conn.execute(text(f"CREATE TABLE {_quote(conn, default_partition_name(name))} PARTITION OF {quoted_staging} DEFAULT"))
+    ranges = periods(min(oldest or now, now), _ahead(now) - timedelta(seconds=1))
+    for start, end in ranges:
+        conn.execute(text(f"CREATE TABLE {_quote(conn, partition_name(name, start))} PARTITION OF {quoted_staging} "
+                          f"FOR VALUES FROM ({_literal(start)}) TO ({_literal(end)})"))
+
+    columns = [column["name"] for column in inspect(conn).get_columns(name)]
+    selected = ", ".join(f"COALESCE({created_at}, now())" if column == table.c.created_at.name else _quote(conn, column)
+                         for column in columns)
+    conn.execute(text(f"INSERT INTO {quoted_staging} ({', '.join(_quote(conn, column) for column in columns)}) "
+                      f"SELECT {selected} FROM {quoted}"))
+    #The serial sequences are owned by the old table and would be dropped with it
+    for column in table.primary_key.columns:
+        sequence = conn.execute(text("SELECT pg_get_serial_sequence(:table, :column)"),
+                                {"table": quoted, "column": column.name}).scalar()
+        if sequence:
+            conn.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY {quoted_staging}.{_quote(conn, column.name)}"))
+    conn.execute(text(f"DROP TABLE {quoted}"))
+    conn.execute(text(f"ALTER TABLE {quoted_staging} RENAME TO {quoted}"))
+    conn.execute(text(f"ALTER TABLE {quoted} RENAME CONSTRAINT {_quote(conn, staging + '_pkey')} "
+                      f"TO {_quote(conn, name + '_pkey')}"))
+    for index in table.indexes:
+        if index.unique and table.c.created_at not in index.columns:
+            partition_log.warning("Unique index %s of %s skipped, it does not hold created_at", index.name, name)
+            continue
+        index.create(bind=conn)
+    partition_log.info("Converted %s to %s partitions (%s rows)", name, len(ranges), rows)
+    return {"action": "converted", "rows": rows, "partitions": len(ranges)}
+
+
+def record_partitions(conn: Connection, table_name: str, ranges: List[Tuple[datetime, datetime]]) -> List[str]:
+    """
+    It adds the ranges that are not in the catalog yet to it, and returns their names
+    """
+    catalog = ResultPartition.__table__
+    known = set(conn.execute(select(catalog.c.name).where(catalog.c.table_name == table_name)).scalars())
+    new = [{"name": partition_name(table_name, start), "table_name": table_name, "range_start": start,
+            "range_end": end, "state": "Active"}
+           for start, end in ranges if partition_name(table_name, start) not in known]
+    if not new:
+        return []
+    try:
+        with conn.begin_nested():
+            conn.execute(catalog.insert(), new)
+    except IntegrityError:
+        #Another worker recorded them first
+        return []
+    return [row["name"] for row in new]
+
+
+def ensure_partitions(conn: Connection, model, now: Optional[datetime] = None,
+                      convert_rows: Optional[int] = None) -> Dict[str, Any]:
+    """
+    It makes sure the partitions of a results table exist from the current period to
+    RUNML_PARTITION_PREMAKE periods ahead. On Postgres a table that is not partitioned yet is
+    converted first when `convert_rows` is given and it holds at most that many rows; until it is,
+    and on the other databases, the ranges are only kept in the catalog (result_partitions) and the
+    retention deletes them by range of created_at.
+    
+    :param conn: A connection inside a transaction
+    :type conn: Connection
+    :param model: A model of PARTITIONED_SOURCES
+    :param now: The current time, UTC (now by default)
+    :type now: Optional[datetime]
+    :param convert_rows: Largest table converted, None leaves the table as it is
+    :type convert_rows: Optional[int]
+    :return: A dictionary with the layout of the table and the partitions created
+    """
+    table = model.__table__
+    if "created_at" not in table.c:
+        return {"layout": "none", "reason": "No created_at column"}
+    now = now or datetime.utcnow()
+    report = {"layout": "catalog", "created": []}
+    if native_partitioning(conn):
+        if convert_rows is not None and not is_partitioned(conn, table.name):
+            report["conversion"] = convert_to_partitioned(conn, table, convert_rows, now)
+        if is_partitioned(conn, table.name):
+            report["layout"] = "native"
+            existing = native_partitions(conn, table.name)
+            names = {partition["name"] for partition in existing}
+            if default_partition_name(table.name) not in names:
+                conn.execute(text(f"CREATE TABLE {_quote(conn, default_partition_name(table.name))} "
+                                  f"PARTITION OF {_quote(conn, table.name)} DEFAULT"))
+            for start, end in periods(now, _ahead(now) - timedelta(seconds=1)):
+                if partition_name(table.name, start) not in names:
+                    report["created"].append(create_partition(conn, table, start, end))
+                    existing.append({"name": partition_name(table.name, start), "range_start": start, "range_end": end})
+            record_partitions(conn, table.name, [(partition["range_start"], partition["range_end"])
+                                                 for partition in existing if partition["range_start"] is not None])
+            return report
+
+    #The catalog covers the table from its oldest row, so that the retention finds the old ranges
+    oldest = conn.execute(select(func.min(table.c.created_at))).scalar()
+    if isinstance(oldest, str):
+        oldest = datetime.fromisoformat(oldest)
+    first = min(oldest, now) if oldest is not None else now
+    report["created"] = record_partitions(conn, table.name, periods(first, _ahead(now) - timedelta(seconds=1)))
+    return report
@@ -0,0 +1,196 @@
+import os
+import threading
+import time
+from functools import lru_cache
+from typing import Any, Dict, FrozenSet
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.orm import sessionmaker
+
+from app.databases import database
+
+#URL of the primary database, the engine of app.databases.database itself is used when not set
+PRIMARY_DATABASE_URL = os.getenv("RUNML_DATABASE_URL")
+#URL of a read replica serving the read-only routes, the primary serves them when not set
+REPLICA_DATABASE_URL = os.getenv("RUNML_REPLICA_DATABASE_URL")
+#Seconds after a config, project or task write committed by this process during which its reads still
+#go to the primary, so that a replica lagging behind does not serve (and the config cache keep) what was
+#just replaced. Results writes do not count, see read_after_write_tables.
+REPLICA_MAX_LAG = float(os.getenv("RUNML_REPLICA_MAX_LAG", "5"))
+#Create the tables on the replica at startup too, for local stand-ins that are not replicated (e.g. two SQLite files)
+REPLICA_SCHEMA_SETUP = os.getenv("RUNML_REPLICA_SCHEMA_SETUP", "0") == "1"
+
+#Pool sizing of the sync engines built from the URLs above, ignored by SQLite which does not pool
+#connections the same way
+POOL_SIZE = int(os.getenv("RUNML_DB_POOL_SIZE", "10"))
+MAX_OVERFLOW = int(os.getenv("RUNML_DB_MAX_OVERFLOW", "20"))
+POOL_TIMEOUT = float(os.getenv("RUNML_DB_POOL_TIMEOUT", "30"))
+POOL_RECYCLE = int(os.getenv("RUNML_DB_POOL_RECYCLE", "1800"))
+POOL_PRE_PING = os.getenv("RUNML_DB_POOL_PRE_PING", "1") == "1"
+
+
+def engine_options(url) -> Dict[str, Any]:
+    """
+    It returns the create_engine options of a sync engine: pre-ping and recycle everywhere, the
+    pool sizes for the servers, and the thread check turned off for SQLite
+    """
+    url = make_url(url)
+    options = {"pool_pre_ping": POOL_PRE_PING, "pool_recycle": POOL_RECYCLE}
+    if url.get_backend_name() == "sqlite":
+        options["connect_args"] = {"check_same_thread": False}
+    else:
+        options.update(pool_size=POOL_SIZE, max_overflow=MAX_OVERFLOW, pool_timeout=POOL_TIMEOUT)
+    return options
+
+
+def build_engine(url) -> Engine:
+    return create_engine(url, **engine_options(url))
+
+
+def primary_engine(url=None) -> Engine:
+    """
+    It returns the engine of the primary: a new one for an explicit `url`, otherwise the engine of
+    app.databases.database with its own connect arguments and pool, instead of a second pool on
+    the same database
+    """
+    return build_engine(url) if url else database.engine
+
+
+#The primary takes every write, and the reads of the routes that are not read-only
+engine = primary_engine(PRIMARY_DATABASE_URL)
+#The engine of the read-only routes, the primary itself without a replica
+read_engine = build_engine(REPLICA_DATABASE_URL) if REPLICA_DATABASE_URL else engine
+
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+
+
+@lru_cache(maxsize=None)
+def read_after_write_tables() -> FrozenSet[str]:
+    """
+    It returns the tables whose writes the read-only routes must see at once: projects and tasks,
+    the configs with their latest pointers, the drift sketches, the usage summaries and the alert
+    rules. Results (and their rollups) are written all the time by the ingestion; they are read from
+    the replica even right after a write, a few seconds behind at most.
+    """
+    import app.models.table_model as models
+    from app.models.alert_model import AlertRule
+    from app.models.latest_model import LatestConfigPointer
+    from app.models.registry_model import RegistryGeneration
+    from app.models.sketch_model import DriftFeatureSketch
+    from app.models.usage_summary_model import UsageSummary
+    from app.models.version_model import VERSIONED_FQN_COLUMNS
+
+    tracked = [models.ProjectEntity, models.TaskEntity, *VERSIONED_FQN_COLUMNS, LatestConfigPointer,
+               RegistryGeneration, DriftFeatureSketch, UsageSummary, AlertRule]
+    return frozenset(model.__table__.name for model in tracked)
+
+
+class WriteClock:
+    """
+    When this process last committed a write on the primary that its reads depend on
+    """
+    def __init__(self):
+        self.last_write = float("-inf")
+        self._lock = threading.Lock()
+
+    def wrote(self) -> None:
+        with self._lock:
+            self.last_write = time.monotonic()
+
+    def recent(self, seconds: float) -> bool:
+        return time.monotonic() - self.last_write < seconds
+
+
+write_clock = WriteClock()
+
+
+def _note_write(session, table_names) -> None:
+    if not session.info.get("runml_wrote") and not read_after_write_tables().isdisjoint(table_names):
+        session.info["runml_wrote"] = True
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _flushed(session, flush_context):
+    _note_write(session, {instance.__table__.name for instance in (*session.new, *session.dirty, *session.deleted)})
+
+
+@event.listens_for(SessionLocal, "do_orm_execute")
+def _executed(orm_execute_state):
+    #Core inserts and bulk updates or deletes run through the session without a flush
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = getattr(orm_execute_state.statement, "table", None)
+        _note_write(orm_execute_state.session, {getattr(table, "name", None)})
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _committed(session):
+    if session.info.pop("runml_wrote", False):
+        write_clock.wrote()
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _rolled_back(session):
+    session.info.pop("runml_wrote", None)
+
+
+@event.listens_for(ReadSessionLocal, "before_flush")
+def _read_only(session, flush_context, instances):
+    if session.new or session.dirty or session.deleted:
+        raise RuntimeError("This route is served by the read replica and cannot write")
+
+
+def has_replica() -> bool:
+    return read_engine is not engine
+
+
+def get_db():
+    """
+    It yields a session on the primary and closes it after the request
+    """
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def get_read_db():
+    """
+    It yields a session for a read-only route: on the replica, or on the primary when there is no
+    replica or when this process committed a config, project or task write (see
+    read_after_write_tables) less than RUNML_REPLICA_MAX_LAG seconds ago
+    """
+    if has_replica() and not write_clock.recent(REPLICA_MAX_LAG):
+        db = ReadSessionLocal()
+    else:
+        db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def _pool_stats(pool_engine: Engine) -> Dict[str, Any]:
+    pool = pool_engine.pool
+    stats = {"url": pool_engine.url.render_as_string(hide_password=True), "pool": type(pool).__name__,
+             "status": pool.status()}
+    for name in ("size", "checkedin", "checkedout", "overflow"):
+        if hasattr(pool, name):
+            stats[name] = getattr(pool, name)()
+    return stats
+
+
+def pool_stats() -> Dict[str, Any]:
+    """
+    It returns the pool occupancy of the primary and replica engines and the pool settings
+    """
+    return {
+        "primary": _pool_stats(engine),
+        "replica": _pool_stats(read_engine) if has_replica() else None,
+        "replica_max_lag": REPLICA_MAX_LAG,
+        "reads_on_primary": not has_replica() or write_clock.recent(REPLICA_MAX_LAG),
+        "settings": {"pool_size": POOL_SIZE, "max_overflow": MAX_OVERFLOW, "pool_timeout": POOL_TIMEOUT,
+                     "pool_recycle": POOL_RECYCLE, "pool_pre_ping": POOL_PRE_PING},
+    }
@@ -0,0 +1,100 @@
+import hashlib
+import os
+import time
+from typing import Any, Dict
+
+from sqlalchemy import MetaData, inspect, select, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+from app.models.schema_model import SchemaFingerprint
+
+#"auto" applies the DDL only when the schema fingerprint changed, "always" applies it at every start,
+#"skip" never touches the schema (it is managed by a migration job)
+SCHEMA_SETUP = os.getenv("RUNML_SCHEMA_SETUP", "auto")
+#Key of the Postgres advisory lock taken while the schema is checked, so that only one worker applies it
+SCHEMA_LOCK_KEY = int(os.getenv("RUNML_SCHEMA_LOCK_KEY", "734212"))
+SCHEMA_NAME = "runml"
+
+
+def schema_fingerprint(metadata: MetaData, dialect) -> str:
+    """
+    It hashes the DDL of every table and index of `metadata` as compiled for `dialect`, so any change
+    to a model (a table, column, type, constraint or index) changes the fingerprint
+    """
+    statements = []
+    for table in sorted(metadata.tables.values(), key=lambda table: table.name):
+        statements.append(str(CreateTable(table).compile(dialect=dialect)).strip())
+        for index in sorted(table.indexes, key=lambda index: index.name or ""):
+            statements.append(str(CreateIndex(index).compile(dialect=dialect)).strip())
+    return hashlib.sha256("\n".join(statements).encode()).hexdigest()
+
+
+def _stored_fingerprint(conn: Connection):
+    if not inspect(conn).has_table(SchemaFingerprint.__tablename__):
+        return None
+    fingerprints = SchemaFingerprint.__table__
+    return conn.execute(select(fingerprints.c.fingerprint).where(fingerprints.c.name == SCHEMA_NAME)).scalar()
+
+
+def apply_schema(conn: Connection, metadata: MetaData) -> Dict[str, Any]:
+    """
+    It creates the missing tables, and on the tables that already exist the missing indexes and the
+    missing nullable columns. Other changes to existing tables (types, constraints) need a migration.
+    
+    :return: A dictionary with the tables, columns and indexes created
+    """
+    existing_tables = set(inspect(conn).get_table_names())
+    metadata.create_all(bind=conn)
+    inspector = inspect(conn)
+    preparer = conn.dialect.identifier_preparer
+    created = {"tables": sorted(set(metadata.tables) - existing_tables), "columns": [], "indexes": []}
+    for table in metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        columns = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in columns and column.nullable and column.server_default is None:
+                conn.execute(text(f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN "
+                                  f"{preparer.format_column(column)} {column.type.compile(dialect=conn.dialect)}"))
+                created["columns"].append(f"{table.name}.{column.name}")
+        indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in indexes:
+                index.create(bind=conn)
+                created["indexes"].append(index.name)
+    return created
+
+
+def ensure_schema(engine: Engine, metadata: MetaData) -> Dict[str, Any]:
+    """
+    It brings the database schema up to date with the models at startup. The fingerprint of the
+    models is compared with the one stored by the last start: when they match, which is every start
+    but the first one after a deployment, no DDL is issued and the check costs one query.
+    
+    :param engine: The engine of the database the app serves
+    :type engine: Engine
+    :param metadata: The metadata holding every model (models.Base.metadata)
+    :type metadata: MetaData
+    :return: A dictionary with the action taken, the fingerprint and the time spent
+    """
+    start = time.perf_counter()
+    if SCHEMA_SETUP == "skip":
+        return {"action": "skipped", "seconds": 0.0}
+
+    fingerprint = schema_fingerprint(metadata, engine.dialect)
+    report = {"fingerprint": fingerprint}
+    with engine.begin() as conn:
+        if conn.dialect.name == "postgresql":
+            #Workers starting together wait here, then find the fingerprint stored by the first one
+            conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": SCHEMA_LOCK_KEY})
+        if SCHEMA_SETUP != "always" and _stored_fingerprint(conn) == fingerprint:
+            report["action"] = "unchanged"
+        else:
+            report["action"] = "applied"
+            report["created"] = apply_schema(conn, metadata)
+            fingerprints = SchemaFingerprint.__table__
+            conn.execute(fingerprints.delete().where(fingerprints.c.name == SCHEMA_NAME))
+            conn.execute(fingerprints.insert().values(name=SCHEMA_NAME, fingerprint=fingerprint))
+    report["seconds"] = round(time.perf_counter() - start, 4)
+    return report
@@ -0,0 +1,64 @@
+from sqlalchemy import Column, DateTime, Float, Index, Integer, String, Text, func
+import app.models.table_model as models
+
+
+class AlertRule(models.Base):
+    """
+    A rule evaluated on every profiling or drift result of the series it matches
+    """
+    __tablename__ = "alert_rules"
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, nullable=False)
+    #"profiling" or "drift"
+    source = Column(String, nullable=False)
+    #The dbservice_fqn / driftservice_fqn and the feature (feature_name, or column_name of the profiling
+    #results) of the series checked, "*" for any
+    fqn = Column(String, nullable=False, default="*")
+    feature = Column(String, nullable=False, default="*")
+    #The results field checked, e.g. drift_score
+    metric = Column(String, nullable=False)
+    #"threshold", "rate_of_change" or "consecutive_breach"
+    kind = Column(String, nullable=False)
+    #">", ">=", "<" or "<="
+    operator = Column(String, nullable=False, default=">")
+    threshold = Column(Float, nullable=False)
+    #Breaching results in a row before the alert fires
+    consecutive = Column(Integer, nullable=False, default=1)
+    #Seconds after an alert is resolved during which the series cannot fire again
+    cooldown_seconds = Column(Float, nullable=False, default=0)
+    severity = Column(String, nullable=False, default="warning")
+    #Name of the sink delivering the alerts of the rule, every configured sink when None
+    sink = Column(String)
+    enabled = Column(Integer, nullable=False, default=1)
+    created_at = Column(DateTime, server_default=func.now())
+
+
+class AlertEvent(models.Base):
+    """
+    An alert fired or resolved by a rule for one series
+    """
+    __tablename__ = "alert_events"
+    __table_args__ = (
+        Index("ix_alert_events_rule_id", "rule_id", "id"),
+        Index("ix_alert_events_fqn_id", "fqn", "id"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    rule_id = Column(Integer, nullable=False)
+    rule_name = Column(String)
+    source = Column(String, nullable=False)
+    fqn = Column(String)
+    feature = Column(String)
+    metric = Column(String, nullable=False)
+    #"Firing" or "Resolved"
+    state = Column(String, nullable=False)
+    severity = Column(String)
+    value = Column(Float)
+    #The value compared with the threshold: the result itself, or its relative change
+    observed = Column(Float)
+    message = Column(Text)
+    #Comma separated sinks the alert was delivered to, and the error of the ones that failed
+    delivered_to = Column(String)
+    delivery_error = Column(Text)
+    created_at = Column(DateTime, server_default=func.now())
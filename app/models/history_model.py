@@ -0,0 +1,16 @@
+from sqlalchemy import Index, inspect
+import app.models.table_model as models
+
+#The results tables read by the history endpoints, newest first
+HISTORY_RESULT_MODELS = (
+    models.MetadataIngestionEntity,
+    models.UsageIngestionEntity,
+    models.ProfilingEntity,
+    models.DriftService_Dump,
+)
+
+#Keyset pages walk (created_at, id) backwards, so index the results tables in that order
+for _model in HISTORY_RESULT_MODELS:
+    _table = _model.__table__
+    if "created_at" in _table.c:
+        Index(f"ix_{_table.name}_created_at_id", _table.c.created_at, inspect(_model).primary_key[0])
@@ -0,0 +1,22 @@
+from sqlalchemy import Column, Index, Integer, String
+import app.models.table_model as models
+from app.models.version_model import VERSIONED_FQN_COLUMNS
+
+
+class LatestConfigPointer(models.Base):
+    """
+    One row per (versioned table, fqn) pointing at the primary key of the latest saved version,
+    with the content hash of that version
+    """
+    __tablename__ = "latest_config_pointers"
+
+    table_name = Column(String, primary_key=True)
+    fqn = Column(String, primary_key=True)
+    row_id = Column(Integer, nullable=False)
+    content_hash = Column(String(64))
+
+
+#The choose_Row lookups filter on the fqn and read the newest row, so index them in that order
+for _model, _fqn_column in VERSIONED_FQN_COLUMNS.items():
+    _table = _model.__table__
+    Index(f"ix_{_table.name}_fqn_created_at", _table.c[_fqn_column.key], _table.c.created_at.desc())
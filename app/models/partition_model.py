@@ -0,0 +1,26 @@
+from sqlalchemy import Column, DateTime, Index, Integer, String, func
+import app.models.table_model as models
+
+
+class ResultPartition(models.Base):
+    """
+    One time range of a results table: a native partition on Postgres, a range of created_at rows
+    of the single table elsewhere. Kept after the range is dropped or compacted by the retention.
+    """
+    __tablename__ = "result_partitions"
+    __table_args__ = (
+        Index("ix_result_partitions_table_start", "table_name", "range_start"),
+    )
+
+    #The partition table name, e.g. profiling_results_p20260101
+    name = Column(String(128), primary_key=True)
+    table_name = Column(String, nullable=False)
+    #created_at of the rows of the range: range_start <= created_at < range_end
+    range_start = Column(DateTime, nullable=False)
+    range_end = Column(DateTime, nullable=False)
+    #"Active", "Compacted" or "Dropped"
+    state = Column(String, nullable=False, default="Active")
+    #Rows removed by the retention
+    rows_removed = Column(Integer)
+    created_at = Column(DateTime, server_default=func.now())
+    retired_at = Column(DateTime)
@@ -0,0 +1,35 @@
+from sqlalchemy import Column, DateTime, Index, Integer, String, Text, func
+import app.models.table_model as models
+
+
+class PurgeJob(models.Base):
+    """
+    A cascading purge of a project or of a (project, task) and every row depending on it. The step
+    reached and the rows deleted so far are committed with each deleted chunk, so an interrupted
+    purge carries on from where it stopped.
+    """
+    __tablename__ = "purge_jobs"
+    __table_args__ = (
+        Index("ix_purge_jobs_status_heartbeat", "status", "heartbeat_at"),
+    )
+
+    job_id = Column(String(32), primary_key=True)
+    project_name = Column(String, nullable=False)
+    #None when the whole project is purged
+    task_name = Column(String)
+    #"Queued", "Running", "Succeeded", "Failed" or "Cancelled"
+    status = Column(String, nullable=False, default="Queued")
+    cancel_requested = Column(Integer, nullable=False, default=0)
+    #Index of the step being run in the purge plan
+    step = Column(Integer, nullable=False, default=0)
+    #JSON list of the dbservice/driftservice fqns of the purged configs, collected by the first step
+    fqns = Column(Text)
+    #JSON object of the rows deleted so far per step
+    deleted = Column(Text, nullable=False, default="{}")
+    error = Column(Text)
+    #The worker running the purge, which keeps its lease by moving heartbeat_at forward
+    owner = Column(String)
+    heartbeat_at = Column(DateTime)
+    created_at = Column(DateTime, server_default=func.now())
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
@@ -0,0 +1,13 @@
+from sqlalchemy import Column, Integer
+import app.models.table_model as models
+
+
+class RegistryGeneration(models.Base):
+    """
+    A single row counting the deletions of projects and tasks, bumped in the transaction of every
+    deletion, so that each worker can tell its in-memory registry is out of date
+    """
+    __tablename__ = "registry_generation"
+
+    id = Column(Integer, primary_key=True)
+    generation = Column(Integer, nullable=False, default=0)
@@ -0,0 +1,35 @@
+from sqlalchemy import Column, DateTime, Float, Index, Integer, String, UniqueConstraint
+import app.models.table_model as models
+
+
+class ResultRollup(models.Base):
+    """
+    The aggregate of one numeric field of the profiling or drift results of one series (service,
+    table, column, feature) over one hour or one day
+    """
+    __tablename__ = "result_rollups"
+    __table_args__ = (
+        UniqueConstraint("source", "resolution", "metric", "fqn", "table_name", "column_name", "feature_name",
+                         "bucket_start", name="uq_result_rollups_bucket"),
+        Index("ix_result_rollups_fqn_bucket", "source", "resolution", "fqn", "bucket_start"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    #"profiling" or "drift"
+    source = Column(String, nullable=False)
+    #"hour" or "day"
+    resolution = Column(String, nullable=False)
+    bucket_start = Column(DateTime, nullable=False)
+    #The series dimensions, "" when the results do not carry one
+    fqn = Column(String, nullable=False, default="")
+    table_name = Column(String, nullable=False, default="")
+    column_name = Column(String, nullable=False, default="")
+    feature_name = Column(String, nullable=False, default="")
+    #The results field aggregated (e.g. drift_score)
+    metric = Column(String, nullable=False)
+    count = Column(Integer, nullable=False)
+    total = Column(Float, nullable=False)
+    min_value = Column(Float, nullable=False)
+    max_value = Column(Float, nullable=False)
+    last_value = Column(Float, nullable=False)
+    last_at = Column(DateTime, nullable=False)
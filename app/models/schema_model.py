@@ -0,0 +1,14 @@
+from sqlalchemy import Column, DateTime, String, func
+import app.models.table_model as models
+
+
+class SchemaFingerprint(models.Base):
+    """
+    The fingerprint of the schema last applied to the database, compared at startup to skip the DDL
+    when the models did not change
+    """
+    __tablename__ = "schema_fingerprints"
+
+    name = Column(String, primary_key=True)
+    fingerprint = Column(String(64), nullable=False)
+    applied_at = Column(DateTime, server_default=func.now())
@@ -0,0 +1,26 @@
+from sqlalchemy import Column, DateTime, Integer, String, Text, UniqueConstraint, func
+import app.models.table_model as models
+
+
+class DriftFeatureSketch(models.Base):
+    """
+    The mergeable summary of one feature of a drift service over one time window: a fixed-bin
+    histogram (also used for quantiles) for numerical features, or a category frequency table
+    """
+    __tablename__ = "drift_feature_sketches"
+    __table_args__ = (
+        UniqueConstraint("driftservice_fqn", "role", "feature_name", "window_start",
+                         name="uq_drift_feature_sketches_window"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    driftservice_fqn = Column(String, nullable=False, index=True)
+    #"reference" or "current"
+    role = Column(String, nullable=False)
+    feature_name = Column(String, nullable=False)
+    #"numerical" or "categorical"
+    feature_type = Column(String, nullable=False)
+    window_start = Column(DateTime, nullable=False)
+    row_count = Column(Integer, nullable=False, default=0)
+    sketch = Column(Text, nullable=False)
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
@@ -0,0 +1,29 @@
+from sqlalchemy import Column, DateTime, Float, Index, Integer, String, Text, func
+import app.models.table_model as models
+
+
+class UsageSummary(models.Base):
+    """
+    The compact summary of one staging file of the Snowflake usage workflow: query counts per table
+    and per user, join frequencies and top queries, linked to the UsageIngestionEntity row of the run
+    """
+    __tablename__ = "usage_summaries"
+    __table_args__ = (
+        Index("ix_usage_summaries_result_id", "usage_result_id", "id"),
+        Index("ix_usage_summaries_fqn_id", "dbservice_fqn", "id"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    #Primary key of the UsageIngestionEntity row of the run, None when no result was recorded
+    usage_result_id = Column(Integer)
+    dbservice_fqn = Column(String)
+    source_path = Column(String, nullable=False)
+    #Size and modification time of the staging file, a file that did not change is not aggregated again
+    source_bytes = Column(Integer, nullable=False)
+    source_mtime = Column(Float, nullable=False)
+    records = Column(Integer, nullable=False)
+    queries = Column(Integer, nullable=False)
+    #JSON text of the summary, sent as it is by the summary endpoint
+    summary = Column(Text, nullable=False)
+    seconds = Column(Float)
+    created_at = Column(DateTime, server_default=func.now())
@@ -0,0 +1,37 @@
+from sqlalchemy import Column, Integer, String, UniqueConstraint
+import app.models.table_model as models
+
+
+class VersionCounter(models.Base):
+    """
+    One row per (versioned table, fqn) holding the last version handed out for that fqn
+    """
+    __tablename__ = "version_counters"
+
+    table_name = Column(String, primary_key=True)
+    fqn = Column(String, primary_key=True)
+    last_version = Column(Integer, nullable=False, default=0)
+
+
+#The versioned user-details tables and the column holding the fqn their versions are counted by
+VERSIONED_FQN_COLUMNS = {
+    models.UserDetailsIngestion: models.UserDetailsIngestion.dbservice_fqn,
+    models.UserDetailsUsageIngestion: models.UserDetailsUsageIngestion.dbservice_fqn,
+    models.UserDetailsProfiling: models.UserDetailsProfiling.dbservice_fqn,
+    models.DriftServiceDetails: models.DriftServiceDetails.driftservice_fqn,
+}
+
+#The column holding the JSON text of the saved details
+CONFIG_BLOB_COLUMNS = {
+    models.UserDetailsIngestion: models.UserDetailsIngestion.user_details,
+    models.UserDetailsUsageIngestion: models.UserDetailsUsageIngestion.user_details,
+    models.UserDetailsProfiling: models.UserDetailsProfiling.user_details,
+    models.DriftServiceDetails: models.DriftServiceDetails.input_details,
+}
+
+#A version can only be handed out once per fqn
+for _model, _fqn_column in VERSIONED_FQN_COLUMNS.items():
+    _table = _model.__table__
+    _table.append_constraint(
+        UniqueConstraint(_table.c[_fqn_column.key], _table.c.version, name=f"uq_{_table.name}_fqn_version")
+    )
@@ -0,0 +1,246 @@
+from typing import List
+
+from fastapi import APIRouter, Body, Depends
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import app.models.table_model as models
+from app.databases.async_database import get_async_db
+from app.schemas.schemas import DriftDumpRow, MetadataIngestRow, ProfilingResultsRow, UsageResultsRow
+from app.services.batch_ingest import BATCH_CHUNK_SIZE, bulk_insert
+from app.models.version_model import CONFIG_BLOB_COLUMNS
+from app.schemas.response_schemas import BatchResponse, DriftServiceConfig, ServiceConfig, documented, either
+from app.services.config_store import latest_config
+from app.services.json_responses import FastJSONResponse, raw_json_document
+from app.services.alerts import alert_engine
+from app.services.rollups import record_rollups, stamp_created_at
+
+#The hot read and result ingestion routes, served by async handlers on the async engine.
+#They mirror the sync routes under the /async prefix so both can be measured against the same database.
+router = APIRouter(prefix="/async")
+
+
+async def _choose_latest(db: AsyncSession, model, fqn: str, missing_message: str):
+    #The cache, pointer and indexed lookups are shared with the sync routes through run_sync
+    latest_row = await db.run_sync(latest_config, model, fqn)
+    if(latest_row is not None):
+        return raw_json_document(latest_row, CONFIG_BLOB_COLUMNS[model].key)
+    return {"Message": missing_message}
+
+
+async def _add_result(db: AsyncSession, model, details):
+    details_dict = details.dict()
+    stamp_created_at(model, [details_dict])
+    db.add(model(**details_dict))
+    await db.run_sync(record_rollups, model, [details_dict])
+    await db.commit()
+    alert_engine.observe(model, [details_dict])
+    return {"Message": "Added Successfully"}
+
+
+async def _add_results(db: AsyncSession, model, schema, rows: List[dict], chunk_size: int):
+    try:
+        summary = await db.run_sync(bulk_insert, model, schema, rows, chunk_size)
+        return FastJSONResponse({"Message": "Batch processed", **summary})
+    except Exception as e:
+        await db.rollback()
+        return {"Error": f"{e}", "Message": "Batch addition failed"}
+
+
+@router.post("/ingest/metadata/choose_Row",tags=["Async"],responses=documented(either(ServiceConfig)))
+async def ingest_metadata(dbservice_fqn:str,db: AsyncSession = Depends(get_async_db)):
+    """
+    Async variant of /ingest/metadata/choose_Row
+    
+    :param dbservice_fqn: The fully qualified name of the database service
+    :type dbservice_fqn: str
+    :param db: AsyncSession = Depends(get_async_db)
+    :type db: AsyncSession
+    :return: The latest row, or a dictionary with a message when there is none
+    """
+    try:
+        return await _choose_latest(db,models.UserDetailsIngestion,dbservice_fqn,"No databaseService exists by the given name.")
+    except Exception as e:
+        return {"Error": f"{e}","Message": "Metadata Ingestion not possible."}
+
+
+@router.post("/ingest/usage/choose_Row",tags=["Async"],responses=documented(either(ServiceConfig)))
+async def ingest_usage(dbservice_fqn:str,db: AsyncSession = Depends(get_async_db)):
+    """
+    Async variant of /ingest/usage/choose_Row
+    
+    :param dbservice_fqn: The fully qualified name of the database service
+    :type dbservice_fqn: str
+    :param db: AsyncSession = Depends(get_async_db)
+    :type db: AsyncSession
+    :return: The latest row, or a dictionary with a message when there is none
+    """
+    try:
+        return await _choose_latest(db,models.UserDetailsUsageIngestion,dbservice_fqn,"No databaseService exists by the given name.")
+    except Exception as e:
+        return {"Error": f"{e}","Message": "Usage Ingestion not possible."}
+
+
+@router.post("/profiler/choose_Row",tags=["Async"],responses=documented(either(ServiceConfig)))
+async def profiler_latest(dbservice_fqn:str,db: AsyncSession = Depends(get_async_db)):
+    """
+    Async variant of /profiler/choose_Row
+    
+    :param dbservice_fqn: The fully qualified name of the database service
+    :type dbservice_fqn: str
+    :param db: AsyncSession = Depends(get_async_db)
+    :type db: AsyncSession
+    :return: The latest row, or a dictionary with a message when there is none
+    """
+    try:
+        return await _choose_latest(db,models.UserDetailsProfiling,dbservice_fqn,"No databaseService exists by the given name.")
+    except Exception as e:
+        return {"Error": f"{e}","Message": "Metadata Ingestion not possible."}
+
+
+@router.post("/drift/choose_Row",tags=["Async"],responses=documented(either(DriftServiceConfig)))
+async def choose_latest_row(driftservice_fqn:str,db: AsyncSession = Depends(get_async_db)):
+    """
+    Async variant of /drift/choose_Row
+    
+    :param driftservice_fqn: The fully qualified name of the drift service
+    :type driftservice_fqn: str
+    :param db: AsyncSession = Depends(get_async_db)
+    :type db: AsyncSession
+    :return: The latest row, or a dictionary with a message when there is none
+    """
+    try:
+        return await _choose_latest(db,models.DriftServiceDetails,driftservice_fqn,"No Service exists by the given name.")
+    except Exception as e:
+        return {"Error": f"{e}","Message": "Fetching latest row failed."}
+
+
+@router.post("/ingest/ingest_result",tags=["Async"],responses=documented(either()))
+async def ingest_results(details:MetadataIngestRow,db: AsyncSession = Depends(get_async_db)):
+    """
+    Async variant of /ingest/ingest_result
+    
+    :param details: MetadataIngestRow - the result of an ingestion run
+    :type details: MetadataIngestRow
+    :param db: AsyncSession = Depends(get_async_db)
+    :type db: AsyncSession
+    :return: A dictionary with a message
+    """
+    try:
+        return await _add_result(db,models.MetadataIngestionEntity,details)
+    except Exception as e:
+        return {"Error": f"{e}","Message": "Addition Failed"}
+
+
+@router.post("/ingest/usage_result",tags=["Async"],responses=documented(either()))
+async def usage_results(details:UsageResultsRow,db: AsyncSession = Depends(get_async_db)):
+    """
+    Async variant of /ingest/usage_result
+    
+    :param details: UsageResultsRow - the result of a usage run
+    :type details: UsageResultsRow
+    :param db: AsyncSession = Depends(get_async_db)
+    :type db: AsyncSession
+    :return: A dictionary with a message
+    """
+    try:
+        return await _add_result(db,models.UsageIngestionEntity,details)
+    except Exception as e:
+        return {"Error": f"{e}","Message": "Addition Failed"}
+
+
+@router.post("/profiler/profiling_result",tags=["Async"],responses=documented(either()))
+async def profiling_results(details:ProfilingResultsRow,db: AsyncSession = Depends(get_async_db)):
+    """
+    Async variant of /profiler/profiling_result
+    
+    :param details: ProfilingResultsRow - the result of a profiler run
+    :type details: ProfilingResultsRow
+    :param db: AsyncSession = Depends(get_async_db)
+    :type db: AsyncSession
+    :return: A dictionary with a message
+    """
+    try:
+        return await _add_result(db,models.ProfilingEntity,details)
+    except Exception as e:
+        return {"Error": f"{e}","Message": "Addition Failed"}
+
+
+@router.post("/drift/output_details",tags=["Async"],responses=documented(either()))
+async def drift_dumps(details:DriftDumpRow,db: AsyncSession = Depends(get_async_db)):
+    """
+    Async variant of /drift/output_details
+    
+    :param details: DriftDumpRow - the output of a drift run
+    :type details: DriftDumpRow
+    :param db: AsyncSession = Depends(get_async_db)
+    :type db: AsyncSession
+    :return: A dictionary with a message
+    """
+    try:
+        return await _add_result(db,models.DriftService_Dump,details)
+    except Exception as e:
+        return {"Error": f"{e}","Message": "Output not saved"}
+
+
+@router.post("/ingest/ingest_result/batch",tags=["Async"],responses=documented(either(BatchResponse)))
+async def ingest_results_batch(rows:List[dict] = Body(...),chunk_size:int = BATCH_CHUNK_SIZE,db: AsyncSession = Depends(get_async_db)):
+    """
+    Async variant of /ingest/ingest_result/batch
+    
+    :param rows: The list of ingestion results, each one shaped like a MetadataIngestRow
+    :type rows: List[dict]
+    :param chunk_size: Number of rows written by a single insert statement
+    :type chunk_size: int
+    :param db: AsyncSession = Depends(get_async_db)
+    :type db: AsyncSession
+    :return: A dictionary with the inserted and failed counts and a success or error entry per item
+    """
+    return await _add_results(db,models.MetadataIngestionEntity,MetadataIngestRow,rows,chunk_size)
+
+
+@router.post("/ingest/usage_result/batch",tags=["Async"],responses=documented(either(BatchResponse)))
+async def usage_results_batch(rows:List[dict] = Body(...),chunk_size:int = BATCH_CHUNK_SIZE,db: AsyncSession = Depends(get_async_db)):
+    """
+    Async variant of /ingest/usage_result/batch
+    
+    :param rows: The list of usage results, each one shaped like a UsageResultsRow
+    :type rows: List[dict]
+    :param chunk_size: Number of rows written by a single insert statement
+    :type chunk_size: int
+    :param db: AsyncSession = Depends(get_async_db)
+    :type db: AsyncSession
+    :return: A dictionary with the inserted and failed counts and a success or error entry per item
+    """
+    return await _add_results(db,models.UsageIngestionEntity,UsageResultsRow,rows,chunk_size)
+
+
+@router.post("/profiler/profiling_result/batch",tags=["Async"],responses=documented(either(BatchResponse)))
+async def profiling_results_batch(rows:List[dict] = Body(...),chunk_size:int = BATCH_CHUNK_SIZE,db: AsyncSession = Depends(get_async_db)):
+    """
+    Async variant of /profiler/profiling_result/batch
+    
+    :param rows: The list of profiling results, each one shaped like a ProfilingResultsRow
+    :type rows: List[dict]
+    :param chunk_size: Number of rows written by a single insert statement
+    :type chunk_size: int
+    :param db: AsyncSession = Depends(get_async_db)
+    :type db: AsyncSession
+    :return: A dictionary with the inserted and failed counts and a success or error entry per item
+    """
+    return await _add_results(db,models.ProfilingEntity,ProfilingResultsRow,rows,chunk_size)
+
+
+@router.post("/drift/output_details/batch",tags=["Async"],responses=documented(either(BatchResponse)))
+async def drift_dumps_batch(rows:List[dict] = Body(...),chunk_size:int = BATCH_CHUNK_SIZE,db: AsyncSession = Depends(get_async_db)):
+    """
+    Async variant of /drift/output_details/batch
+    
+    :param rows: The list of drift outputs, each one shaped like a DriftDumpRow
+    :type rows: List[dict]
+    :param chunk_size: Number of rows written by a single insert statement
+    :type chunk_size: int
+    :param db: AsyncSession = Depends(get_async_db)
+    :type db: AsyncSession
+    :return: A dictionary with the inserted and failed counts and a success or error entry per item
+    """
+    return await _add_results(db,models.DriftService_Dump,DriftDumpRow,rows,chunk_size)
@@ -0,0 +1,30 @@
+from typing import Optional
+
+from pydantic import BaseModel
+
+
+class AlertRuleCreate(BaseModel):
+    """
+    Input of /alerts/rules: a rule checked on every profiling or drift result of the series it matches
+    """
+    name: str
+    #"profiling" or "drift"
+    source: str
+    #The results field checked, e.g. drift_score or value
+    metric: str
+    #"threshold" compares the result with the threshold, "rate_of_change" its change relative to the
+    #previous result of the series (0.5 for +50%), "consecutive_breach" is a threshold that has to be
+    #breached `consecutive` times in a row (3 by default)
+    kind: str = "threshold"
+    #The dbservice_fqn / driftservice_fqn and the feature (feature_name, or column_name of the profiling
+    #results) of the series checked, "*" for any
+    fqn: str = "*"
+    feature: str = "*"
+    operator: str = ">"
+    threshold: float
+    consecutive: Optional[int] = None
+    #Seconds after an alert is resolved during which the series cannot fire again
+    cooldown_seconds: float = 0
+    severity: str = "warning"
+    #"log", "file" or "webhook", every sink of RUNML_ALERT_SINKS when not set
+    sink: Optional[str] = None
@@ -0,0 +1,59 @@
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from pydantic import BaseModel
+
+
+class DriftComputeRequest(BaseModel):
+    """
+    Input of /drift/compute: the two local datasets to compare and how to compare them
+    """
+    driftservice_fqn: Optional[str] = None
+    reference_path: str
+    current_path: str
+    #With both lists left empty the features are inferred from the reference file
+    numerical_features: Optional[List[str]] = None
+    categorical_features: Optional[List[str]] = None
+    metrics: List[str] = ["psi", "ks", "jensen_shannon", "chi_square"]
+    bins: int = 10
+    ks_bins: int = 100
+    chunk_rows: int = 50000
+    thresholds: Dict[str, float] = {}
+    #Write one DriftService_Dump row per (feature, metric)
+    save_results: bool = False
+    #Values shared by every saved row, and renaming of the result keys to DriftDumpRow fields
+    dump_template: Dict[str, Any] = {}
+    field_map: Dict[str, str] = {}
+
+
+class DriftSketchUpdate(BaseModel):
+    """
+    Input of /drift/sketch/update: new data to fold into the sketches of one time window
+    """
+    driftservice_fqn: str
+    #"reference" or "current"
+    role: str = "current"
+    path: str
+    #With both lists left empty the features are inferred from the file
+    numerical_features: Optional[List[str]] = None
+    categorical_features: Optional[List[str]] = None
+    #Any moment of the window the data belongs to, now when not given
+    window_start: Optional[datetime] = None
+    chunk_rows: int = 50000
+
+
+class DriftSketchCompute(BaseModel):
+    """
+    Input of /drift/sketch/compute: the windows to merge on each side and how to compare them
+    """
+    driftservice_fqn: str
+    reference_start: Optional[datetime] = None
+    reference_end: Optional[datetime] = None
+    current_start: Optional[datetime] = None
+    current_end: Optional[datetime] = None
+    metrics: List[str] = ["psi", "ks", "jensen_shannon", "chi_square"]
+    bins: int = 10
+    thresholds: Dict[str, float] = {}
+    save_results: bool = False
+    dump_template: Dict[str, Any] = {}
+    field_map: Dict[str, str] = {}
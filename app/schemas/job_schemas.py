@@ -0,0 +1,28 @@
+from typing import Any, Dict, Optional
+
+from pydantic import BaseModel
+
+
+class WorkflowJobSubmit(BaseModel):
+    """
+    Input of /jobs/submit: a generated workflow YAML to run
+    """
+    #"metadata", "usage" or "profiler"
+    workflow_type: str
+    config_path: str
+    #Database service the workflow runs against, read from the YAML (source.serviceName) when not given
+    service_fqn: Optional[str] = None
+    #Row recorded in the result table of the workflow type once the job ends, with {job_id}, {service_fqn},
+    #{status}, {exit_code}, {duration} and {config_path} placeholders filled in. Without it a row
+    #with the service and the status of the job is recorded.
+    result_details: Optional[Dict[str, Any]] = None
+
+
+class WorkflowConfigRequest(BaseModel):
+    """
+    One config of /workflow_configs/batch
+    """
+    #"metadata", "usage" or "profiler"
+    workflow_type: str
+    #The body of the create_yaml endpoint of the workflow type, file_name included
+    details: Dict[str, Any]
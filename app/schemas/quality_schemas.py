@@ -0,0 +1,42 @@
+from typing import Any, Dict, List, Optional
+
+from pydantic import BaseModel
+
+from app.schemas.schemas import SnowflakeProfilerYaml
+
+
+class LocalTableTests(BaseModel):
+    """
+    The tests of one table, shaped like a test of the test_suite of the profiler YAML, and its local extract
+    """
+    table: str
+    #A .csv or .parquet file
+    path: str
+    #[{"testCase": {"tableTestType": "tableRowCountToEqual", "config": {"value": 100}}}]
+    table_tests: List[Dict[str, Any]] = []
+    #[{"columnName": "age", "testCase": {"columnTestType": "columnValuesToBeBetween", "config": {"minValue": 0, "maxValue": 120}}}]
+    column_tests: List[Dict[str, Any]] = []
+
+
+class LocalQualityTestRun(BaseModel):
+    """
+    Input of /profiler/local_tests: the test definitions and the local extracts they run against
+    """
+    #A profiler YAML written by /profiler/snowflake/create_yaml
+    config_path: Optional[str] = None
+    #Or the fields of the create_yaml request, rendered the same way
+    profiler: Optional[SnowflakeProfilerYaml] = None
+    #Local file of every table of the YAML, keyed by its full name or by its last name component
+    paths: Dict[str, str] = {}
+    #Tables tested on top of the ones of the YAML
+    tables: List[LocalTableTests] = []
+    #dbservice_fqn of the saved rows, the serviceName of the YAML when not given
+    dbservice_fqn: Optional[str] = None
+    #Worker processes, RUNML_QUALITY_WORKERS when not given
+    workers: Optional[int] = None
+    chunk_rows: int = 50000
+    #Write one ProfilingEntity row per test
+    save_results: bool = False
+    #Values shared by every saved row, and renaming of the result keys to ProfilingResultsRow fields
+    result_template: Dict[str, Any] = {}
+    field_map: Dict[str, str] = {}
@@ -0,0 +1,287 @@
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Union
+
+from pydantic import BaseModel, Field
+
+
+class ResponseModel(BaseModel):
+    #A body only matches the model declaring all of its keys, so the success and error
+    #shapes of a route can be told apart in a Union
+    class Config:
+        extra = "forbid"
+        allow_population_by_field_name = True
+
+
+class MessageResponse(ResponseModel):
+    Message: str
+
+
+class ErrorResponse(ResponseModel):
+    Error: str
+    Message: Optional[str] = None
+
+
+class ProjectCreated(ResponseModel):
+    Message: str
+    project_details: Dict[str, Any] = Field(..., alias="Project Details")
+
+
+class TaskCreated(ResponseModel):
+    Message: str
+    task_details: Dict[str, Any] = Field(..., alias="Task Details")
+    project_details: Dict[str, Any] = Field(..., alias="Project Details")
+
+
+class RowAdded(ResponseModel):
+    Message: str
+    Details: Dict[str, Any]
+
+
+class ConfigSaved(ResponseModel):
+    Message: str
+    dbservice_fqn: str
+    version: str
+    Deduplicated: bool
+
+
+class DriftConfigSaved(ResponseModel):
+    Message: str
+    driftservice_fqn: str
+    version: str
+    Deduplicated: bool
+
+
+class ServiceConfig(BaseModel):
+    """
+    The latest saved version of an ingestion, usage or profiler config; user_details is the saved
+    JSON document, sent as it is stored
+    """
+    id: Optional[int] = None
+    project_name: str
+    task_name: str
+    user_details: Any
+    dbservice_fqn: str
+    version: Optional[str] = None
+    created_at: Optional[datetime] = None
+
+
+class DriftServiceConfig(BaseModel):
+    """
+    The latest saved version of a drift service config; input_details is the saved JSON document,
+    sent as it is stored
+    """
+    id: Optional[int] = None
+    project_name: str
+    task_name: str
+    input_details: Any
+    driftservice_fqn: str
+    version: Optional[str] = None
+    created_at: Optional[datetime] = None
+
+
+class YamlCreated(ResponseModel):
+    Message: str
+    Path: Dict[str, str]
+    Job: Optional[Dict[str, Any]] = None
+
+
+class BatchItemResult(ResponseModel):
+    index: int
+    status: str
+    error: Optional[str] = None
+
+
+class BatchResponse(ResponseModel):
+    Message: str
+    Inserted: int
+    Failed: int
+    Results: List[BatchItemResult]
+
+
+class YamlBatchItemResult(ResponseModel):
+    index: int
+    status: str
+    path: Optional[str] = None
+    error: Optional[str] = None
+    job: Optional[Dict[str, Any]] = None
+
+
+class YamlBatchResponse(ResponseModel):
+    Message: str
+    Created: int
+    Failed: int
+    Results: List[YamlBatchItemResult]
+
+
+class StreamProgressResponse(ResponseModel):
+    Message: str
+    upload_id: str
+    status: str
+    lines: int
+    inserted: int
+    failed: int
+    started_at: float
+    finished_at: Optional[float] = None
+    errors: Optional[List[Dict[str, Any]]] = None
+
+
+class UsageSummaryResponse(ResponseModel):
+    Message: str
+    id: int
+    usage_result_id: Optional[int] = None
+    dbservice_fqn: Optional[str] = None
+    source_path: str
+    source_bytes: int
+    source_mtime: float
+    records: int
+    queries: int
+    summary: Dict[str, Any]
+    seconds: Optional[float] = None
+    created_at: Optional[datetime] = None
+
+
+class DriftComputed(ResponseModel):
+    Message: str
+    Results: List[Dict[str, Any]]
+    Saved: Optional[Dict[str, Any]] = None
+
+
+class QualityTestsRun(ResponseModel):
+    Message: str
+    Passed: int
+    Failed: int
+    Aborted: int
+    Results: List[Dict[str, Any]]
+    Saved: Optional[Dict[str, Any]] = None
+
+
+class SketchesUpdated(ResponseModel):
+    Message: str
+    window_start: datetime
+    rows_added: Dict[str, int]
+
+
+class SketchSummary(ResponseModel):
+    Message: str
+    Features: Dict[str, Dict[str, Any]]
+
+
+class HistoryPage(ResponseModel):
+    Message: str
+    Items: List[Dict[str, Any]]
+    next_cursor: Optional[str] = None
+    has_more: bool
+
+
+class RollupPoint(ResponseModel):
+    bucket_start: datetime
+    count: int
+    min: float
+    max: float
+    mean: Optional[float] = None
+    last: float
+
+
+class RollupSeries(ResponseModel):
+    metric: str
+    fqn: str
+    table_name: str
+    column_name: str
+    feature_name: str
+    points: List[RollupPoint]
+
+
+class RollupsResponse(ResponseModel):
+    Message: str
+    resolution: str
+    Series: List[RollupSeries]
+    truncated: bool
+
+
+class RollupsRebuilt(ResponseModel):
+    Message: str
+    Rows: int
+    bucket_updates: int = Field(..., alias="Bucket updates")
+    #The rollups before it were kept, None when every rollup was rebuilt
+    Since: Optional[datetime] = None
+
+
+class JobResponse(ResponseModel):
+    Message: str
+    Job: Dict[str, Any]
+
+
+class JobList(ResponseModel):
+    Message: str
+    Jobs: List[Dict[str, Any]]
+
+
+class JobLogs(ResponseModel):
+    Message: str
+    Logs: List[str]
+
+
+class CacheStats(ResponseModel):
+    Message: str
+    Stats: Dict[str, Any]
+
+
+class WriteBehindStats(ResponseModel):
+    Message: str
+    Stats: Dict[str, Any]
+
+
+class AlertRuleResponse(ResponseModel):
+    Message: str
+    Rule: Dict[str, Any]
+
+
+class AlertRuleList(ResponseModel):
+    Message: str
+    Rules: List[Dict[str, Any]]
+
+
+class AlertList(ResponseModel):
+    Message: str
+    Alerts: List[Dict[str, Any]]
+
+
+class AlertStats(ResponseModel):
+    Message: str
+    Stats: Dict[str, Any]
+
+
+class StartupReportResponse(ResponseModel):
+    Message: str
+    Report: Dict[str, Any]
+
+
+class PoolStats(ResponseModel):
+    Message: str
+    Stats: Dict[str, Any]
+
+
+class PartitionStatus(ResponseModel):
+    Message: str
+    Status: Dict[str, Any]
+
+
+class PartitionReport(ResponseModel):
+    Message: str
+    Report: Dict[str, Any]
+
+
+def either(*models):
+    """
+    It returns the documented response of a route answering with one of `models` or an error
+    """
+    return Union[(*models, MessageResponse, ErrorResponse)]
+
+
+def documented(model) -> Dict[int, Dict[str, Any]]:
+    """
+    It returns the `responses` of a route answering with `model`. The model is only shown in the
+    OpenAPI docs: unlike a response_model, the bodies are not validated against it and encoded
+    again on every request.
+    """
+    return {200: {"model": model}}
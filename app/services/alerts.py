@@ -0,0 +1,417 @@
+import json
+import logging
+import math
+import operator
+import os
+import queue
+import threading
+import time
+import urllib.request
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import inspect
+from sqlalchemy.orm import Session
+
+from app.models.alert_model import AlertEvent, AlertRule
+from app.services.rollups import MODEL_SOURCES, ROLLUP_SOURCES, numeric_columns, source_layout
+
+#Sinks every alert is delivered to, comma separated: "log", "file", "webhook" or a sink added with register_sink
+ALERT_SINKS = [name.strip() for name in os.getenv("RUNML_ALERT_SINKS", "log").split(",") if name.strip()]
+#JSON lines file the "file" sink appends the alerts to
+ALERT_FILE = os.getenv("RUNML_ALERT_FILE", "/tmp/runml_alerts.jsonl")
+#URL the "webhook" sink posts every alert to as JSON
+ALERT_WEBHOOK_URL = os.getenv("RUNML_ALERT_WEBHOOK_URL")
+ALERT_WEBHOOK_TIMEOUT = float(os.getenv("RUNML_ALERT_WEBHOOK_TIMEOUT", "5"))
+#Alerts waiting for delivery, the oldest are dropped when more are fired
+ALERT_QUEUE_SIZE = int(os.getenv("RUNML_ALERT_QUEUE_SIZE", "10000"))
+#Seconds between two reloads of the rules, so that the rules changed through another worker apply here too
+ALERT_RULES_REFRESH_SECONDS = float(os.getenv("RUNML_ALERT_RULES_REFRESH_SECONDS", "30"))
+#Series whose state is kept in memory, the ones not firing are forgotten beyond it
+ALERT_MAX_SERIES = int(os.getenv("RUNML_ALERT_MAX_SERIES", "100000"))
+
+RULE_KINDS = ("threshold", "rate_of_change", "consecutive_breach")
+OPERATORS = {">": operator.gt, ">=": operator.ge, "<": operator.lt, "<=": operator.le}
+#Breaching results in a row before a consecutive_breach rule fires, when the rule does not set it
+DEFAULT_CONSECUTIVE_BREACHES = 3
+#The results columns read as the feature of a series, the first one a table has is used
+FEATURE_COLUMNS = ("feature_name", "column_name")
+
+alert_log = logging.getLogger("runml.alerts")
+
+
+class AlertSink:
+    """
+    Where the alerts are delivered. A sink is called from the delivery thread, one alert at a time.
+    """
+    def deliver(self, alert: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+
+class LogSink(AlertSink):
+    def deliver(self, alert: Dict[str, Any]) -> None:
+        alert_log.warning("[%s] %s", alert["state"], alert["message"])
+
+
+class FileSink(AlertSink):
+    def __init__(self, path: str = ALERT_FILE):
+        self.path = path
+
+    def deliver(self, alert: Dict[str, Any]) -> None:
+        with open(self.path, "a") as f:
+            f.write(json.dumps(alert, default=str) + "\n")
+
+
+class WebhookSink(AlertSink):
+    def __init__(self, url: Optional[str] = ALERT_WEBHOOK_URL, timeout: float = ALERT_WEBHOOK_TIMEOUT):
+        if not url:
+            raise ValueError("The webhook sink needs RUNML_ALERT_WEBHOOK_URL")
+        self.url = url
+        self.timeout = timeout
+
+    def deliver(self, alert: Dict[str, Any]) -> None:
+        request = urllib.request.Request(self.url, data=json.dumps(alert, default=str).encode(),
+                                         headers={"Content-Type": "application/json"}, method="POST")
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+
+#The sinks RUNML_ALERT_SINKS and the sink of a rule can name
+SINK_FACTORIES: Dict[str, Callable[[], AlertSink]] = {"log": LogSink, "file": FileSink, "webhook": WebhookSink}
+
+
+def register_sink(name: str, factory: Callable[[], AlertSink]) -> None:
+    SINK_FACTORIES[name] = factory
+
+
+class CompiledRule:
+    """
+    The values of an AlertRule read once, so that evaluating it does not touch the ORM
+    """
+    __slots__ = ("id", "name", "source", "fqn", "feature", "metric", "kind", "operator", "compare", "threshold",
+                 "consecutive", "cooldown_seconds", "severity", "sink")
+
+    def __init__(self, rule: AlertRule):
+        for name in ("id", "name", "source", "fqn", "feature", "metric", "kind", "operator", "threshold",
+                     "cooldown_seconds", "severity", "sink"):
+            setattr(self, name, getattr(rule, name))
+        self.compare = OPERATORS[rule.operator]
+        self.consecutive = max(1, rule.consecutive or 1)
+
+
+class SeriesState:
+    __slots__ = ("last_value", "breaches", "firing", "resolved_at")
+
+    def __init__(self):
+        self.last_value: Optional[float] = None
+        self.breaches = 0
+        self.firing = False
+        self.resolved_at = float("-inf")
+
+
+def validate_rule(fields: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    It checks the fields of a new rule and fills in the defaults of its kind
+    
+    :raises ValueError: for an unknown source, kind, operator or sink, or a metric that is not a
+    numeric field of the results
+    """
+    fields = dict(fields)
+    if fields["source"] not in ROLLUP_SOURCES:
+        raise ValueError(f"Source must be one of {list(ROLLUP_SOURCES)}")
+    model = ROLLUP_SOURCES[fields["source"]]
+    if fields["metric"] not in model.__table__.c:
+        raise ValueError(f"The {fields['source']} results have no field '{fields['metric']}'")
+    if fields["metric"] not in numeric_columns(model):
+        raise ValueError(f"The {fields['source']} results field '{fields['metric']}' is not numeric, "
+                         f"expected one of {numeric_columns(model)}")
+    if fields["kind"] not in RULE_KINDS:
+        raise ValueError(f"Rule kind must be one of {list(RULE_KINDS)}")
+    if fields["operator"] not in OPERATORS:
+        raise ValueError(f"Operator must be one of {list(OPERATORS)}")
+    if fields.get("sink") is not None and fields["sink"] not in SINK_FACTORIES:
+        raise ValueError(f"Sink must be one of {list(SINK_FACTORIES)}")
+    if fields.get("consecutive") is None:
+        fields["consecutive"] = DEFAULT_CONSECUTIVE_BREACHES if fields["kind"] == "consecutive_breach" else 1
+    if fields["consecutive"] < 1:
+        raise ValueError("consecutive must be at least 1")
+    return fields
+
+
+def rule_dict(rule: AlertRule) -> Dict[str, Any]:
+    return {column.key: getattr(rule, column.key) for column in inspect(AlertRule).columns}
+
+
+def alert_event_dict(event: AlertEvent) -> Dict[str, Any]:
+    return {column.key: getattr(event, column.key) for column in inspect(AlertEvent).columns}
+
+
+class AlertEngine:
+    """
+    It evaluates the alert rules on the profiling and drift results as they are saved. The rules are
+    indexed by (source, fqn, feature), so a result only checks the rules of its own series, its
+    fqn, its feature and the catch-all ones. The state of every series (last value, breaches in a
+    row, firing) is kept in memory by each worker. An alert is sent when a series starts breaching
+    and when it recovers, never for the breaches in between, and a recovered series does not fire
+    again within the cooldown of its rule. The alerts are stored and delivered to the sinks by a
+    background thread, so the results endpoints only pay for the in-memory evaluation.
+    """
+
+    def __init__(self, sink_names: Iterable[str] = ALERT_SINKS, queue_size: int = ALERT_QUEUE_SIZE,
+                 refresh_seconds: float = ALERT_RULES_REFRESH_SECONDS, max_series: int = ALERT_MAX_SERIES):
+        self.sink_names = list(sink_names)
+        self.refresh_seconds = refresh_seconds
+        self.max_series = max_series
+        self.session_factory: Optional[Callable[[], Session]] = None
+        self._sinks: Dict[str, AlertSink] = {}
+        self._index: Dict[Tuple[str, str, str], List[CompiledRule]] = {}
+        self._rule_count = 0
+        self._states: Dict[Tuple[int, str, str], SeriesState] = {}
+        self._lock = threading.Lock()
+        self._outbox: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=max(1, queue_size))
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._counters = {"evaluated": 0, "fired": 0, "resolved": 0, "suppressed": 0, "delivered": 0,
+                          "delivery_errors": 0, "dropped": 0}
+
+    def start(self, session_factory: Callable[[], Session]) -> None:
+        """
+        It loads the rules and starts the delivery thread
+        """
+        self.session_factory = session_factory
+        for name in self.sink_names:
+            if name not in self._sinks:
+                try:
+                    self._sinks[name] = SINK_FACTORIES[name]()
+                except Exception:
+                    alert_log.exception("Alert sink %s not available", name)
+        with session_factory() as db:
+            self.reload(db)
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._deliver_loop, name="alert-delivery", daemon=True)
+            self._thread.start()
+
+    def shutdown(self, timeout: float = 5) -> None:
+        """
+        It delivers the alerts already fired and stops the delivery thread
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+
+    def reload(self, db: Session) -> None:
+        """
+        It rebuilds the rule index from the enabled rules and forgets the state of the rules removed
+        """
+        index: Dict[Tuple[str, str, str], List[CompiledRule]] = {}
+        rules = [CompiledRule(rule) for rule in db.query(AlertRule).filter(AlertRule.enabled == 1).all()]
+        for rule in rules:
+            index.setdefault((rule.source, rule.fqn, rule.feature), []).append(rule)
+        ids = {rule.id for rule in rules}
+        with self._lock:
+            self._index = index
+            self._rule_count = len(rules)
+            for key in [key for key in self._states if key[0] not in ids]:
+                del self._states[key]
+
+    def rules(self, db: Session) -> List[AlertRule]:
+        return db.query(AlertRule).order_by(AlertRule.id).all()
+
+    def add_rule(self, db: Session, fields: Dict[str, Any]) -> AlertRule:
+        rule = AlertRule(**validate_rule(fields))
+        db.add(rule)
+        db.commit()
+        db.refresh(rule)
+        self.reload(db)
+        return rule
+
+    def delete_rule(self, db: Session, rule_id: int) -> Optional[AlertRule]:
+        rule = db.get(AlertRule, rule_id)
+        if rule is None:
+            return None
+        db.delete(rule)
+        db.commit()
+        self.reload(db)
+        return rule
+
+    def observe(self, model, rows: Iterable[Dict[str, Any]], at: Optional[datetime] = None) -> int:
+        """
+        It evaluates the rules of their series on freshly saved results rows. Called once the rows are
+        committed, so it never raises: a failure is logged and the rows stay saved. Rows of tables
+        that are not alerted on, and values that are not numbers, are ignored.
+        
+        :param model: The ORM entity the rows were inserted into (e.g. models.DriftService_Dump)
+        :param rows: The column values of the saved rows
+        :type rows: Iterable[Dict[str, Any]]
+        :param at: When the rows were saved (now by default)
+        :type at: Optional[datetime]
+        :return: The number of alerts fired or resolved
+        """
+        try:
+            return self._observe(model, rows, at)
+        except Exception:
+            alert_log.exception("Alert rules not checked for saved rows of %s", getattr(model, "__tablename__", model))
+            return 0
+
+    def _observe(self, model, rows: Iterable[Dict[str, Any]], at: Optional[datetime]) -> int:
+        source = MODEL_SOURCES.get(model)
+        index = self._index
+        if source is None or not index:
+            return 0
+        fqn_column, feature_column = _series_columns(source)
+        at = at or datetime.utcnow()
+        alerts = []
+        with self._lock:
+            for row in rows:
+                fqn = str(row.get(fqn_column) or "") if fqn_column else ""
+                feature = str(row.get(feature_column) or "") if feature_column else ""
+                for key in ((source, fqn, feature), (source, fqn, "*"), (source, "*", feature), (source, "*", "*")):
+                    for rule in index.get(key, ()):
+                        try:
+                            value = float(row.get(rule.metric))
+                        except (TypeError, ValueError):
+                            continue
+                        if not math.isfinite(value):
+                            continue
+                        alert = self._evaluate(rule, fqn, feature, value, at)
+                        if alert is not None:
+                            alerts.append(alert)
+            if len(self._states) > self.max_series:
+                self._forget_quiet_series()
+        for alert in alerts:
+            self._send(alert)
+        return len(alerts)
+
+    def _evaluate(self, rule: CompiledRule, fqn: str, feature: str, value: float, at: datetime) -> Optional[Dict[str, Any]]:
+        self._counters["evaluated"] += 1
+        key = (rule.id, fqn, feature)
+        state = self._states.get(key)
+        if state is None:
+            state = self._states[key] = SeriesState()
+        previous, state.last_value = state.last_value, value
+        if rule.kind == "rate_of_change":
+            #The change relative to the previous result of the series, e.g. 0.5 for +50%
+            if previous is None or previous == 0:
+                return None
+            observed = (value - previous) / abs(previous)
+        else:
+            observed = value
+
+        if rule.compare(observed, rule.threshold):
+            state.breaches += 1
+            if state.firing:
+                self._counters["suppressed"] += 1
+                return None
+            if state.breaches < rule.consecutive or time.monotonic() - state.resolved_at < rule.cooldown_seconds:
+                return None
+            state.firing = True
+            self._counters["fired"] += 1
+            return self._alert(rule, fqn, feature, value, observed, "Firing", at)
+        state.breaches = 0
+        if not state.firing:
+            return None
+        state.firing = False
+        state.resolved_at = time.monotonic()
+        self._counters["resolved"] += 1
+        return self._alert(rule, fqn, feature, value, observed, "Resolved", at)
+
+    def _alert(self, rule: CompiledRule, fqn: str, feature: str, value: float, observed: float, state: str,
+               at: datetime) -> Dict[str, Any]:
+        measured = "change of " + rule.metric if rule.kind == "rate_of_change" else rule.metric
+        where = f"{fqn} {feature}".strip() or "any series"
+        if state == "Firing":
+            message = f"{rule.name}: {measured} of {where} is {observed:.6g} ({rule.operator} {rule.threshold:g})"
+        else:
+            message = f"{rule.name}: {measured} of {where} is back to {observed:.6g}"
+        return {"rule_id": rule.id, "rule_name": rule.name, "source": rule.source, "fqn": fqn, "feature": feature,
+                "metric": rule.metric, "kind": rule.kind, "operator": rule.operator, "threshold": rule.threshold,
+                "state": state, "severity": rule.severity, "value": value, "observed": observed,
+                "message": message, "sink": rule.sink, "at": at.isoformat()}
+
+    def _forget_quiet_series(self) -> None:
+        for key in [key for key, state in self._states.items() if not state.firing]:
+            del self._states[key]
+
+    def _send(self, alert: Dict[str, Any]) -> None:
+        while True:
+            try:
+                self._outbox.put_nowait(alert)
+                return
+            except queue.Full:
+                try:
+                    self._outbox.get_nowait()
+                    self._counters["dropped"] += 1
+                except queue.Empty:
+                    pass
+
+    def _deliver_loop(self) -> None:
+        refreshed = time.monotonic()
+        while not (self._stop.is_set() and self._outbox.empty()):
+            try:
+                alert = self._outbox.get(timeout=0.5)
+            except queue.Empty:
+                alert = None
+            if alert is not None:
+                self._deliver(alert)
+            if self.refresh_seconds > 0 and time.monotonic() - refreshed >= self.refresh_seconds:
+                refreshed = time.monotonic()
+                try:
+                    with self.session_factory() as db:
+                        self.reload(db)
+                except Exception:
+                    alert_log.exception("Alert rules not reloaded")
+
+    def _deliver(self, alert: Dict[str, Any]) -> None:
+        names = [alert["sink"]] if alert["sink"] else list(self._sinks)
+        delivered, errors = [], []
+        for name in names:
+            try:
+                sink = self._sinks.get(name)
+                if sink is None:
+                    sink = self._sinks[name] = SINK_FACTORIES[name]()
+                sink.deliver(alert)
+                delivered.append(name)
+            except Exception as e:
+                errors.append(f"{name}: {e}")
+        self._counters["delivered"] += len(delivered)
+        self._counters["delivery_errors"] += len(errors)
+        if errors:
+            alert_log.error("Alert %s not delivered to %s", alert["message"], "; ".join(errors))
+        try:
+            with self.session_factory() as db:
+                fields = {key: alert[key] for key in ("rule_id", "rule_name", "source", "fqn", "feature", "metric",
+                                                      "state", "severity", "value", "observed", "message")}
+                db.add(AlertEvent(**fields, delivered_to=",".join(delivered), delivery_error="; ".join(errors) or None))
+                db.commit()
+        except Exception:
+            alert_log.exception("Alert %s not stored", alert["message"])
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            series = len(self._states)
+            firing = sum(1 for state in self._states.values() if state.firing)
+        return {**self._counters, "rules": self._rule_count, "series": series, "firing": firing,
+                "pending": self._outbox.qsize(), "sinks": list(self._sinks)}
+
+    def events(self, db: Session, rule_id: Optional[int] = None, fqn: Optional[str] = None,
+               state: Optional[str] = None, limit: int = 100) -> List[AlertEvent]:
+        query = db.query(AlertEvent)
+        if rule_id is not None:
+            query = query.filter(AlertEvent.rule_id == rule_id)
+        if fqn is not None:
+            query = query.filter(AlertEvent.fqn == fqn)
+        if state is not None:
+            query = query.filter(AlertEvent.state == state)
+        return query.order_by(AlertEvent.id.desc()).limit(min(max(1, limit), 1000)).all()
+
+
+@lru_cache(maxsize=None)
+def _series_columns(source: str) -> Tuple[Optional[str], Optional[str]]:
+    dimensions, _ = source_layout(source)
+    columns = ROLLUP_SOURCES[source].__table__.c
+    return dimensions.get("fqn"), next((name for name in FEATURE_COLUMNS if name in columns), None)
+
+
+alert_engine = AlertEngine()
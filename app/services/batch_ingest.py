@@ -0,0 +1,77 @@
+import os
+from datetime import datetime
+from typing import Any, Dict, List, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy.orm import Session
+
+from app.services.alerts import alert_engine
+from app.services.rollups import record_rollups, stamp_created_at
+
+#Number of rows sent to the database in one executemany insert
+BATCH_CHUNK_SIZE = int(os.getenv("RUNML_BATCH_CHUNK_SIZE", "500"))
+
+
+def validate_rows(schema, rows: List[Any]) -> Tuple[List[Tuple[int, Dict[str, Any]]], Dict[int, Dict[str, Any]]]:
+    """
+    It validates every item of a batch against the request schema, one item at a time, so that a
+    single bad item does not reject the whole batch
+    
+    :param schema: The pydantic model used by the single row endpoint (e.g. MetadataIngestRow)
+    :param rows: The raw items sent by the client
+    :type rows: List[Any]
+    :return: A tuple of the valid (index, row dict) pairs and a dict of per-index results
+    """
+    valid = []
+    results = {}
+    for index, item in enumerate(rows):
+        try:
+            valid.append((index, schema.parse_obj(item).dict()))
+        except ValidationError as e:
+            results[index] = {"index": index, "status": "Error", "error": str(e)}
+    return valid, results
+
+
+def bulk_insert(db: Session, model, schema, rows: List[Any], chunk_size: int = BATCH_CHUNK_SIZE) -> Dict[str, Any]:
+    """
+    It validates a batch of rows and inserts the valid ones into the table of `model` with one
+    executemany insert per chunk. All the chunks are written under a single transaction; every chunk
+    runs inside a savepoint so that a failing chunk only marks its own items as failed. The rows
+    inserted into rolled up results tables are added to their hourly and daily rollups together
+    right before the commit, and checked against the alert rules once committed.
+    
+    :param db: Session = Depends(get_db)
+    :type db: Session
+    :param model: The ORM entity the rows belong to (e.g. models.MetadataIngestionEntity)
+    :param schema: The pydantic model each item is validated against
+    :param rows: The raw items sent by the client
+    :type rows: List[Any]
+    :param chunk_size: Number of rows per insert statement
+    :type chunk_size: int
+    :return: A dictionary with the inserted and failed counts and the per-item results
+    """
+    chunk_size = max(1, chunk_size)
+    valid, results = validate_rows(schema, rows)
+    table = model.__table__
+    received_at = datetime.utcnow()
+    stamp_created_at(model, [row for _, row in valid], received_at)
+
+    for start in range(0, len(valid), chunk_size):
+        chunk = valid[start:start + chunk_size]
+        try:
+            with db.begin_nested():
+                db.execute(table.insert(), [row for _, row in chunk])
+            for index, _ in chunk:
+                results[index] = {"index": index, "status": "Success"}
+        except Exception as e:
+            for index, _ in chunk:
+                results[index] = {"index": index, "status": "Error", "error": f"{e}"}
+    inserted_rows = [row for index, row in valid if results[index]["status"] == "Success"]
+    #Last, so that the buckets shared with concurrent writers are only locked until the commit below
+    record_rollups(db, model, inserted_rows, received_at)
+    db.commit()
+    alert_engine.observe(model, inserted_rows, received_at)
+
+    ordered = [results[index] for index in sorted(results)]
+    inserted = sum(1 for item in ordered if item["status"] == "Success")
+    return {"Inserted": inserted, "Failed": len(ordered) - inserted, "Results": ordered}
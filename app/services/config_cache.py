@@ -0,0 +1,106 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+#Upper bound on the number of (table, fqn) entries kept in memory
+CACHE_MAX_ENTRIES = int(os.getenv("RUNML_CONFIG_CACHE_SIZE", "1024"))
+#Seconds an entry is served before it is read again from the database. A save made through this
+#worker invalidates its entry at once; one made through another worker is seen once the entry
+#expires, or sooner with RUNML_CONFIG_CACHE_VALIDATE_SECONDS.
+CACHE_TTL_SECONDS = float(os.getenv("RUNML_CONFIG_CACHE_TTL", "30"))
+#With the latest pointers on, an entry older than this many seconds is checked against the pointer of
+#its fqn (one primary key read) before being served, at most once per interval; 0 never checks, so
+#that polling a cached config never touches the database
+CACHE_VALIDATE_SECONDS = float(os.getenv("RUNML_CONFIG_CACHE_VALIDATE_SECONDS", "0"))
+
+#Marker stored for fqns that have no saved config, so that polling them does not hit the database either
+MISSING = object()
+
+
+class LatestConfigCache:
+    """
+    A bounded LRU cache with a time-to-live, keyed by (table name, fqn), holding the column values of
+    the latest saved config. It is safe to share between the threads serving requests.
+    """
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, ttl: float = CACHE_TTL_SECONDS):
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        #Entries found out of date by their validation, e.g. after a save made through another worker
+        self.stale = 0
+        #Bumped on every invalidation, so that a value read from the database before a save
+        #committed is not stored after that save invalidated the entry
+        self.generation = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """
+        It returns the cached value of `key`, MISSING for a cached absence, or None on a cache miss
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: Hashable, value: Any, generation: Optional[int] = None) -> None:
+        """
+        It stores `value` under `key`. When `generation` is given (the value of self.generation read
+        before loading `value`) the value is dropped if an invalidation happened in between.
+        """
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self.generation += 1
+            self._entries.pop(key, None)
+
+    def discard_stale(self, key: Hashable) -> None:
+        """
+        It drops an entry found out of date, counted as a miss rather than a hit
+        """
+        with self._lock:
+            self.generation += 1
+            self._entries.pop(key, None)
+            self.hits -= 1
+            self.misses += 1
+            self.stale += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "stale": self.stale,
+            }
+
+
+#The cache shared by the choose_Row endpoints of this process
+latest_config_cache = LatestConfigCache()
@@ -0,0 +1,171 @@
+import hashlib
+import json
+import os
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy import and_, inspect
+from sqlalchemy.orm import Session
+
+from app.models.latest_model import LatestConfigPointer
+from app.models.version_model import CONFIG_BLOB_COLUMNS, VERSIONED_FQN_COLUMNS
+from app.services.config_cache import CACHE_VALIDATE_SECONDS, MISSING, latest_config_cache
+from app.services.versioning import next_version
+
+#Maintain and read the latest_config_pointers table ("0" falls back to the indexed lookup only)
+LATEST_POINTER_ENABLED = os.getenv("RUNML_LATEST_POINTER", "1") == "1"
+#Return the latest version instead of saving a new one when the details did not change ("0" to always save)
+DEDUPLICATE_CONFIGS = os.getenv("RUNML_DEDUPLICATE_CONFIGS", "1") == "1"
+
+
+def _primary_key(model):
+    return inspect(model).primary_key[0]
+
+
+def _snapshot(row) -> Dict[str, Any]:
+    """
+    It copies the column values of a row into a plain dict that can outlive its session
+    """
+    return {attr.key: getattr(row, attr.key) for attr in inspect(row).mapper.column_attrs}
+
+
+def content_hash(model, fields: Dict[str, Any]) -> str:
+    """
+    It hashes what a saved config is made of: its project, task, fqn and details. The details JSON is
+    canonicalized (sorted keys, no whitespace) so that the same details always hash the same.
+    
+    :param model: One of the versioned user-details entities (e.g. models.UserDetailsIngestion)
+    :param fields: The column values of a row, extra columns such as id or version are ignored
+    :type fields: Dict[str, Any]
+    :return: The SHA-256 hex digest
+    """
+    fqn_key, blob_key = VERSIONED_FQN_COLUMNS[model].key, CONFIG_BLOB_COLUMNS[model].key
+    content = {
+        "project_name": fields.get("project_name"),
+        "task_name": fields.get("task_name"),
+        "fqn": fields.get(fqn_key),
+        "details": json.loads(fields[blob_key]) if fields.get(blob_key) else None,
+    }
+    canonical = json.dumps(content, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def _unchanged_row(db: Session, model, fqn: str, digest: str):
+    """
+    It returns the latest row of `fqn` when its content hash is `digest`, otherwise None
+    """
+    if LATEST_POINTER_ENABLED:
+        pointer = db.get(LatestConfigPointer, (model.__tablename__, fqn))
+        if pointer is not None and pointer.content_hash is not None:
+            return db.get(model, pointer.row_id) if pointer.content_hash == digest else None
+    latest = latest_config(db, model, fqn)
+    if latest is not None and content_hash(model, latest) == digest:
+        return db.get(model, latest[_primary_key(model).key])
+    return None
+
+
+def save_config(db: Session, model, row_fields: Dict[str, Any]) -> Tuple[Any, bool]:
+    """
+    It saves a new version of a user-details config: the version is allocated from the counter
+    table, the row is inserted and the latest pointer of its fqn is moved to it, all in one
+    transaction. Once committed, the cached latest config of its fqn is invalidated. When the
+    details are identical to the latest version, nothing is written and that version is returned.
+    
+    :param db: Session = Depends(get_db)
+    :type db: Session
+    :param model: One of the versioned user-details entities (e.g. models.UserDetailsIngestion)
+    :param row_fields: The column values of the new row, without the version
+    :type row_fields: Dict[str, Any]
+    :return: A tuple (saved or unchanged latest row, whether a new version was created)
+    """
+    fqn = row_fields[VERSIONED_FQN_COLUMNS[model].key]
+    digest = content_hash(model, row_fields)
+    if DEDUPLICATE_CONFIGS:
+        unchanged = _unchanged_row(db, model, fqn, digest)
+        if unchanged is not None:
+            return unchanged, False
+
+    version = next_version(db, model, fqn)
+    if DEDUPLICATE_CONFIGS:
+        #The counter row is locked now, so a concurrent identical save has either committed
+        #already or is waiting behind us: check again before writing
+        unchanged = _unchanged_row(db, model, fqn, digest)
+        if unchanged is not None:
+            db.rollback()
+            return db.get(model, getattr(unchanged, _primary_key(model).key)), False
+
+    new_row = model(**row_fields, version=f"v{version}")
+    db.add(new_row)
+    if LATEST_POINTER_ENABLED:
+        #Writers of the same fqn are serialized by the version counter lock taken above,
+        #so the pointer can be merged without racing another save of this fqn
+        db.flush()
+        db.merge(LatestConfigPointer(table_name=model.__tablename__, fqn=fqn,
+                                     row_id=getattr(new_row, _primary_key(model).key), content_hash=digest))
+    db.commit()
+    db.refresh(new_row)
+    latest_config_cache.invalidate((model.__tablename__, fqn))
+    return new_row, True
+
+
+def latest_config(db: Session, model, fqn: str) -> Optional[Dict[str, Any]]:
+    """
+    It returns the latest saved version of `fqn`, from the in-process cache when possible, without
+    touching the database. With RUNML_CONFIG_CACHE_VALIDATE_SECONDS, an entry is checked against the
+    latest pointer of `fqn` at most once per interval, so a save made through another worker is seen
+    before the entry expires. On a cache miss, with the pointer table enabled this is a primary key fetch; otherwise, or for
+    histories saved before the pointers existed, it is a single `ORDER BY created_at DESC LIMIT 1`
+    served by the (fqn, created_at) index.
+    
+    :param db: Session = Depends(get_db)
+    :type db: Session
+    :param model: One of the versioned user-details entities (e.g. models.UserDetailsIngestion)
+    :param fqn: The dbservice_fqn / driftservice_fqn to look up
+    :type fqn: str
+    :return: The column values of the latest row, or None when nothing was saved for the fqn
+    """
+    key = (model.__tablename__, fqn)
+    cached = latest_config_cache.get(key)
+    if cached is not None:
+        value, pointed_row, checked_at = cached
+        if not _check_due(checked_at):
+            return None if value is MISSING else dict(value)
+        #The pointer moves with every save, whichever worker made it
+        if _pointed_row(db, model, fqn) == pointed_row:
+            cached[2] = time.monotonic()
+            return None if value is MISSING else dict(value)
+        latest_config_cache.discard_stale(key)
+    generation = latest_config_cache.generation
+
+    latest_row = pointed_row = None
+    if LATEST_POINTER_ENABLED:
+        pointer = and_(LatestConfigPointer.table_name == model.__tablename__,
+                       LatestConfigPointer.fqn == fqn,
+                       LatestConfigPointer.row_id == _primary_key(model))
+        latest_row = db.query(model).join(LatestConfigPointer, pointer).first()
+        if latest_row is not None:
+            pointed_row = getattr(latest_row, _primary_key(model).key)
+    if latest_row is None:
+        fqn_column = VERSIONED_FQN_COLUMNS[model]
+        latest_row = db.query(model).filter(fqn_column == fqn).order_by(model.created_at.desc()).first()
+
+    if latest_row is None:
+        latest_config_cache.put(key, [MISSING, None, time.monotonic()], generation)
+        return None
+    snapshot = _snapshot(latest_row)
+    latest_config_cache.put(key, [snapshot, pointed_row, time.monotonic()], generation)
+    return dict(snapshot)
+
+
+def _check_due(checked_at: float) -> bool:
+    return (LATEST_POINTER_ENABLED and CACHE_VALIDATE_SECONDS > 0
+            and time.monotonic() - checked_at >= CACHE_VALIDATE_SECONDS)
+
+
+def _pointed_row(db: Session, model, fqn: str) -> Optional[int]:
+    """
+    It returns the primary key of the row the latest pointer of `fqn` points at, None without a pointer
+    """
+    return (db.query(LatestConfigPointer.row_id)
+            .filter(LatestConfigPointer.table_name == model.__tablename__, LatestConfigPointer.fqn == fqn)
+            .scalar())
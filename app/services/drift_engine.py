@@ -0,0 +1,376 @@
+import math
+import os
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+from app.services.tabular_reader import (READ_CHUNK_ROWS, is_numeric, iter_column_chunks, read_columns,
+                                         to_numeric)
+
+SUPPORTED_METRICS = ("psi", "ks", "jensen_shannon", "chi_square")
+
+#Drift is flagged when the score goes above these values (below, for the chi-square p-value)
+DEFAULT_THRESHOLDS = {
+    "psi": float(os.getenv("RUNML_DRIFT_PSI_THRESHOLD", "0.2")),
+    "ks": float(os.getenv("RUNML_DRIFT_KS_THRESHOLD", "0.1")),
+    "jensen_shannon": float(os.getenv("RUNML_DRIFT_JS_THRESHOLD", "0.1")),
+    "chi_square": float(os.getenv("RUNML_DRIFT_CHI_SQUARE_PVALUE", "0.05")),
+}
+
+#Added to empty bins so that the log ratios stay finite
+EPSILON = 1e-6
+
+
+class NumericHistogram:
+    """
+    Counts of a numeric feature over fixed bins. The outer bins are open ended, so values outside
+    the reference range still land somewhere; missing values are counted apart.
+    """
+
+    def __init__(self, edges: np.ndarray, counts: Optional[np.ndarray] = None, missing: int = 0):
+        self.edges = np.asarray(edges, dtype=np.float64)
+        self.counts = np.zeros(len(self.edges) - 1, dtype=np.int64) if counts is None else np.asarray(counts, dtype=np.int64)
+        self.missing = int(missing)
+
+    @classmethod
+    def spanning(cls, low: float, high: float, bins: int) -> "NumericHistogram":
+        if not np.isfinite(low) or not np.isfinite(high):
+            low, high = 0.0, 1.0
+        if high <= low:
+            high = low + 1.0
+        return cls(np.linspace(low, high, max(1, bins) + 1))
+
+    def update(self, values: np.ndarray) -> None:
+        present = values[~np.isnan(values)]
+        self.missing += len(values) - len(present)
+        positions = np.searchsorted(self.edges[1:-1], present, side="right")
+        self.counts += np.bincount(positions, minlength=len(self.counts))
+
+    def merge(self, other: "NumericHistogram") -> None:
+        if not np.array_equal(self.edges, other.edges):
+            raise ValueError("Histograms with different bin edges cannot be merged")
+        self.counts += other.counts
+        self.missing += other.missing
+
+    @property
+    def total(self) -> int:
+        return int(self.counts.sum())
+
+    def coarsen(self, bins: int) -> "NumericHistogram":
+        """
+        It merges neighbouring bins into at most `bins` bins of (nearly) equal width
+        """
+        groups = np.array_split(np.arange(len(self.counts)), min(max(1, bins), len(self.counts)))
+        starts = [group[0] for group in groups]
+        edges = np.append(self.edges[starts], self.edges[-1])
+        return NumericHistogram(edges, np.add.reduceat(self.counts, starts), self.missing)
+
+    def quantiles(self, probabilities: Iterable[float]) -> List[Optional[float]]:
+        """
+        It estimates quantiles by linear interpolation inside the bins. The open ended outer bins
+        are treated as bounded by the outermost edges.
+        """
+        total = self.total
+        if not total:
+            return [None for _ in probabilities]
+        cumulative = np.concatenate(([0], np.cumsum(self.counts))) / total
+        return [float(np.interp(p, cumulative, self.edges)) for p in probabilities]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"edges": self.edges.tolist(), "counts": self.counts.tolist(), "missing": self.missing}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "NumericHistogram":
+        return cls(data["edges"], data["counts"], data.get("missing", 0))
+
+
+class CategoryCounts:
+    """
+    Frequency table of a categorical feature
+    """
+
+    def __init__(self, counts: Optional[Dict[str, int]] = None, missing: int = 0):
+        self.counts = Counter(counts or {})
+        self.missing = int(missing)
+
+    def update(self, values: np.ndarray) -> None:
+        present = values[(values != "") & ~np.equal(values, None)]
+        self.missing += len(values) - len(present)
+        categories, counts = np.unique(present.astype(str), return_counts=True)
+        self.counts.update(dict(zip(categories.tolist(), counts.tolist())))
+
+    def merge(self, other: "CategoryCounts") -> None:
+        self.counts.update(other.counts)
+        self.missing += other.missing
+
+    @property
+    def total(self) -> int:
+        return sum(self.counts.values())
+
+    def truncate(self, max_categories: int, other_label: str = "__other__") -> None:
+        """
+        It keeps the `max_categories` most frequent categories and folds the rest into `other_label`
+        """
+        if len(self.counts) <= max_categories:
+            return
+        kept = dict(self.counts.most_common(max(1, max_categories - 1)))
+        kept[other_label] = kept.get(other_label, 0) + self.total - sum(kept.values())
+        self.counts = Counter(kept)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"counts": dict(self.counts), "missing": self.missing}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "CategoryCounts":
+        return cls(data["counts"], data.get("missing", 0))
+
+
+def aligned_counts(reference: CategoryCounts, current: CategoryCounts):
+    """
+    It puts two frequency tables on the same list of categories
+    """
+    categories = sorted(set(reference.counts) | set(current.counts))
+    return (np.array([reference.counts.get(c, 0) for c in categories], dtype=np.float64),
+            np.array([current.counts.get(c, 0) for c in categories], dtype=np.float64))
+
+
+def _proportions(counts: np.ndarray) -> np.ndarray:
+    counts = np.asarray(counts, dtype=np.float64) + EPSILON
+    return counts / counts.sum()
+
+
+def psi(expected: np.ndarray, actual: np.ndarray) -> float:
+    """
+    Population stability index of `actual` against `expected`, both given as counts on the same bins
+    """
+    p, q = _proportions(expected), _proportions(actual)
+    return float(np.sum((q - p) * np.log(q / p)))
+
+
+def jensen_shannon(expected: np.ndarray, actual: np.ndarray) -> float:
+    """
+    Jensen-Shannon distance (base 2, between 0 and 1) of two count vectors on the same bins
+    """
+    p, q = _proportions(expected), _proportions(actual)
+    m = (p + q) / 2
+    divergence = 0.5 * np.sum(p * np.log2(p / m)) + 0.5 * np.sum(q * np.log2(q / m))
+    return float(math.sqrt(max(divergence, 0.0)))
+
+
+def ks(expected: np.ndarray, actual: np.ndarray) -> float:
+    """
+    Kolmogorov-Smirnov statistic of two count vectors on the same ordered bins. It is exact up to
+    the bin resolution.
+    """
+    expected = np.asarray(expected, dtype=np.float64)
+    actual = np.asarray(actual, dtype=np.float64)
+    if not expected.sum() or not actual.sum():
+        return 0.0
+    return float(np.max(np.abs(np.cumsum(expected) / expected.sum() - np.cumsum(actual) / actual.sum())))
+
+
+def chi_square(expected: np.ndarray, actual: np.ndarray):
+    """
+    Chi-square goodness of fit of the `actual` counts against the distribution of `expected`. The
+    expected counts are smoothed with EPSILON like the proportions of psi, and an empty `actual`
+    sample shows no drift (statistic 0, p-value 1), so the result is always finite.
+    
+    :return: A tuple (statistic, p-value)
+    """
+    actual = np.asarray(actual, dtype=np.float64)
+    total = actual.sum()
+    if not total > 0:
+        return 0.0, 1.0
+    predicted = np.maximum(_proportions(expected) * total, EPSILON)
+    statistic = float(np.sum((actual - predicted) ** 2 / predicted))
+    if not math.isfinite(statistic):
+        return float(np.finfo(np.float64).max), 0.0
+    return statistic, _chi2_sf(statistic, max(len(actual) - 1, 1))
+
+
+def _chi2_sf(x: float, dof: int) -> float:
+    """
+    Survival function of the chi-square distribution, i.e. the regularized upper incomplete gamma
+    Q(dof/2, x/2), by series expansion below a+1 and by continued fraction above
+    """
+    if x <= 0:
+        return 1.0
+    a, x = dof / 2.0, x / 2.0
+    log_prefix = a * math.log(x) - x - math.lgamma(a)
+    if x < a + 1:
+        term = total = 1.0 / a
+        n = a
+        for _ in range(500):
+            n += 1
+            term *= x / n
+            total += term
+            if abs(term) < abs(total) * 1e-12:
+                break
+        return max(0.0, 1.0 - total * math.exp(log_prefix))
+    b = x + 1 - a
+    c = 1.0 / 1e-300
+    d = 1.0 / b
+    h = d
+    for i in range(1, 500):
+        an = -i * (i - a)
+        b += 2
+        d = an * d + b
+        d = 1e-300 if abs(d) < 1e-300 else d
+        c = b + an / c
+        c = 1e-300 if abs(c) < 1e-300 else c
+        d = 1.0 / d
+        delta = d * c
+        h *= delta
+        if abs(delta - 1) < 1e-12:
+            break
+    return min(1.0, math.exp(log_prefix) * h)
+
+
+def score(metric: str, expected: np.ndarray, actual: np.ndarray, threshold: float) -> Dict[str, Any]:
+    """
+    It computes one drift metric on two count vectors and decides whether it shows drift
+    """
+    if metric == "chi_square":
+        statistic, p_value = chi_square(expected, actual)
+        return {"metric": metric, "score": statistic, "p_value": p_value,
+                "threshold": threshold, "drift_detected": p_value < threshold}
+    value = {"psi": psi, "ks": ks, "jensen_shannon": jensen_shannon}[metric](expected, actual)
+    return {"metric": metric, "score": value, "threshold": threshold, "drift_detected": value > threshold}
+
+
+def compare_numeric(feature: str, reference: Dict[str, NumericHistogram], current: Dict[str, NumericHistogram],
+                    metrics: Iterable[str], thresholds: Dict[str, float]) -> List[Dict[str, Any]]:
+    """
+    It scores a numeric feature. KS uses the fine histograms ("ks"), the other metrics the coarse
+    ones ("coarse").
+    """
+    results = []
+    for metric in metrics:
+        resolution = "ks" if metric == "ks" else "coarse"
+        expected, actual = reference[resolution], current[resolution]
+        result = score(metric, expected.counts, actual.counts, thresholds[metric])
+        results.append({"feature_name": feature, "feature_type": "numerical", **result,
+                        "reference_count": expected.total, "current_count": actual.total})
+    return results
+
+
+def compare_categorical(feature: str, reference: CategoryCounts, current: CategoryCounts,
+                        metrics: Iterable[str], thresholds: Dict[str, float]) -> List[Dict[str, Any]]:
+    """
+    It scores a categorical feature on the union of the categories seen on both sides. KS is skipped
+    as categories have no order.
+    """
+    expected, actual = aligned_counts(reference, current)
+    results = []
+    for metric in metrics:
+        if metric == "ks":
+            continue
+        result = score(metric, expected, actual, thresholds[metric])
+        results.append({"feature_name": feature, "feature_type": "categorical", **result,
+                        "reference_count": reference.total, "current_count": current.total})
+    return results
+
+
+def infer_features(path: str, chunk_rows: int = READ_CHUNK_ROWS):
+    """
+    It splits the columns of a file into numerical and categorical ones from its first chunk
+    
+    :return: A tuple (numerical feature names, categorical feature names)
+    """
+    first = next(iter_column_chunks(path, read_columns(path), chunk_rows), {})
+    numerical = [name for name, values in first.items() if is_numeric(values)]
+    return numerical, [name for name in first if name not in numerical]
+
+
+def build_histograms(path: str, numerical: List[str], categorical: List[str], bins: int, ks_bins: int,
+                     chunk_rows: int = READ_CHUNK_ROWS, edges_from: Optional[Dict[str, Dict[str, NumericHistogram]]] = None):
+    """
+    It summarizes a file one chunk and one column at a time. The numeric bins span the range of the
+    file itself unless `edges_from` gives the histograms whose bins must be reused, which is how a
+    current dataset is put on the bins of its reference.
+    
+    :return: A tuple ({feature: {"coarse": hist, "ks": hist}}, {feature: CategoryCounts})
+    """
+    columns = numerical + categorical
+    if edges_from is None:
+        low = {name: np.inf for name in numerical}
+        high = {name: -np.inf for name in numerical}
+        for chunk in iter_column_chunks(path, columns, chunk_rows):
+            for name in numerical:
+                values = to_numeric(chunk[name])
+                if np.isfinite(values).any():
+                    low[name] = min(low[name], float(np.nanmin(values)))
+                    high[name] = max(high[name], float(np.nanmax(values)))
+        histograms = {name: {"coarse": NumericHistogram.spanning(low[name], high[name], bins),
+                             "ks": NumericHistogram.spanning(low[name], high[name], ks_bins)} for name in numerical}
+    else:
+        histograms = {name: {resolution: NumericHistogram(hist.edges) for resolution, hist in edges_from[name].items()}
+                      for name in numerical}
+
+    frequencies = {name: CategoryCounts() for name in categorical}
+    for chunk in iter_column_chunks(path, columns, chunk_rows):
+        for name in numerical:
+            values = to_numeric(chunk[name])
+            for hist in histograms[name].values():
+                hist.update(values)
+        for name in categorical:
+            frequencies[name].update(chunk[name])
+    return histograms, frequencies
+
+
+def compute_drift(reference_path: str, current_path: str, numerical: Optional[List[str]] = None,
+                  categorical: Optional[List[str]] = None, metrics: Iterable[str] = SUPPORTED_METRICS,
+                  bins: int = 10, ks_bins: int = 100, chunk_rows: int = READ_CHUNK_ROWS,
+                  thresholds: Optional[Dict[str, float]] = None) -> List[Dict[str, Any]]:
+    """
+    It computes the drift of every feature between a reference and a current dataset read from local
+    CSV or Parquet files. Both files are streamed in chunks of `chunk_rows` rows, so memory only
+    depends on the chunk size, the number of bins and the number of categories.
+    
+    :param reference_path: Path of the reference (training) dataset
+    :type reference_path: str
+    :param current_path: Path of the current (production) dataset
+    :type current_path: str
+    :param numerical: Numerical features; with `categorical` also None they are inferred from the reference
+    :type numerical: Optional[List[str]]
+    :param categorical: Categorical features
+    :type categorical: Optional[List[str]]
+    :param metrics: Any of "psi", "ks", "jensen_shannon" and "chi_square"
+    :param bins: Number of bins used by PSI, Jensen-Shannon and chi-square on numerical features
+    :type bins: int
+    :param ks_bins: Number of bins used by KS on numerical features
+    :type ks_bins: int
+    :param chunk_rows: Rows read per chunk
+    :type chunk_rows: int
+    :param thresholds: Per metric overrides of DEFAULT_THRESHOLDS
+    :type thresholds: Optional[Dict[str, float]]
+    :return: One result per (feature, metric)
+    """
+    metrics = list(metrics)
+    unknown = [metric for metric in metrics if metric not in SUPPORTED_METRICS]
+    if unknown:
+        raise ValueError(f"Unsupported drift metrics: {unknown}")
+    thresholds = {**DEFAULT_THRESHOLDS, **(thresholds or {})}
+    if numerical is None and categorical is None:
+        numerical, categorical = infer_features(reference_path, chunk_rows)
+    numerical, categorical = list(numerical or []), list(categorical or [])
+
+    reference_hist, reference_freq = build_histograms(reference_path, numerical, categorical, bins, ks_bins, chunk_rows)
+    current_hist, current_freq = build_histograms(current_path, numerical, categorical, bins, ks_bins, chunk_rows,
+                                                  edges_from=reference_hist)
+
+    results = []
+    for name in numerical:
+        results.extend(compare_numeric(name, reference_hist[name], current_hist[name], metrics, thresholds))
+    for name in categorical:
+        results.extend(compare_categorical(name, reference_freq[name], current_freq[name], metrics, thresholds))
+    return results
+
+
+def to_dump_rows(results: List[Dict[str, Any]], template: Dict[str, Any], field_map: Dict[str, str]) -> List[Dict[str, Any]]:
+    """
+    It shapes drift results as DriftService_Dump rows: every result is laid over `template` after its
+    keys are renamed with `field_map` (result key -> DriftDumpRow field)
+    """
+    return [{**template, **{field_map.get(key, key): value for key, value in result.items()}} for result in results]
@@ -0,0 +1,195 @@
+import json
+import os
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app.models.sketch_model import DriftFeatureSketch
+from app.services import drift_engine
+from app.services.drift_engine import CategoryCounts, NumericHistogram
+from app.services.tabular_reader import READ_CHUNK_ROWS, iter_column_chunks, to_numeric
+
+#Length of the time windows the sketches are kept for ("hour" or "day")
+SKETCH_WINDOW = os.getenv("RUNML_SKETCH_WINDOW", "day")
+#Bins of the numerical histograms; the coarser PSI/JS/chi-square bins are merged from them
+SKETCH_RESOLUTION = int(os.getenv("RUNML_SKETCH_RESOLUTION", "100"))
+#Most frequent categories kept per feature and window, the rest is folded into "__other__"
+SKETCH_MAX_CATEGORIES = int(os.getenv("RUNML_SKETCH_MAX_CATEGORIES", "1000"))
+
+ROLES = ("reference", "current")
+
+
+def window_of(moment: Optional[datetime] = None, window: str = SKETCH_WINDOW) -> datetime:
+    """
+    It returns the start of the time window `moment` (now by default) falls in
+    """
+    moment = moment or datetime.utcnow()
+    if window == "hour":
+        return moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def load_sketch(row: DriftFeatureSketch):
+    data = json.loads(row.sketch)
+    if row.feature_type == "numerical":
+        return NumericHistogram.from_dict(data)
+    return CategoryCounts.from_dict(data)
+
+
+def _reference_edges(db: Session, driftservice_fqn: str, features: Iterable[str]) -> Dict[str, np.ndarray]:
+    """
+    It returns the bin edges already fixed for the numerical features of a drift service. All the
+    windows of a feature share these edges, which is what makes their histograms mergeable.
+    """
+    edges = {}
+    rows = (db.query(DriftFeatureSketch)
+            .filter(DriftFeatureSketch.driftservice_fqn == driftservice_fqn)
+            .filter(DriftFeatureSketch.role == "reference")
+            .filter(DriftFeatureSketch.feature_type == "numerical")
+            .filter(DriftFeatureSketch.feature_name.in_(list(features))))
+    for row in rows:
+        edges.setdefault(row.feature_name, np.asarray(json.loads(row.sketch)["edges"]))
+    return edges
+
+
+def update_sketches(db: Session, driftservice_fqn: str, role: str, path: str, numerical: List[str],
+                    categorical: List[str], window_start: Optional[datetime] = None,
+                    resolution: int = SKETCH_RESOLUTION, chunk_rows: int = READ_CHUNK_ROWS) -> Dict[str, Any]:
+    """
+    It folds the rows of a new local CSV or Parquet file into the persisted sketches of one time
+    window. Only the new file is read, so the cost does not depend on the history already summarized.
+    The first reference data of a numerical feature fixes its bins, over the range of that data.
+    
+    :param db: Session = Depends(get_db)
+    :type db: Session
+    :param driftservice_fqn: The drift service the data belongs to
+    :type driftservice_fqn: str
+    :param role: "reference" or "current"
+    :type role: str
+    :param path: Path of the new data
+    :type path: str
+    :param numerical: Numerical features to summarize
+    :param categorical: Categorical features to summarize
+    :param window_start: Any moment of the window the data belongs to, now by default
+    :type window_start: Optional[datetime]
+    :param resolution: Number of bins of a new numerical histogram
+    :param chunk_rows: Rows read per chunk
+    :return: A dictionary with the window and the number of rows added per feature
+    """
+    if role not in ROLES:
+        raise ValueError(f"Role must be one of {ROLES}")
+    window = window_of(window_start)
+    edges = _reference_edges(db, driftservice_fqn, numerical)
+    unfixed = [name for name in numerical if name not in edges]
+    if unfixed and role == "current":
+        raise ValueError(f"No reference sketch fixes the bins of {unfixed}, update the reference first")
+    if unfixed:
+        #Only the features seen for the first time cost an extra pass to find their range
+        low = {name: np.inf for name in unfixed}
+        high = {name: -np.inf for name in unfixed}
+        for chunk in iter_column_chunks(path, unfixed, chunk_rows):
+            for name in unfixed:
+                values = to_numeric(chunk[name])
+                if np.isfinite(values).any():
+                    low[name] = min(low[name], float(np.nanmin(values)))
+                    high[name] = max(high[name], float(np.nanmax(values)))
+        for name in unfixed:
+            edges[name] = NumericHistogram.spanning(low[name], high[name], resolution).edges
+
+    existing = {row.feature_name: row for row in (
+        db.query(DriftFeatureSketch)
+        .filter(DriftFeatureSketch.driftservice_fqn == driftservice_fqn)
+        .filter(DriftFeatureSketch.role == role)
+        .filter(DriftFeatureSketch.window_start == window)
+        .filter(DriftFeatureSketch.feature_name.in_(numerical + categorical))
+        .with_for_update())}
+    sketches = {}
+    for name in numerical:
+        sketches[name] = load_sketch(existing[name]) if name in existing else NumericHistogram(edges[name])
+    for name in categorical:
+        sketches[name] = load_sketch(existing[name]) if name in existing else CategoryCounts()
+    before = {name: sketch.total + sketch.missing for name, sketch in sketches.items()}
+
+    for chunk in iter_column_chunks(path, numerical + categorical, chunk_rows):
+        for name in numerical:
+            sketches[name].update(to_numeric(chunk[name]))
+        for name in categorical:
+            sketches[name].update(chunk[name])
+
+    for name, sketch in sketches.items():
+        feature_type = "numerical" if name in numerical else "categorical"
+        if feature_type == "categorical":
+            sketch.truncate(SKETCH_MAX_CATEGORIES)
+        row = existing.get(name)
+        if row is None:
+            row = DriftFeatureSketch(driftservice_fqn=driftservice_fqn, role=role, feature_name=name,
+                                     feature_type=feature_type, window_start=window)
+            db.add(row)
+        row.sketch = json.dumps(sketch.to_dict())
+        row.row_count = sketch.total + sketch.missing
+    db.commit()
+    return {"window_start": window,
+            "rows_added": {name: sketch.total + sketch.missing - before[name] for name, sketch in sketches.items()}}
+
+
+def merged_sketches(db: Session, driftservice_fqn: str, role: str, start: Optional[datetime] = None,
+                    end: Optional[datetime] = None) -> Dict[str, Any]:
+    """
+    It merges the sketches of every window of [start, end) into one sketch per feature. The cost
+    depends on the number of windows and bins, not on the number of rows they summarize.
+    
+    :return: A dictionary {feature name: NumericHistogram or CategoryCounts}
+    """
+    query = (db.query(DriftFeatureSketch)
+             .filter(DriftFeatureSketch.driftservice_fqn == driftservice_fqn)
+             .filter(DriftFeatureSketch.role == role))
+    if start is not None:
+        query = query.filter(DriftFeatureSketch.window_start >= window_of(start))
+    if end is not None:
+        query = query.filter(DriftFeatureSketch.window_start < end)
+    merged = {}
+    for row in query:
+        sketch = load_sketch(row)
+        if row.feature_name in merged:
+            merged[row.feature_name].merge(sketch)
+        else:
+            merged[row.feature_name] = sketch
+    return merged
+
+
+def drift_from_sketches(reference: Dict[str, Any], current: Dict[str, Any], metrics: Iterable[str],
+                        bins: int = 10, thresholds: Optional[Dict[str, float]] = None) -> List[Dict[str, Any]]:
+    """
+    It computes the drift of every feature present on both sides, from merged sketches only
+    
+    :return: One result per (feature, metric), shaped like the results of drift_engine.compute_drift
+    """
+    metrics = list(metrics)
+    unknown = [metric for metric in metrics if metric not in drift_engine.SUPPORTED_METRICS]
+    if unknown:
+        raise ValueError(f"Unsupported drift metrics: {unknown}")
+    thresholds = {**drift_engine.DEFAULT_THRESHOLDS, **(thresholds or {})}
+    results = []
+    for name in sorted(set(reference) & set(current)):
+        expected, actual = reference[name], current[name]
+        if isinstance(expected, NumericHistogram):
+            resolutions = {"ks": expected, "coarse": expected.coarsen(bins)}
+            current_resolutions = {"ks": actual, "coarse": actual.coarsen(bins)}
+            results.extend(drift_engine.compare_numeric(name, resolutions, current_resolutions, metrics, thresholds))
+        else:
+            results.extend(drift_engine.compare_categorical(name, expected, actual, metrics, thresholds))
+    return results
+
+
+def describe(sketch, top: int = 10) -> Dict[str, Any]:
+    """
+    It summarizes a sketch for dashboards: quantiles of a histogram or the top categories of a table
+    """
+    if isinstance(sketch, NumericHistogram):
+        p5, p25, p50, p75, p95 = sketch.quantiles([0.05, 0.25, 0.5, 0.75, 0.95])
+        return {"feature_type": "numerical", "count": sketch.total, "missing": sketch.missing,
+                "p5": p5, "p25": p25, "p50": p50, "p75": p75, "p95": p95}
+    return {"feature_type": "categorical", "count": sketch.total, "missing": sketch.missing,
+            "top_categories": sketch.counts.most_common(top)}
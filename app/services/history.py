@@ -0,0 +1,130 @@
+import base64
+import json
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import func, inspect, literal, tuple_
+from sqlalchemy.orm import Session
+
+import app.models.table_model as models
+
+#Resources served by /history/{resource}
+HISTORY_RESOURCES = {
+    "ingestion_configs": models.UserDetailsIngestion,
+    "usage_configs": models.UserDetailsUsageIngestion,
+    "profiling_configs": models.UserDetailsProfiling,
+    "drift_configs": models.DriftServiceDetails,
+    "ingestion_results": models.MetadataIngestionEntity,
+    "usage_results": models.UsageIngestionEntity,
+    "profiling_results": models.ProfilingEntity,
+    "drift_results": models.DriftService_Dump,
+}
+
+#Columns the `fqn` filter applies to, the first one a table has is used
+FQN_COLUMNS = ("dbservice_fqn", "driftservice_fqn")
+
+MAX_PAGE_SIZE = 1000
+
+
+def encode_cursor(values: List[Any]) -> str:
+    data = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(data).encode()).decode()
+
+
+def decode_cursor(cursor: str, has_created_at: bool) -> List[Any]:
+    values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    if has_created_at:
+        values[0] = datetime.fromisoformat(values[0])
+    return values
+
+
+def _comparable(db: Session, key, value=None):
+    """
+    It returns the expression a keyset column is sorted and compared on. SQLite stores datetimes as
+    text whose format depends on who wrote them (CURRENT_TIMESTAMP or the driver), so they are
+    normalized there before being compared.
+    """
+    if db.get_bind().dialect.name == "sqlite" and key.key == "created_at":
+        return func.strftime("%Y-%m-%d %H:%M:%f", key if value is None else literal(value, key.type))
+    return key if value is None else value
+
+
+def _column(model, name: str):
+    columns = inspect(model).columns
+    if name not in columns:
+        raise ValueError(f"Unknown field '{name}'")
+    return getattr(model, name)
+
+
+def history_page(db: Session, resource: str, limit: int = 100, cursor: Optional[str] = None,
+                 fqn: Optional[str] = None, project_name: Optional[str] = None, task_name: Optional[str] = None,
+                 created_after: Optional[datetime] = None, created_before: Optional[datetime] = None,
+                 filters: Optional[List[str]] = None, fields: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    It returns one page of rows of a versioned config or results table, newest first. Pages are
+    walked with a (created_at, id) keyset cursor instead of an OFFSET, so the last page is as cheap
+    as the first one.
+    
+    :param db: Session = Depends(get_db)
+    :type db: Session
+    :param resource: One of the keys of HISTORY_RESOURCES
+    :type resource: str
+    :param limit: Rows per page, at most MAX_PAGE_SIZE
+    :type limit: int
+    :param cursor: The next_cursor of the previous page, None for the first page
+    :type cursor: Optional[str]
+    :param fqn: Only the rows of this dbservice_fqn / driftservice_fqn
+    :param project_name: Only the rows of this project
+    :param task_name: Only the rows of this task
+    :param created_after: Only the rows created at or after this moment
+    :param created_before: Only the rows created before this moment
+    :param filters: Extra equality filters written as "column:value"
+    :type filters: Optional[List[str]]
+    :param fields: The columns to return, all of them when None
+    :type fields: Optional[List[str]]
+    :return: A dictionary with the rows, the cursor of the next page and whether there is one
+    """
+    if resource not in HISTORY_RESOURCES:
+        raise ValueError(f"Resource must be one of {list(HISTORY_RESOURCES)}")
+    model = HISTORY_RESOURCES[resource]
+    columns = inspect(model).columns
+    primary_key = inspect(model).primary_key[0]
+    has_created_at = "created_at" in columns
+    keys = [model.created_at, getattr(model, primary_key.key)] if has_created_at else [getattr(model, primary_key.key)]
+
+    selected = [_column(model, name) for name in fields] if fields else [getattr(model, c.key) for c in columns]
+    hidden = [key for key in keys if key.key not in {column.key for column in selected}]
+    query = db.query(*selected, *hidden)
+
+    if fqn is not None:
+        fqn_column = next((name for name in FQN_COLUMNS if name in columns), None)
+        if fqn_column is None:
+            raise ValueError(f"'{resource}' has no fqn column")
+        query = query.filter(getattr(model, fqn_column) == fqn)
+    if project_name is not None:
+        query = query.filter(_column(model, "project_name") == project_name)
+    if task_name is not None:
+        query = query.filter(_column(model, "task_name") == task_name)
+    if has_created_at and created_after is not None:
+        query = query.filter(model.created_at >= created_after)
+    if has_created_at and created_before is not None:
+        query = query.filter(model.created_at < created_before)
+    for condition in filters or []:
+        name, separator, value = condition.partition(":")
+        if not separator:
+            raise ValueError(f"Filter '{condition}' must be written as column:value")
+        query = query.filter(_column(model, name) == value)
+
+    if cursor:
+        values = decode_cursor(cursor, has_created_at)
+        query = query.filter(tuple_(*[_comparable(db, key) for key in keys])
+                             < tuple_(*[_comparable(db, key, value) for key, value in zip(keys, values)]))
+    limit = min(max(1, limit), MAX_PAGE_SIZE)
+    rows = query.order_by(*[_comparable(db, key).desc() for key in keys]).limit(limit + 1).all()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = encode_cursor([getattr(rows[-1], key.key) for key in keys]) if has_more else None
+    names = [column.key for column in selected]
+    items = [{name: getattr(row, name) for name in names} for row in rows]
+    return {"Items": items, "next_cursor": next_cursor, "has_more": has_more}
@@ -0,0 +1,77 @@
+import json
+import os
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict
+
+from fastapi.responses import JSONResponse, Response
+from sqlalchemy import inspect
+
+try:
+    import orjson
+except ImportError:
+    #orjson is optional, the standard library renders the responses without it
+    orjson = None
+
+#"orjson" renders the responses with orjson when it is installed, "json" with the standard library
+JSON_RESPONSE = os.getenv("RUNML_JSON_RESPONSE", "orjson")
+
+
+def _default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None and JSON_RESPONSE == "orjson":
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(content, default=_default, ensure_ascii=False, allow_nan=False,
+                      separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    The default response class of the app: compact JSON rendered by orjson when available
+    """
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+class RawJSONResponse(Response):
+    """
+    A response whose body is JSON serialized already
+    """
+    media_type = "application/json"
+
+
+def row_dict(row) -> Dict[str, Any]:
+    """
+    It returns the column values of an ORM row
+    """
+    return {attr.key: getattr(row, attr.key) for attr in inspect(row).mapper.column_attrs}
+
+
+def raw_json_document(fields: Dict[str, Any], raw_key: str) -> RawJSONResponse:
+    """
+    It answers with `fields`, splicing the value of `raw_key`, which is JSON text as stored by the
+    config saves, into the body as it is instead of parsing it and encoding it again
+    
+    :param fields: The column values of a row (e.g. the latest config of a service)
+    :type fields: Dict[str, Any]
+    :param raw_key: The column holding JSON text (user_details or input_details)
+    :type raw_key: str
+    :return: The response, with the JSON document as the value of `raw_key`
+    """
+    raw = fields.get(raw_key)
+    if not isinstance(raw, str) or not raw.strip():
+        return RawJSONResponse(dumps(fields))
+    head = dumps({key: value for key, value in fields.items() if key != raw_key})
+    separator = b"," if len(head) > 2 else b""
+    return RawJSONResponse(head[:-1] + separator + dumps(raw_key) + b":" + raw.encode("utf-8") + b"}")
@@ -0,0 +1,298 @@
+import bisect
+import logging
+import os
+import threading
+import time
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+#Record the request and database metrics served at /metrics ("0" to turn them off)
+METRICS_ENABLED = os.getenv("RUNML_METRICS", "1") == "1"
+#Requests slower than this many milliseconds are logged with their SQL statements (0 turns the log off)
+SLOW_REQUEST_MS = float(os.getenv("RUNML_SLOW_REQUEST_MS", "0"))
+#Most statements kept per request for the slow request log
+SLOW_REQUEST_MAX_STATEMENTS = int(os.getenv("RUNML_SLOW_REQUEST_MAX_STATEMENTS", "50"))
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 500)
+
+slow_request_log = logging.getLogger("runml.slow_requests")
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self.values: Dict[Tuple[str, ...], float] = {}
+        self.lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for labels, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{_labels(self.labels, labels)} {_number(value)}")
+        return lines
+
+
+class Gauge(Counter):
+    def dec(self, *labels: str, amount: float = 1) -> None:
+        self.inc(*labels, amount=-amount)
+
+    def set(self, value: float, *labels: str) -> None:
+        with self.lock:
+            self.values[labels] = value
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self.buckets = tuple(buckets)
+        #labels -> [count per bucket (the last one is +Inf), sum, count]
+        self.values: Dict[Tuple[str, ...], list] = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.values.get(labels)
+            if series is None:
+                series = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for labels, (counts, total, count) in sorted(self.values.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += bucket_count
+                    le = 'le="+Inf"' if bound == float("inf") else f'le="{_number(bound)}"'
+                    lines.append(f"{self.name}_bucket{_labels(self.labels, labels, le)} {cumulative}")
+                lines.append(f"{self.name}_sum{_labels(self.labels, labels)} {repr(total)}")
+                lines.append(f"{self.name}_count{_labels(self.labels, labels)} {count}")
+        return lines
+
+
+REQUEST_LATENCY = Histogram("runml_http_request_duration_seconds", "Time spent serving a request", ("method", "route"))
+REQUESTS = Counter("runml_http_requests_total", "Requests served", ("method", "route", "status"))
+REQUESTS_IN_PROGRESS = Gauge("runml_http_requests_in_progress", "Requests being served", ("method",))
+HANDLED_ERRORS = Counter("runml_http_handled_errors_total",
+                         "Requests answered with an error body by a handler that caught the exception", ("method", "route"))
+REQUEST_DB_QUERIES = Histogram("runml_http_request_db_queries", "SQL statements issued per request", ("method", "route"),
+                               QUERY_COUNT_BUCKETS)
+REQUEST_DB_TIME = Histogram("runml_http_request_db_seconds", "Time spent in SQL statements per request", ("method", "route"))
+DB_QUERY_LATENCY = Histogram("runml_db_query_duration_seconds", "Time spent executing one SQL statement")
+DB_ERRORS = Counter("runml_db_errors_total", "SQL statements that raised an error")
+POOL_CHECKOUT_WAIT = Histogram("runml_db_pool_checkout_wait_seconds", "Time spent waiting for a pooled connection")
+COMMIT_LATENCY = Histogram("runml_db_commit_duration_seconds", "Time spent committing a session, flush included")
+WRITE_BEHIND_QUEUE_DEPTH = Gauge("runml_write_behind_queue_depth", "Results rows waiting in the write-behind buffer")
+WRITE_BEHIND_FLUSH_LATENCY = Histogram("runml_write_behind_flush_duration_seconds",
+                                       "Time spent inserting and committing one batch of the write-behind buffer")
+WRITE_BEHIND_FLUSH_ROWS = Histogram("runml_write_behind_flush_rows", "Rows written by one batch of the write-behind buffer",
+                                    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 5000))
+WRITE_BEHIND_ROWS = Counter("runml_write_behind_rows_total", "Rows written or rejected by the write-behind buffer",
+                            ("table", "status"))
+
+METRICS = (REQUEST_LATENCY, REQUESTS, REQUESTS_IN_PROGRESS, HANDLED_ERRORS, REQUEST_DB_QUERIES, REQUEST_DB_TIME,
+           DB_QUERY_LATENCY, DB_ERRORS, POOL_CHECKOUT_WAIT, COMMIT_LATENCY, WRITE_BEHIND_QUEUE_DEPTH,
+           WRITE_BEHIND_FLUSH_LATENCY, WRITE_BEHIND_FLUSH_ROWS, WRITE_BEHIND_ROWS)
+
+
+def render_metrics() -> str:
+    """
+    It renders every metric in the Prometheus text exposition format
+    """
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+class RequestStats:
+    """
+    The database work of the request being served, filled in by the SQLAlchemy event hooks
+    """
+    __slots__ = ("queries", "db_seconds", "statements")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.statements: List[Tuple[float, str]] = []
+
+
+#The stats object is shared with the threads running the sync handlers, the hooks only mutate it
+current_request: ContextVar[Optional[RequestStats]] = ContextVar("runml_current_request", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("runml_query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get("runml_query_start")
+    if not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    DB_QUERY_LATENCY.observe(elapsed)
+    stats = current_request.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_seconds += elapsed
+        if SLOW_REQUEST_MS and len(stats.statements) < SLOW_REQUEST_MAX_STATEMENTS:
+            stats.statements.append((elapsed, statement))
+
+
+def _handle_error(exception_context):
+    DB_ERRORS.inc()
+    starts = exception_context.connection.info.get("runml_query_start") if exception_context.connection is not None else None
+    if starts:
+        starts.pop()
+
+
+def _before_commit(session):
+    session.info["runml_commit_start"] = time.perf_counter()
+
+
+def _after_commit(session):
+    start = session.info.pop("runml_commit_start", None)
+    if start is not None:
+        COMMIT_LATENCY.observe(time.perf_counter() - start)
+
+
+def _after_rollback(session):
+    session.info.pop("runml_commit_start", None)
+
+
+def instrument_pool(engine: Engine) -> None:
+    """
+    It times how long getting a connection from the pool of `engine` takes. The pool is wrapped again
+    when the engine is disposed, since disposing replaces it.
+    """
+    pool = engine.pool
+    if getattr(pool, "_runml_timed", False):
+        return
+    connect = pool.connect
+
+    def timed_connect():
+        start = time.perf_counter()
+        try:
+            return connect()
+        finally:
+            POOL_CHECKOUT_WAIT.observe(time.perf_counter() - start)
+
+    pool.connect = timed_connect
+    pool._runml_timed = True
+
+
+def _engine_disposed(engine):
+    instrument_pool(engine)
+
+
+def install_sqlalchemy_hooks(*engines: Engine) -> None:
+    """
+    It registers the statement, error and commit hooks on every engine and session, and the
+    checkout timing on the pools of `engines`
+    """
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+        event.listen(Engine, "handle_error", _handle_error)
+        event.listen(Session, "before_commit", _before_commit)
+        event.listen(Session, "after_commit", _after_commit)
+        event.listen(Session, "after_rollback", _after_rollback)
+    for engine in engines:
+        instrument_pool(engine)
+        if not event.contains(engine, "engine_disposed", _engine_disposed):
+            event.listen(engine, "engine_disposed", _engine_disposed)
+
+
+def _reports_error(body: bytes) -> bool:
+    """
+    It tells whether a JSON body is one of the error answers of the handlers, {"Error": ...} or
+    ["Error: ...", "Message: ..."]
+    """
+    head = body[:512].lstrip()
+    return head.startswith(b'{"Error"') or (head.startswith(b"[") and b'"Error: ' in head)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording the latency, status, handled errors and database work of every
+    request, and logging the slow ones with their SQL statements
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        stats = RequestStats()
+        token = current_request.set(stats)
+        answer = {"status": 500, "error": False, "first_body": True}
+
+        async def timed_send(message):
+            if message["type"] == "http.response.start":
+                answer["status"] = message["status"]
+                headers = dict(message.get("headers") or [])
+                answer["json"] = headers.get(b"content-type", b"").startswith(b"application/json")
+            elif message["type"] == "http.response.body" and answer["first_body"]:
+                answer["first_body"] = False
+                answer["error"] = answer.get("json", False) and _reports_error(message.get("body", b""))
+            await send(message)
+
+        start = time.perf_counter()
+        REQUESTS_IN_PROGRESS.inc(method)
+        try:
+            await self.app(scope, receive, timed_send)
+        finally:
+            elapsed = time.perf_counter() - start
+            REQUESTS_IN_PROGRESS.dec(method)
+            current_request.reset(token)
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            REQUEST_LATENCY.observe(elapsed, method, route)
+            REQUESTS.inc(method, route, str(answer["status"]))
+            REQUEST_DB_QUERIES.observe(stats.queries, method, route)
+            REQUEST_DB_TIME.observe(stats.db_seconds, method, route)
+            if answer["error"]:
+                HANDLED_ERRORS.inc(method, route)
+            if SLOW_REQUEST_MS and elapsed * 1000 >= SLOW_REQUEST_MS:
+                _log_slow_request(method, scope["path"], answer["status"], elapsed, stats)
+
+
+def _log_slow_request(method: str, path: str, status: int, elapsed: float, stats: RequestStats) -> None:
+    statements = "".join(f"\n  [{seconds * 1000:.1f} ms] {' '.join(statement.split())[:500]}"
+                         for seconds, statement in stats.statements)
+    slow_request_log.warning("Slow request %s %s -> %s in %.1f ms, %d SQL statements in %.1f ms%s",
+                             method, path, status, elapsed * 1000, stats.queries, stats.db_seconds * 1000, statements)
@@ -0,0 +1,135 @@
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from app.services.batch_ingest import bulk_insert
+
+#Longest NDJSON line accepted, so a body without newlines cannot grow the buffer without bound
+MAX_LINE_BYTES = int(os.getenv("RUNML_NDJSON_MAX_LINE_BYTES", str(1024 * 1024)))
+#Number of finished uploads whose progress is still kept for the progress endpoint
+PROGRESS_HISTORY = int(os.getenv("RUNML_NDJSON_PROGRESS_HISTORY", "100"))
+#Number of failed lines reported back in full, the others are only counted
+MAX_REPORTED_ERRORS = 100
+
+
+async def iter_ndjson_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, bytes]]:
+    """
+    It splits an incoming byte stream into NDJSON lines as the chunks arrive. Only the current
+    partial line is buffered, never the whole body.
+    
+    :param chunks: The body chunks, e.g. `request.stream()`
+    :return: An async generator of (line number, line) pairs, blank lines skipped
+    """
+    buffer = bytearray()
+    line_number = 0
+    async for chunk in chunks:
+        buffer.extend(chunk)
+        start = 0
+        while True:
+            end = buffer.find(b"\n", start)
+            if end == -1:
+                break
+            line_number += 1
+            line = bytes(buffer[start:end]).strip()
+            if line:
+                yield line_number, line
+            start = end + 1
+        del buffer[:start]
+        if len(buffer) > MAX_LINE_BYTES:
+            raise ValueError(f"Line {line_number + 1} is longer than {MAX_LINE_BYTES} bytes")
+    line = bytes(buffer).strip()
+    if line:
+        yield line_number + 1, line
+
+
+class StreamProgress:
+    """
+    The progress of the NDJSON uploads of this process, keyed by upload id
+    """
+
+    def __init__(self, history: int = PROGRESS_HISTORY):
+        self.history = max(1, history)
+        self._uploads: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def start(self, upload_id: Optional[str] = None) -> Dict[str, Any]:
+        upload_id = upload_id or uuid.uuid4().hex
+        progress = {"upload_id": upload_id, "status": "Running", "lines": 0, "inserted": 0,
+                    "failed": 0, "started_at": time.time(), "finished_at": None}
+        with self._lock:
+            self._uploads[upload_id] = progress
+            while len(self._uploads) > self.history:
+                self._uploads.popitem(last=False)
+        return progress
+
+    def get(self, upload_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            progress = self._uploads.get(upload_id)
+            return dict(progress) if progress is not None else None
+
+
+#The progress registry shared by the streaming endpoints of this process
+stream_progress = StreamProgress()
+
+
+async def ingest_ndjson(chunks: AsyncIterator[bytes], db: Session, model, schema, chunk_size: int,
+                        upload_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    It reads an NDJSON body line by line, validates every line against `schema` and writes the rows
+    to the table of `model` every `chunk_size` lines. Each chunk is committed before the next part
+    of the body is read, so a slow database slows the client down instead of filling memory.
+    
+    :param chunks: The body chunks, e.g. `request.stream()`
+    :param db: Session = Depends(get_db)
+    :type db: Session
+    :param model: The ORM entity the rows belong to (e.g. models.DriftService_Dump)
+    :param schema: The pydantic model each line is validated against
+    :param chunk_size: Number of rows written per insert
+    :type chunk_size: int
+    :param upload_id: Identifier to follow the progress with, generated when not given
+    :type upload_id: Optional[str]
+    :return: The final progress of the upload with the first errors
+    """
+    chunk_size = max(1, chunk_size)
+    progress = stream_progress.start(upload_id)
+    errors: List[Dict[str, Any]] = []
+
+    def record_error(line_number: int, error: str):
+        progress["failed"] += 1
+        if len(errors) < MAX_REPORTED_ERRORS:
+            errors.append({"line": line_number, "error": error})
+
+    async def flush(pending: List[Tuple[int, Any]]):
+        summary = await run_in_threadpool(bulk_insert, db, model, schema, [item for _, item in pending], chunk_size)
+        progress["inserted"] += summary["Inserted"]
+        for result in summary["Results"]:
+            if result["status"] != "Success":
+                record_error(pending[result["index"]][0], result["error"])
+
+    pending: List[Tuple[int, Any]] = []
+    try:
+        async for line_number, line in iter_ndjson_lines(chunks):
+            progress["lines"] += 1
+            try:
+                pending.append((line_number, json.loads(line)))
+            except ValueError as e:
+                record_error(line_number, f"Invalid JSON: {e}")
+            if len(pending) >= chunk_size:
+                await flush(pending)
+                pending = []
+        if pending:
+            await flush(pending)
+        progress["status"] = "Completed"
+    except Exception as e:
+        progress["status"] = "Failed"
+        record_error(progress["lines"], f"{e}")
+    finally:
+        progress["finished_at"] = time.time()
+    return {**progress, "errors": errors}
@@ -0,0 +1,387 @@
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, inspect, or_, tuple_
+from sqlalchemy.orm import Session
+
+import app.models.table_model as models
+from app.models.history_model import HISTORY_RESULT_MODELS
+from app.models.latest_model import LatestConfigPointer
+from app.models.purge_model import PurgeJob
+from app.models.rollup_model import ResultRollup
+from app.models.sketch_model import DriftFeatureSketch
+from app.models.usage_summary_model import UsageSummary
+from app.models.version_model import VERSIONED_FQN_COLUMNS, VersionCounter
+from app.services.config_cache import latest_config_cache
+from app.services.history import FQN_COLUMNS
+from app.services.registry import project_task_registry, registry_changed
+
+#Rows deleted per transaction, so that no purge holds its locks for long
+PURGE_CHUNK_SIZE = int(os.getenv("RUNML_PURGE_CHUNK_SIZE", "5000"))
+#Seconds waited between two chunks, leaving room to the other writers of the same tables
+PURGE_PAUSE_SECONDS = float(os.getenv("RUNML_PURGE_PAUSE_SECONDS", "0"))
+#Purges run at the same time by one worker process
+PURGE_MAX_RUNNING = int(os.getenv("RUNML_PURGE_MAX_RUNNING", "1"))
+#A running purge whose heartbeat is older than this is taken over by another worker (e.g. after a crash)
+PURGE_LEASE_SECONDS = float(os.getenv("RUNML_PURGE_LEASE_SECONDS", "300"))
+#Seconds between two looks for queued or abandoned purges
+PURGE_POLL_SECONDS = float(os.getenv("RUNML_PURGE_POLL_SECONDS", "30"))
+
+FINISHED = ("Succeeded", "Failed", "Cancelled")
+
+purge_log = logging.getLogger("runml.purge")
+
+
+def _scope(model, project_name: str, task_name: Optional[str]):
+    """
+    It returns the condition selecting the rows of the project (and task) in a table carrying
+    project_name / task_name columns, None when the table has no project_name column
+    """
+    columns = inspect(model).columns
+    if "project_name" not in columns:
+        return None
+    clause = model.project_name == project_name
+    if task_name is not None:
+        if "task_name" not in columns:
+            return None
+        clause = and_(clause, model.task_name == task_name)
+    return clause
+
+
+def _fqn_column(model):
+    columns = inspect(model).columns
+    name = next((name for name in FQN_COLUMNS if name in columns), None)
+    return getattr(model, name) if name is not None else None
+
+
+def _any(*clauses):
+    clauses = [clause for clause in clauses if clause is not None]
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else or_(*clauses)
+
+
+def _results_clause(model):
+    def clause(project_name, task_name, fqns):
+        fqn_column = _fqn_column(model)
+        return _any(fqn_column.in_(fqns) if fqn_column is not None and fqns else None,
+                    _scope(model, project_name, task_name))
+    return clause
+
+
+def _config_clause(model):
+    return lambda project_name, task_name, fqns: _scope(model, project_name, task_name)
+
+
+def _fqn_clause(column, *extra):
+    return lambda project_name, task_name, fqns: and_(column.in_(fqns), *extra) if fqns else None
+
+
+_VERSIONED_TABLES = [model.__tablename__ for model in VERSIONED_FQN_COLUMNS]
+
+
+def purge_plan(whole_project: bool) -> List[Tuple[str, Any, Callable]]:
+    """
+    It lists the steps of a purge as (label, model, condition builder). The project and task rows go
+    first, so that no new config can be saved for them while the purge runs, then the results and
+    everything derived from them, and the saved configs last since the fqns of the results are read
+    from them.
+    
+    :param whole_project: True to purge a project, False for one task of a project
+    :type whole_project: bool
+    :return: The steps in the order they are run
+    """
+    plan = []
+    if whole_project:
+        plan.append(("projects", models.ProjectEntity, _config_clause(models.ProjectEntity)))
+    plan.append(("tasks", models.TaskEntity, _config_clause(models.TaskEntity)))
+    for model in HISTORY_RESULT_MODELS:
+        plan.append((model.__tablename__, model, _results_clause(model)))
+    plan.append((UsageSummary.__tablename__, UsageSummary, _fqn_clause(UsageSummary.dbservice_fqn)))
+    plan.append((DriftFeatureSketch.__tablename__, DriftFeatureSketch, _fqn_clause(DriftFeatureSketch.driftservice_fqn)))
+    plan.append((ResultRollup.__tablename__, ResultRollup, _fqn_clause(ResultRollup.fqn)))
+    plan.append((LatestConfigPointer.__tablename__, LatestConfigPointer,
+                 _fqn_clause(LatestConfigPointer.fqn, LatestConfigPointer.table_name.in_(_VERSIONED_TABLES))))
+    plan.append((VersionCounter.__tablename__, VersionCounter,
+                 _fqn_clause(VersionCounter.fqn, VersionCounter.table_name.in_(_VERSIONED_TABLES))))
+    for model in VERSIONED_FQN_COLUMNS:
+        plan.append((model.__tablename__, model, _config_clause(model)))
+    return plan
+
+
+def collect_fqns(db: Session, project_name: str, task_name: Optional[str]) -> List[str]:
+    """
+    It returns the dbservice / driftservice fqns of every config saved for the project (and task)
+    """
+    fqns = set()
+    for model, fqn_column in VERSIONED_FQN_COLUMNS.items():
+        clause = _scope(model, project_name, task_name)
+        if clause is not None:
+            fqns.update(fqn for (fqn,) in db.query(fqn_column).filter(clause).distinct() if fqn is not None)
+    return sorted(fqns)
+
+
+def delete_chunk(db: Session, model, clause, limit: int) -> int:
+    """
+    It deletes at most `limit` rows of `model` matching `clause`, selected by primary key first so
+    that the DELETE only locks the rows it removes
+    
+    :return: The number of rows deleted
+    """
+    primary_key = inspect(model).primary_key
+    keys = db.query(*primary_key).filter(clause).limit(limit).all()
+    if not keys:
+        return 0
+    if len(primary_key) == 1:
+        selected = primary_key[0].in_([key[0] for key in keys])
+    else:
+        selected = tuple_(*primary_key).in_([tuple(key) for key in keys])
+    return db.query(model).filter(selected).delete(synchronize_session=False)
+
+
+def purge_job_dict(job: PurgeJob) -> Dict[str, Any]:
+    plan = purge_plan(job.task_name is None)
+    deleted = json.loads(job.deleted or "{}")
+    return {
+        "job_id": job.job_id,
+        "project_name": job.project_name,
+        "task_name": job.task_name,
+        "status": job.status,
+        "cancel_requested": bool(job.cancel_requested),
+        "step": min(job.step, len(plan)),
+        "steps": len(plan),
+        "current_step": plan[job.step][0] if job.step < len(plan) and job.status not in FINISHED else None,
+        "deleted": deleted,
+        "deleted_total": sum(deleted.values()),
+        "fqns": json.loads(job.fqns) if job.fqns is not None else None,
+        "error": job.error,
+        "owner": job.owner,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "heartbeat_at": job.heartbeat_at,
+        "finished_at": job.finished_at,
+    }
+
+
+class PurgeJobManager:
+    """
+    It runs the cascading purges recorded in the purge_jobs table in background threads, at most
+    `max_running` at a time in this process. Every chunk of rows is deleted in its own transaction,
+    together with the progress of the purge, and a purge holds a lease on its row that it renews
+    with each chunk. A purge left behind by a stopped or crashed worker is queued again or taken
+    over once its lease expires, and carries on from its last committed chunk.
+    """
+
+    def __init__(self, session_factory: Callable[[], Session], max_running: int = PURGE_MAX_RUNNING):
+        self.session_factory = session_factory
+        self.max_running = max(1, max_running)
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._running = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._dispatcher: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """
+        It starts the thread picking up the queued and abandoned purges
+        """
+        if self._dispatcher is not None and self._dispatcher.is_alive():
+            return
+        self._stop.clear()
+        self._dispatcher = threading.Thread(target=self._dispatch_loop, name="purge-dispatcher", daemon=True)
+        self._dispatcher.start()
+
+    def shutdown(self) -> None:
+        """
+        It stops the running purges after their current chunk and gives them back to the queue
+        """
+        self._stop.set()
+        self._wake.set()
+
+    def submit(self, db: Session, project_name: str, task_name: Optional[str] = None) -> Tuple[PurgeJob, bool]:
+        """
+        It queues the purge of a project, or of one task of it when `task_name` is given. A purge of
+        the same project and task that has not finished yet is returned instead of a new one.
+        
+        :param db: Session = Depends(get_db)
+        :type db: Session
+        :param project_name: Name of the project
+        :type project_name: str
+        :param task_name: Name of the task, None to purge the whole project
+        :type task_name: Optional[str]
+        :return: A tuple (purge job, True when it was created by this call)
+        """
+        pending = db.query(PurgeJob).filter(PurgeJob.project_name == project_name,
+                                            PurgeJob.task_name.is_(None) if task_name is None else PurgeJob.task_name == task_name,
+                                            PurgeJob.status.notin_(FINISHED)).first()
+        if pending is not None:
+            return pending, False
+        job = PurgeJob(job_id=uuid.uuid4().hex, project_name=project_name, task_name=task_name,
+                       status="Queued", cancel_requested=0, step=0, deleted="{}")
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+        self._forget(project_name, task_name)
+        self._wake.set()
+        return job, True
+
+    def get(self, db: Session, job_id: str) -> Optional[PurgeJob]:
+        return db.get(PurgeJob, job_id)
+
+    def list(self, db: Session, status: Optional[str] = None, limit: int = 100) -> List[PurgeJob]:
+        query = db.query(PurgeJob)
+        if status is not None:
+            query = query.filter(PurgeJob.status == status)
+        return query.order_by(PurgeJob.created_at.desc()).limit(limit).all()
+
+    def cancel(self, db: Session, job_id: str) -> Optional[PurgeJob]:
+        """
+        It cancels a queued purge, or asks a running one to stop after its current chunk. The rows
+        already deleted stay deleted; a cancelled purge can be resumed.
+        """
+        db.query(PurgeJob).filter(PurgeJob.job_id == job_id, PurgeJob.status == "Queued") \
+            .update({"status": "Cancelled", "finished_at": datetime.utcnow()}, synchronize_session=False)
+        db.query(PurgeJob).filter(PurgeJob.job_id == job_id, PurgeJob.status == "Running") \
+            .update({"cancel_requested": 1}, synchronize_session=False)
+        db.commit()
+        return db.get(PurgeJob, job_id, populate_existing=True)
+
+    def resume(self, db: Session, job_id: str) -> Optional[PurgeJob]:
+        """
+        It queues a failed or cancelled purge again, from the step it had reached
+        """
+        db.query(PurgeJob).filter(PurgeJob.job_id == job_id, PurgeJob.status.in_(("Failed", "Cancelled"))) \
+            .update({"status": "Queued", "cancel_requested": 0, "error": None, "owner": None, "finished_at": None},
+                    synchronize_session=False)
+        db.commit()
+        self._wake.set()
+        return db.get(PurgeJob, job_id, populate_existing=True)
+
+    def _forget(self, project_name: str, task_name: Optional[str]) -> None:
+        #Only this worker's registry, the others see the deletion through the registry generation
+        if task_name is None:
+            project_task_registry.discard_project(project_name)
+        else:
+            project_task_registry.discard_task(task_name, project_name)
+
+    def _dispatch_loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self._claim_and_start()
+            except Exception:
+                purge_log.exception("Looking for purges to run failed")
+            self._wake.wait(PURGE_POLL_SECONDS)
+            self._wake.clear()
+
+    def _claim_and_start(self) -> None:
+        with self._lock:
+            free = self.max_running - len(self._running)
+        if free <= 0:
+            return
+        db = self.session_factory()
+        try:
+            now = datetime.utcnow()
+            abandoned = and_(PurgeJob.status == "Running", PurgeJob.heartbeat_at < now - timedelta(seconds=PURGE_LEASE_SECONDS))
+            candidates = [job_id for (job_id,) in db.query(PurgeJob.job_id)
+                          .filter(or_(PurgeJob.status == "Queued", abandoned))
+                          .order_by(PurgeJob.created_at).limit(free)]
+            for job_id in candidates:
+                #The claim only succeeds for one worker: the row no longer matches once it is updated
+                claimed = db.query(PurgeJob).filter(PurgeJob.job_id == job_id, or_(PurgeJob.status == "Queued", abandoned)) \
+                    .update({"status": "Running", "owner": self.worker_id, "heartbeat_at": now,
+                             "started_at": now, "error": None}, synchronize_session=False)
+                db.commit()
+                if claimed == 1:
+                    with self._lock:
+                        self._running.add(job_id)
+                    threading.Thread(target=self._run, args=(job_id,), name=f"purge-{job_id}", daemon=True).start()
+        finally:
+            db.close()
+
+    def _checkpoint(self, db: Session, job_id: str, values: Dict[str, Any]) -> bool:
+        """
+        It records the progress of the purge in the transaction of the chunk just deleted, as long as
+        this worker still holds the purge and nobody asked to cancel it
+        """
+        values = {**values, "heartbeat_at": datetime.utcnow()}
+        return db.query(PurgeJob).filter(PurgeJob.job_id == job_id, PurgeJob.owner == self.worker_id,
+                                         PurgeJob.status == "Running", PurgeJob.cancel_requested == 0) \
+            .update(values, synchronize_session=False) == 1
+
+    def _release(self, db: Session, job_id: str, values: Dict[str, Any]) -> None:
+        db.query(PurgeJob).filter(PurgeJob.job_id == job_id, PurgeJob.owner == self.worker_id,
+                                  PurgeJob.status == "Running").update(values, synchronize_session=False)
+        db.commit()
+
+    def _stopped(self, db: Session, job_id: str) -> None:
+        #The checkpoint was refused: either a cancellation was asked, or the lease was lost
+        job = db.get(PurgeJob, job_id, populate_existing=True)
+        if job is not None and job.owner == self.worker_id and job.cancel_requested:
+            self._release(db, job_id, {"status": "Cancelled", "finished_at": datetime.utcnow()})
+        elif job is not None and job.owner != self.worker_id:
+            purge_log.warning("Purge %s was taken over by %s", job_id, job.owner)
+
+    def _run(self, job_id: str) -> None:
+        db = self.session_factory()
+        try:
+            job = db.get(PurgeJob, job_id)
+            project_name, task_name = job.project_name, job.task_name
+            fqns = json.loads(job.fqns) if job.fqns is not None else None
+            if fqns is None:
+                fqns = collect_fqns(db, project_name, task_name)
+                if not self._checkpoint(db, job_id, {"fqns": json.dumps(fqns)}):
+                    db.rollback()
+                    return self._stopped(db, job_id)
+                db.commit()
+
+            plan = purge_plan(task_name is None)
+            deleted = json.loads(job.deleted or "{}")
+            for index in range(job.step, len(plan)):
+                label, model, condition = plan[index]
+                clause = condition(project_name, task_name, fqns)
+                while True:
+                    if self._stop.is_set():
+                        #Handed back to the queue, the next worker carries on from this step
+                        return self._release(db, job_id, {"status": "Queued", "owner": None})
+                    count = delete_chunk(db, model, clause, PURGE_CHUNK_SIZE) if clause is not None else 0
+                    deleted[label] = deleted.get(label, 0) + count
+                    if count and model in (models.ProjectEntity, models.TaskEntity):
+                        #Committed with the chunk, the other workers reload their registry at their next lookup
+                        registry_changed(db)
+                    done = count < PURGE_CHUNK_SIZE
+                    if not self._checkpoint(db, job_id, {"step": index + 1 if done else index, "deleted": json.dumps(deleted)}):
+                        db.rollback()
+                        return self._stopped(db, job_id)
+                    db.commit()
+                    if done:
+                        break
+                    if PURGE_PAUSE_SECONDS:
+                        time.sleep(PURGE_PAUSE_SECONDS)
+
+            self._release(db, job_id, {"status": "Succeeded", "finished_at": datetime.utcnow()})
+            for model in VERSIONED_FQN_COLUMNS:
+                for fqn in fqns:
+                    latest_config_cache.invalidate((model.__tablename__, fqn))
+            self._forget(project_name, task_name)
+            purge_log.info("Purge %s of %s finished, %d rows deleted", job_id,
+                           project_name if task_name is None else f"{project_name}/{task_name}", sum(deleted.values()))
+        except Exception as e:
+            db.rollback()
+            purge_log.exception("Purge %s failed", job_id)
+            try:
+                self._release(db, job_id, {"status": "Failed", "error": f"{e}", "finished_at": datetime.utcnow()})
+            except Exception:
+                db.rollback()
+        finally:
+            db.close()
+            with self._lock:
+                self._running.discard(job_id)
+            self._wake.set()
@@ -0,0 +1,329 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import yaml
+
+from app.services.tabular_reader import READ_CHUNK_ROWS, iter_column_chunks, read_columns, to_numeric
+from app.services.workflow_configs import render_workflow_config
+
+#Worker processes running the tests of the tables, one table per task (1 runs them in the calling thread)
+QUALITY_WORKERS = int(os.getenv("RUNML_QUALITY_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+#Names of the min / max / expected value in the config of a test case, the first one set is used
+_MIN_KEYS = ("minValue", "minLength", "minColValue")
+_MAX_KEYS = ("maxValue", "maxLength", "maxColValue")
+_VALUE_KEYS = ("value", "columnCount", "missingCountValue", "missingValue")
+
+
+def _config_value(config: Dict[str, Any], keys) -> Optional[float]:
+    for key in keys:
+        if config.get(key) is not None:
+            return float(config[key])
+    return None
+
+
+def _number(value: Optional[float]) -> str:
+    return "unset" if value is None else f"{value:g}"
+
+
+def missing_mask(values: np.ndarray) -> np.ndarray:
+    """
+    It flags the missing cells of a column chunk: NaN, None and, for text, empty strings
+    """
+    if values.dtype.kind == "f":
+        return np.isnan(values)
+    if values.dtype.kind in "biu":
+        return np.zeros(len(values), dtype=bool)
+    #NaN is the only value not equal to itself
+    return (values == "") | np.equal(values, None) | (values != values)
+
+
+class _Check:
+    """
+    A test case evaluated over the chunks of its table: `update` folds in a chunk, `outcome` returns
+    the value of the test and whether it passed
+    """
+    def __init__(self, config: Dict[str, Any]):
+        self.low = _config_value(config, _MIN_KEYS)
+        self.high = _config_value(config, _MAX_KEYS)
+        self.expected = _config_value(config, _VALUE_KEYS)
+
+    def update(self, values: np.ndarray) -> None:
+        raise NotImplementedError
+
+    def outcome(self) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def _between(self, value: float) -> bool:
+        return (self.low is None or value >= self.low) and (self.high is None or value <= self.high)
+
+
+class _RowCount(_Check):
+    def __init__(self, config: Dict[str, Any]):
+        super().__init__(config)
+        self.rows = 0
+
+    def update(self, values: np.ndarray) -> None:
+        self.rows += len(values)
+
+
+class RowCountToEqual(_RowCount):
+    def outcome(self) -> Dict[str, Any]:
+        return {"value": self.rows, "passed": self.rows == self.expected,
+                "details": f"{self.rows} rows, expected {_number(self.expected)}"}
+
+
+class RowCountToBeBetween(_RowCount):
+    def outcome(self) -> Dict[str, Any]:
+        return {"value": self.rows, "passed": self._between(self.rows),
+                "details": f"{self.rows} rows, expected between {_number(self.low)} and {_number(self.high)}"}
+
+
+class ValuesToBeBetween(_Check):
+    def __init__(self, config: Dict[str, Any]):
+        super().__init__(config)
+        self.outside = 0
+        self.minimum, self.maximum = np.inf, -np.inf
+
+    def update(self, values: np.ndarray) -> None:
+        numbers = to_numeric(values)
+        numbers = numbers[~np.isnan(numbers)]
+        if not len(numbers):
+            return
+        self.minimum = min(self.minimum, float(numbers.min()))
+        self.maximum = max(self.maximum, float(numbers.max()))
+        outside = np.zeros(len(numbers), dtype=bool)
+        if self.low is not None:
+            outside |= numbers < self.low
+        if self.high is not None:
+            outside |= numbers > self.high
+        self.outside += int(np.count_nonzero(outside))
+
+    def outcome(self) -> Dict[str, Any]:
+        observed = f"min {self.minimum:g}, max {self.maximum:g}" if self.minimum <= self.maximum else "no values"
+        return {"value": self.outside, "passed": self.outside == 0,
+                "details": f"{self.outside} values outside [{_number(self.low)}, {_number(self.high)}] ({observed})"}
+
+
+class ValueLengthsToBeBetween(ValuesToBeBetween):
+    def update(self, values: np.ndarray) -> None:
+        present = values[~missing_mask(values)]
+        if len(present):
+            super().update(np.char.str_len(present.astype(str)))
+
+
+class ValuesToBeNotNull(_Check):
+    def __init__(self, config: Dict[str, Any]):
+        super().__init__(config)
+        self.missing = 0
+
+    def update(self, values: np.ndarray) -> None:
+        self.missing += int(np.count_nonzero(missing_mask(values)))
+
+    def outcome(self) -> Dict[str, Any]:
+        return {"value": self.missing, "passed": self.missing == 0, "details": f"{self.missing} missing values"}
+
+
+class MissingCountToBeEqual(ValuesToBeNotNull):
+    def outcome(self) -> Dict[str, Any]:
+        return {"value": self.missing, "passed": self.missing == (self.expected or 0),
+                "details": f"{self.missing} missing values, expected {_number(self.expected or 0)}"}
+
+
+class ValuesToBeUnique(_Check):
+    """
+    The distinct values of every chunk are collected and merged into one sorted array of the
+    distinct values seen so far once they outnumber it, so memory grows with the distinct values of
+    the column rather than with its rows, and each value is sorted a bounded number of times
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        super().__init__(config)
+        self.seen: Optional[np.ndarray] = None
+        self.pending: List[np.ndarray] = []
+        self.pending_size = 0
+        self.duplicates = 0
+
+    def update(self, values: np.ndarray) -> None:
+        present = values[~missing_mask(values)]
+        if values.dtype.kind not in "biuf":
+            present = present.astype(str)
+        unique = np.unique(present)
+        self.duplicates += len(present) - len(unique)
+        self.pending.append(unique)
+        self.pending_size += len(unique)
+        if self.pending_size >= max(READ_CHUNK_ROWS, 0 if self.seen is None else len(self.seen)):
+            self._merge()
+
+    def _merge(self) -> None:
+        parts = self.pending if self.seen is None else [self.seen, *self.pending]
+        self.pending, self.pending_size = [], 0
+        if not parts:
+            return
+        kinds = {part.dtype.kind for part in parts}
+        if len(kinds) > 1 and not kinds <= set("biuf"):
+            parts = [part.astype(str) for part in parts]
+        merged = np.concatenate(parts)
+        self.seen = np.unique(merged)
+        #Every part holds distinct values: the rest repeat a value of another part
+        self.duplicates += len(merged) - len(self.seen)
+
+    def outcome(self) -> Dict[str, Any]:
+        self._merge()
+        return {"value": self.duplicates, "passed": self.duplicates == 0, "details": f"{self.duplicates} duplicate values"}
+
+
+TABLE_TESTS = {
+    "tableRowCountToEqual": RowCountToEqual,
+    "tableRowCountToBeBetween": RowCountToBeBetween,
+}
+
+COLUMN_TESTS = {
+    "columnValuesToBeBetween": ValuesToBeBetween,
+    "columnValueLengthsToBeBetween": ValueLengthsToBeBetween,
+    "columnValuesToBeNotNull": ValuesToBeNotNull,
+    "columnValuesMissingCountToBeEqual": MissingCountToBeEqual,
+    "columnValuesToBeUnique": ValuesToBeUnique,
+}
+
+
+def _result(table: Dict[str, Any], test_type: str, column: Optional[str], result: str,
+            value: Optional[float], details: str) -> Dict[str, Any]:
+    return {"table_name": table["table"], "column_name": column, "test_type": test_type, "result": result,
+            "value": value, "details": details}
+
+
+def run_table_tests(table: Dict[str, Any], chunk_rows: int = READ_CHUNK_ROWS) -> List[Dict[str, Any]]:
+    """
+    It runs the table and column tests of one table over its local extract, reading only the
+    columns tested, one chunk at a time. A test that cannot run (unknown type, missing column) is
+    "Aborted" without stopping the others.
+    
+    :param table: {"table": name, "path": file, "table_tests": [...], "column_tests": [...]}, the
+    tests shaped like the test_suite of the profiler YAML
+    :type table: Dict[str, Any]
+    :param chunk_rows: Rows per chunk
+    :type chunk_rows: int
+    :return: One result per test, "Success", "Failed" or "Aborted"
+    """
+    try:
+        file_columns = read_columns(table["path"])
+    except Exception as e:
+        return ([_result(table, test.get("testCase", {}).get("tableTestType"), None, "Aborted", None, f"{e}")
+                 for test in table.get("table_tests", [])] +
+                [_result(table, test.get("testCase", {}).get("columnTestType"), test.get("columnName"), "Aborted", None, f"{e}")
+                 for test in table.get("column_tests", [])])
+
+    results: List[Optional[Dict[str, Any]]] = []
+    checks = []
+    for test in table.get("table_tests", []):
+        case = test.get("testCase", {})
+        test_type, config = case.get("tableTestType"), case.get("config") or {}
+        if test_type == "tableColumnCountToEqual":
+            #Known from the header, no need to read the rows
+            expected = _config_value(config, _VALUE_KEYS)
+            results.append(_result(table, test_type, None, "Success" if len(file_columns) == expected else "Failed",
+                                   float(len(file_columns)), f"{len(file_columns)} columns, expected {_number(expected)}"))
+        elif test_type in TABLE_TESTS:
+            checks.append((len(results), test_type, None, TABLE_TESTS[test_type](config)))
+            results.append(None)
+        else:
+            results.append(_result(table, test_type, None, "Aborted", None, f"Unsupported table test {test_type}"))
+    for test in table.get("column_tests", []):
+        case = test.get("testCase", {})
+        test_type, column = case.get("columnTestType"), test.get("columnName")
+        if test_type not in COLUMN_TESTS:
+            results.append(_result(table, test_type, column, "Aborted", None, f"Unsupported column test {test_type}"))
+        elif column not in file_columns:
+            results.append(_result(table, test_type, column, "Aborted", None, f"No column {column} in {table['path']}"))
+        else:
+            checks.append((len(results), test_type, column, COLUMN_TESTS[test_type](case.get("config") or {})))
+            results.append(None)
+
+    if checks:
+        #The row counts read the first column tested, or the first column of the file
+        columns = sorted({column for _, _, column, _ in checks if column is not None}) or file_columns[:1]
+        for chunk in iter_column_chunks(table["path"], columns, chunk_rows):
+            for _, _, column, check in checks:
+                check.update(chunk[column if column is not None else columns[0]])
+        for position, test_type, column, check in checks:
+            outcome = check.outcome()
+            results[position] = _result(table, test_type, column, "Success" if outcome["passed"] else "Failed",
+                                        float(outcome["value"]), outcome["details"])
+    return results
+
+
+def tables_from_profiler_config(config: Dict[str, Any], paths: Dict[str, str]) -> List[Dict[str, Any]]:
+    """
+    It reads the tables tested by the test_suite of a profiler workflow config and pairs each one
+    with its local extract
+    
+    :param config: The parsed profiler YAML
+    :type config: Dict[str, Any]
+    :param paths: Local file of every table, keyed by its full name or by its last name component
+    :type paths: Dict[str, str]
+    :return: The table definitions taken by run_table_tests
+    """
+    suite = config.get("processor", {}).get("config", {}).get("test_suite") or {}
+    tables = []
+    for test in suite.get("tests", []):
+        name = test["table"]
+        path = paths.get(name) or paths.get(name.split(".")[-1])
+        if path is None:
+            raise ValueError(f"No local file given for table {name}")
+        tables.append({"table": name, "path": path, "table_tests": test.get("table_tests") or [],
+                       "column_tests": test.get("column_tests") or []})
+    return tables
+
+
+def load_test_tables(config_path: Optional[str] = None, profiler: Optional[Dict[str, Any]] = None,
+                     paths: Optional[Dict[str, str]] = None,
+                     tables: Optional[List[Dict[str, Any]]] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    It gathers the tables to test from a profiler YAML on disk, from the fields of a
+    SnowflakeProfilerYaml (rendered like /profiler/snowflake/create_yaml does) and from explicit
+    table definitions
+    
+    :return: The table definitions and the serviceName of the profiler config, if any
+    """
+    paths = paths or {}
+    configs = []
+    if config_path:
+        with open(config_path) as f:
+            configs.append(yaml.safe_load(f))
+    if profiler:
+        configs.append(yaml.safe_load(render_workflow_config("profiler", profiler)))
+    found = [table for config in configs for table in tables_from_profiler_config(config, paths)]
+    found += [dict(table) for table in tables or []]
+    if not found:
+        raise ValueError("No tables to test, give a config_path, a profiler config or tables")
+    service = next((config.get("source", {}).get("serviceName") for config in configs), None)
+    return found, service
+
+
+def run_quality_tests(tables: List[Dict[str, Any]], workers: int = QUALITY_WORKERS,
+                      chunk_rows: int = READ_CHUNK_ROWS) -> List[Dict[str, Any]]:
+    """
+    It runs the tests of every table, the tables spread over `workers` processes
+    
+    :return: The results of every table, in the order of the tables
+    """
+    if workers <= 1 or len(tables) <= 1:
+        return [result for table in tables for result in run_table_tests(table, chunk_rows)]
+    #The service runs threads, so the workers are spawned rather than forked from it
+    with ProcessPoolExecutor(max_workers=min(workers, len(tables)), mp_context=multiprocessing.get_context("spawn")) as pool:
+        return [result for table_results in pool.map(run_table_tests, tables, [chunk_rows] * len(tables))
+                for result in table_results]
+
+
+def to_profiling_rows(results: List[Dict[str, Any]], dbservice_fqn: str, template: Dict[str, Any],
+                      field_map: Dict[str, str]) -> List[Dict[str, Any]]:
+    """
+    It shapes test results as ProfilingEntity rows: every result is laid over `template` after its
+    keys are renamed with `field_map` (result key -> ProfilingResultsRow field)
+    """
+    return [{"dbservice_fqn": dbservice_fqn, **template,
+             **{field_map.get(key, key): value for key, value in result.items()}} for result in results]
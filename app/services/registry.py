@@ -0,0 +1,138 @@
+import os
+import threading
+import time
+from typing import Optional, Tuple
+
+from sqlalchemy import and_, exists, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+import app.models.table_model as models
+from app.models.registry_model import RegistryGeneration
+
+_GENERATION_ROW = 1
+#Seconds between two reads of the registry generation: a deletion made through another worker may be
+#answered from memory for up to this long (0 reads it on every lookup)
+REGISTRY_CHECK_SECONDS = float(os.getenv("RUNML_REGISTRY_CHECK_SECONDS", "2"))
+
+
+def current_generation(db: Session) -> int:
+    table = RegistryGeneration.__table__
+    return db.execute(select(table.c.generation).where(table.c.id == _GENERATION_ROW)).scalar() or 0
+
+
+def registry_changed(db: Session) -> None:
+    """
+    It bumps the registry generation in the caller's transaction. Called wherever projects or tasks
+    are deleted, so that the other workers reload their registry before answering from it.
+    """
+    table = RegistryGeneration.__table__
+    bump = table.update().where(table.c.id == _GENERATION_ROW).values(generation=table.c.generation + 1)
+    if db.execute(bump).rowcount:
+        return
+    try:
+        with db.begin_nested():
+            db.execute(table.insert().values(id=_GENERATION_ROW, generation=1))
+    except IntegrityError:
+        #Another worker created the row first
+        db.execute(bump)
+
+
+class ProjectTaskRegistry:
+    """
+    An in-memory set of the known projects and (project, task) pairs, warmed at startup and kept up
+    to date by the /project/* and /task/* endpoints. A name missing from the sets is checked against
+    the database (it may have been created by another worker) with a single EXISTS query.
+    Deletions, made by any worker or purge, bump the generation stored in registry_generation: a
+    lookup reads it (one primary key read) at most once every `check_interval` seconds and reloads
+    the sets when it moved, so a deleted project or task is answered as existing from memory for at
+    most that long. Deletions made through this worker update the sets at once.
+    """
+
+    def __init__(self, check_interval: float = REGISTRY_CHECK_SECONDS):
+        self.check_interval = check_interval
+        self._projects = set()
+        self._tasks = set()
+        self._generation: Optional[int] = None
+        self._checked_at = float("-inf")
+        self._lock = threading.Lock()
+
+    def warm(self, db: Session) -> None:
+        """
+        It loads every project name and (project, task) pair from the database
+        """
+        #Read first, so that a deletion committed while the sets load is seen by the next check
+        checked_at = time.monotonic()
+        generation = current_generation(db)
+        projects = {name for (name,) in db.query(models.ProjectEntity.project_name)}
+        tasks = set(db.query(models.TaskEntity.project_name, models.TaskEntity.task_name))
+        with self._lock:
+            self._projects = projects
+            self._tasks = {tuple(pair) for pair in tasks}
+            self._generation = generation
+            self._checked_at = checked_at
+
+    def lookup(self, db: Session, project_name: str, task_name: Optional[str] = None) -> Tuple[bool, bool]:
+        """
+        It tells whether the project and the (project, task) pair exist. Both are answered from
+        memory when known and no deletion was seen since the sets were loaded, otherwise with one
+        round-trip that evaluates the two EXISTS together.
+        
+        :param db: Session = Depends(get_db)
+        :type db: Session
+        :param project_name: Name of the project
+        :type project_name: str
+        :param task_name: Name of the task inside the project, None to only check the project
+        :type task_name: Optional[str]
+        :return: A tuple (project exists, task exists)
+        """
+        checked_at = time.monotonic()
+        if checked_at - self._checked_at >= self.check_interval:
+            if current_generation(db) != self._generation:
+                self.warm(db)
+            else:
+                self._checked_at = checked_at
+        with self._lock:
+            project_known = project_name in self._projects
+            task_known = task_name is not None and (project_name, task_name) in self._tasks
+        if project_known and (task_name is None or task_known):
+            return True, task_known
+
+        project_query = exists().where(models.ProjectEntity.project_name == project_name)
+        if task_name is None:
+            project_exists, task_exists = db.query(project_query).scalar(), False
+        else:
+            task_query = exists().where(and_(models.TaskEntity.project_name == project_name,
+                                             models.TaskEntity.task_name == task_name))
+            project_exists, task_exists = db.query(project_query, task_query).one()
+
+        with self._lock:
+            if project_exists:
+                self._projects.add(project_name)
+            if task_exists:
+                self._tasks.add((project_name, task_name))
+        return bool(project_exists), bool(task_exists)
+
+    def add_project(self, project_name: str) -> None:
+        with self._lock:
+            self._projects.add(project_name)
+
+    def add_task(self, project_name: str, task_name: str) -> None:
+        with self._lock:
+            self._tasks.add((project_name, task_name))
+
+    def discard_project(self, project_name: str) -> None:
+        with self._lock:
+            self._projects.discard(project_name)
+
+    def discard_task(self, task_name: str, project_name: Optional[str] = None) -> None:
+        """
+        It forgets `task_name` in every project, the way /task/delete removes it, or only in
+        `project_name` when it is given
+        """
+        with self._lock:
+            self._tasks = {pair for pair in self._tasks
+                           if pair[1] != task_name or (project_name is not None and pair[0] != project_name)}
+
+
+#The registry shared by the endpoints of this process
+project_task_registry = ProjectTaskRegistry()
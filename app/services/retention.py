@@ -0,0 +1,264 @@
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import and_, func, inspect, select, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from app.databases.partitioning import (PARTITION_CONVERT_ROWS, PARTITIONED_SOURCES, PARTITIONING, convert_to_partitioned,
+                                        ensure_partitions, is_partitioned, native_partitioning, native_partitions,
+                                        partition_log)
+from app.models.partition_model import ResultPartition
+from app.models.rollup_model import ResultRollup
+from app.services.history import FQN_COLUMNS
+from app.services.rollups import MODEL_SOURCES, ROLLUP_REBUILD_CHUNK, roll_up_stored, source_layout
+
+#Days the results are kept, 0 keeps them forever. RUNML_RETENTION_<SOURCE>_DAYS sets it for one
+#results table (METADATA, USAGE, PROFILING or DRIFT)
+RETENTION_DAYS = int(os.getenv("RUNML_RETENTION_DAYS", "0"))
+#"drop" removes the expired partitions, "compact" keeps a summary of them: the rollups of the profiling
+#and drift results, the newest result of every service of the metadata and usage results
+RETENTION_ACTION = os.getenv("RUNML_RETENTION_ACTION", "compact")
+#Seconds between two maintenance runs (partitions created ahead, retention applied), 0 only runs it at
+#startup and on POST /partitions/maintain
+PARTITION_MAINTENANCE_SECONDS = float(os.getenv("RUNML_PARTITION_MAINTENANCE_SECONDS", "3600"))
+#Key of the Postgres advisory lock held by the worker running the maintenance
+PARTITION_LOCK_KEY = int(os.getenv("RUNML_PARTITION_LOCK_KEY", "734213"))
+
+RETENTION_ACTIONS = ("drop", "compact")
+
+
+def retention_days(source: str) -> int:
+    return int(os.getenv(f"RUNML_RETENTION_{source.upper()}_DAYS", str(RETENTION_DAYS)))
+
+
+def expired_partitions(db: Session, table_name: str, cutoff: datetime) -> List[ResultPartition]:
+    """
+    It returns the active partitions of a results table whose whole range is older than `cutoff`
+    """
+    return (db.query(ResultPartition)
+            .filter(ResultPartition.table_name == table_name, ResultPartition.state == "Active",
+                    ResultPartition.range_end <= cutoff)
+            .order_by(ResultPartition.range_start)
+            .all())
+
+
+def rollups_cover(db: Session, model, start: datetime, end: datetime) -> bool:
+    """
+    It tells whether the hourly rollups of [start, end) count every stored value of the range, one
+    count per rolled up column compared with its hourly bucket counts
+    """
+    source = MODEL_SOURCES[model]
+    table = model.__table__
+    in_range = and_(table.c.created_at >= start, table.c.created_at < end)
+    for metric in source_layout(source)[1]:
+        if metric not in table.c:
+            continue
+        stored = db.execute(select(func.count(table.c[metric])).where(in_range)).scalar()
+        rolled_up = (db.query(func.coalesce(func.sum(ResultRollup.count), 0))
+                     .filter(ResultRollup.source == source, ResultRollup.resolution == "hour",
+                             ResultRollup.metric == metric, ResultRollup.bucket_start >= start,
+                             ResultRollup.bucket_start < end)
+                     .scalar())
+        if stored != rolled_up:
+            return False
+    return True
+
+
+def ensure_rollups(db: Session, model, start: datetime, end: datetime, chunk_rows: int = ROLLUP_REBUILD_CHUNK) -> int:
+    """
+    It rebuilds the rollups of [start, end) from the stored results when they do not count every
+    result of the range. The rollups are written with every result, so only the ranges stored
+    before the rollups existed, or partly rolled up, need it.
+    
+    :return: The number of raw rows rolled up
+    """
+    if rollups_cover(db, model, start, end):
+        return 0
+    db.query(ResultRollup).filter(ResultRollup.source == MODEL_SOURCES[model], ResultRollup.bucket_start >= start,
+                                  ResultRollup.bucket_start < end).delete(synchronize_session=False)
+    return roll_up_stored(db, model, start, end, chunk_rows)[0]
+
+
+def retire_partition(db: Session, model, partition: ResultPartition, action: str = RETENTION_ACTION) -> Dict[str, Any]:
+    """
+    It applies the retention to an expired partition, in one transaction. "drop" drops the native
+    partition, or deletes the range in one statement in the catalog layout. "compact" does the same
+    for the profiling and drift results once their rollups cover the range, and keeps the newest
+    result of every service of the range for the metadata and usage results.
+    
+    :param db: Session = Depends(get_db)
+    :type db: Session
+    :param model: A model of PARTITIONED_SOURCES
+    :param partition: The catalog row of the partition
+    :type partition: ResultPartition
+    :param action: "drop" or "compact"
+    :type action: str
+    :return: A dictionary with the partition, the action taken and the rows removed
+    """
+    if action not in RETENTION_ACTIONS:
+        raise ValueError(f"Retention action must be one of {list(RETENTION_ACTIONS)}")
+    table = model.__table__
+    in_range = and_(table.c.created_at >= partition.range_start, table.c.created_at < partition.range_end)
+    report = {"partition": partition.name, "action": action}
+    rows = db.execute(select(func.count()).select_from(table).where(in_range)).scalar()
+    fqn_column = next((name for name in FQN_COLUMNS if name in table.c), None)
+
+    if action == "compact" and model not in MODEL_SOURCES and fqn_column is not None:
+        primary_key = inspect(model).primary_key[0]
+        newest = select(func.max(primary_key)).where(in_range).group_by(table.c[fqn_column])
+        removed = db.execute(table.delete().where(in_range, primary_key.notin_(newest))).rowcount
+        state = "Compacted"
+    else:
+        if action == "compact" and model in MODEL_SOURCES:
+            report["rolled_up"] = ensure_rollups(db, model, partition.range_start, partition.range_end)
+        conn = db.connection()
+        if is_partitioned(conn, table.name) and partition.name in {p["name"] for p in native_partitions(conn, table.name)}:
+            conn.execute(text(f"DROP TABLE {conn.dialect.identifier_preparer.quote(partition.name)}"))
+            removed = rows
+        else:
+            removed = db.execute(table.delete().where(in_range)).rowcount
+        state = "Compacted" if action == "compact" and model in MODEL_SOURCES else "Dropped"
+
+    partition.state = state
+    partition.rows_removed = removed
+    partition.retired_at = datetime.utcnow()
+    db.commit()
+    partition_log.info("%s partition %s (%s of %s rows removed)", state, partition.name, removed, rows)
+    return {**report, "state": state, "rows": rows, "rows_removed": removed}
+
+
+def partition_dict(partition: ResultPartition) -> Dict[str, Any]:
+    return {column.key: getattr(partition, column.key) for column in inspect(ResultPartition).columns}
+
+
+class PartitionMaintenance:
+    """
+    It creates the partitions of the results tables ahead of time and applies the retention, at
+    startup and every RUNML_PARTITION_MAINTENANCE_SECONDS in a background thread. On Postgres an
+    advisory lock keeps the workers from running it at the same time.
+    """
+
+    def __init__(self, engine: Engine, session_factory: Callable[[], Session],
+                 interval: float = PARTITION_MAINTENANCE_SECONDS):
+        self.engine = engine
+        self.session_factory = session_factory
+        self.interval = interval
+        self.last_report: Optional[Dict[str, Any]] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if PARTITIONING == "off" or self.interval <= 0 or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="partition-maintenance", daemon=True)
+        self._thread.start()
+
+    def shutdown(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.run()
+            except Exception:
+                partition_log.exception("Partition maintenance failed")
+
+    def run(self, retention: bool = True, dry_run: bool = False, now: Optional[datetime] = None,
+            convert: bool = True) -> Dict[str, Any]:
+        """
+        It creates the missing partitions of every results table and, with `retention`, retires
+        the partitions older than their retention
+        
+        :param retention: Apply the retention too, not only create the partitions
+        :type retention: bool
+        :param dry_run: Only report the partitions the retention would retire
+        :type dry_run: bool
+        :param convert: Convert the tables holding at most RUNML_PARTITION_CONVERT_ROWS rows to native
+        partitions (never done by a dry run)
+        :type convert: bool
+        :param now: The current time, UTC (now by default)
+        :type now: Optional[datetime]
+        :return: A dictionary with the layout, partitions created and partitions retired per table
+        """
+        if PARTITIONING == "off":
+            return {"action": "off"}
+        now = now or datetime.utcnow()
+        with self._lock, self.engine.connect() as lock_conn:
+            if lock_conn.dialect.name == "postgresql":
+                if not lock_conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": PARTITION_LOCK_KEY}).scalar():
+                    return {"action": "skipped", "reason": "Another worker is running the maintenance"}
+            try:
+                report = {"action": "done", "tables": {}}
+                for source, model in PARTITIONED_SOURCES.items():
+                    report["tables"][source] = self._maintain(source, model, retention, dry_run, now, convert)
+            finally:
+                if lock_conn.dialect.name == "postgresql":
+                    lock_conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": PARTITION_LOCK_KEY})
+        self.last_report = {**report, "at": now.isoformat()}
+        return report
+
+    def _maintain(self, source: str, model, retention: bool, dry_run: bool, now: datetime, convert: bool) -> Dict[str, Any]:
+        convert_rows = PARTITION_CONVERT_ROWS if convert and not dry_run and PARTITION_CONVERT_ROWS > 0 else None
+        try:
+            with self.engine.begin() as conn:
+                table_report = ensure_partitions(conn, model, now, convert_rows)
+        except Exception as e:
+            partition_log.exception("Partitions of %s not created", model.__tablename__)
+            return {"error": f"{e}"}
+        days = retention_days(source)
+        table_report["retention_days"] = days
+        if not retention or days <= 0 or table_report["layout"] == "none":
+            return table_report
+        retired = table_report["retired"] = []
+        with self.session_factory() as db:
+            for partition in expired_partitions(db, model.__tablename__, now - timedelta(days=days)):
+                if dry_run:
+                    retired.append({"partition": partition.name, "action": RETENTION_ACTION, "dry_run": True})
+                    continue
+                try:
+                    retired.append(retire_partition(db, model, partition))
+                except Exception as e:
+                    db.rollback()
+                    partition_log.exception("Partition %s not retired", partition.name)
+                    retired.append({"partition": partition.name, "error": f"{e}"})
+        return table_report
+
+    def convert(self, source: str) -> Dict[str, Any]:
+        """
+        It converts a results table to native partitions whatever its size, on Postgres
+        """
+        if source not in PARTITIONED_SOURCES:
+            raise ValueError(f"Unknown source '{source}', expected one of {list(PARTITIONED_SOURCES)}")
+        table = PARTITIONED_SOURCES[source].__table__
+        with self._lock, self.engine.begin() as conn:
+            if not native_partitioning(conn):
+                raise ValueError("Native partitions need Postgres and RUNML_PARTITIONING=auto")
+            if is_partitioned(conn, table.name):
+                return {"action": "unchanged", "reason": "Already partitioned"}
+            return convert_to_partitioned(conn, table)
+
+    def status(self, db: Session) -> Dict[str, Any]:
+        """
+        It returns the layout, retention and catalog partitions of every results table
+        """
+        conn = db.connection()
+        tables = {}
+        for source, model in PARTITIONED_SOURCES.items():
+            partitions = (db.query(ResultPartition).filter(ResultPartition.table_name == model.__tablename__)
+                          .order_by(ResultPartition.range_start).all())
+            tables[source] = {
+                "table": model.__tablename__,
+                "layout": "native" if is_partitioned(conn, model.__tablename__) else "catalog",
+                "retention_days": retention_days(source),
+                "partitions": [partition_dict(partition) for partition in partitions],
+            }
+        return {"partitioning": PARTITIONING, "retention_action": RETENTION_ACTION, "tables": tables,
+                "last_run": self.last_report}
@@ -0,0 +1,395 @@
+import math
+import os
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import case, func, inspect, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+import app.models.table_model as models
+from app.models.partition_model import ResultPartition
+from app.models.rollup_model import ResultRollup
+
+#The results tables rolled up, by the name used in the /rollups endpoints
+ROLLUP_SOURCES = {
+    "profiling": models.ProfilingEntity,
+    "drift": models.DriftService_Dump,
+}
+MODEL_SOURCES = {model: source for source, model in ROLLUP_SOURCES.items()}
+#The dialects that add the aggregates to their buckets with INSERT ... ON CONFLICT DO UPDATE
+UPSERT_DIALECTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+#Bucket lengths, coarsest first
+RESOLUTIONS = {"day": timedelta(days=1), "hour": timedelta(hours=1)}
+
+#The series dimensions and the results columns they are read from, the first one a table has is used.
+#RUNML_ROLLUP_<SOURCE>_DIMENSIONS overrides them, e.g. "fqn=dbservice_fqn,feature_name=test_type"
+DIMENSION_CANDIDATES = {
+    "fqn": ("dbservice_fqn", "driftservice_fqn"),
+    "table_name": ("table_name",),
+    "column_name": ("column_name",),
+    "feature_name": ("feature_name",),
+}
+DIMENSIONS = tuple(DIMENSION_CANDIDATES)
+
+#A resolution is used for a query when the range spans at least this many of its buckets
+ROLLUP_MIN_POINTS = int(os.getenv("RUNML_ROLLUP_MIN_POINTS", "24"))
+#Most buckets returned by one query
+ROLLUP_MAX_POINTS = int(os.getenv("RUNML_ROLLUP_MAX_POINTS", "10000"))
+#Raw rows read per query when rebuilding the rollups
+ROLLUP_REBUILD_CHUNK = int(os.getenv("RUNML_ROLLUP_REBUILD_CHUNK", "5000"))
+
+
+def numeric_columns(model) -> List[str]:
+    """
+    It returns the integer and float columns of a results model, keys excluded
+    """
+    names = []
+    for column in inspect(model).columns:
+        if column.primary_key or column.foreign_keys:
+            continue
+        try:
+            python_type = column.type.python_type
+        except NotImplementedError:
+            continue
+        if python_type in (int, float):
+            names.append(column.key)
+    return names
+
+
+@lru_cache(maxsize=None)
+def source_layout(source: str) -> Tuple[Dict[str, str], Tuple[str, ...]]:
+    """
+    It returns how the results of `source` are rolled up: the results column of every series
+    dimension and the numeric results columns aggregated. Both can be set with
+    RUNML_ROLLUP_<SOURCE>_DIMENSIONS and RUNML_ROLLUP_<SOURCE>_METRICS, otherwise they are read from
+    the table.
+    """
+    model = ROLLUP_SOURCES[source]
+    columns = inspect(model).columns
+    configured = os.getenv(f"RUNML_ROLLUP_{source.upper()}_DIMENSIONS")
+    if configured:
+        dimensions = dict(pair.split("=", 1) for pair in configured.split(",") if pair)
+    else:
+        dimensions = {}
+        for dimension, candidates in DIMENSION_CANDIDATES.items():
+            present = [name for name in candidates if name in columns]
+            if present:
+                dimensions[dimension] = present[0]
+    configured = os.getenv(f"RUNML_ROLLUP_{source.upper()}_METRICS")
+    metrics = [name for name in configured.split(",") if name] if configured else numeric_columns(model)
+    return dimensions, tuple(metrics)
+
+
+def bucket_of(moment: datetime, resolution: str) -> datetime:
+    if resolution == "hour":
+        return moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _utc(moment) -> Optional[datetime]:
+    if isinstance(moment, str):
+        moment = datetime.fromisoformat(moment)
+    if isinstance(moment, datetime) and moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+
+def _number(value) -> Optional[float]:
+    if value is None or isinstance(value, bool):
+        return None
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return number if math.isfinite(number) else None
+
+
+def aggregate(source: str, rows: Iterable[Dict[str, Any]], at: Optional[datetime] = None) -> Dict[tuple, list]:
+    """
+    It folds results rows into per-bucket aggregates, keyed by (resolution, bucket_start, metric,
+    *dimensions), each one a [count, total, min, max, last value, last moment] list. A row is placed
+    at its created_at, or at `at` (now by default) when it has none.
+    """
+    dimensions, metrics = source_layout(source)
+    at = _utc(at) or datetime.utcnow()
+    aggregates = {}
+    for row in rows:
+        moment = _utc(row.get("created_at")) or at
+        series = tuple(str(row.get(dimensions[name]) or "") if name in dimensions else "" for name in DIMENSIONS)
+        for metric in metrics:
+            value = _number(row.get(metric))
+            if value is None:
+                continue
+            for resolution in RESOLUTIONS:
+                key = (resolution, bucket_of(moment, resolution), metric) + series
+                current = aggregates.get(key)
+                if current is None:
+                    aggregates[key] = [1, value, value, value, value, moment]
+                    continue
+                current[0] += 1
+                current[1] += value
+                current[2] = min(current[2], value)
+                current[3] = max(current[3], value)
+                if moment >= current[5]:
+                    current[4], current[5] = value, moment
+    return aggregates
+
+
+def stamp_created_at(model, rows: Iterable[Dict[str, Any]], at: Optional[datetime] = None) -> None:
+    """
+    It sets created_at on the rows of rolled up results tables that come without one, before they
+    are inserted. The stored row and its rollup buckets then carry the same moment, so that
+    rebuild_rollups puts the row back in the buckets it was recorded in.
+    
+    :param model: The ORM entity the rows are inserted into
+    :param rows: The column values of the rows, changed in place
+    :type rows: Iterable[Dict[str, Any]]
+    :param at: When the rows were received, now by default
+    :type at: Optional[datetime]
+    """
+    if model not in MODEL_SOURCES or "created_at" not in model.__table__.c:
+        return
+    at = _utc(at) or datetime.utcnow()
+    for row in rows:
+        if row.get("created_at") is None:
+            row["created_at"] = at
+
+
+def _merge(db: Session, source: str, key: tuple, values: list) -> bool:
+    """
+    It adds one aggregate to its stored bucket with a single UPDATE, so concurrent writers never
+    overwrite each other's counts
+    
+    :return: False when the bucket does not exist yet
+    """
+    rollups = ResultRollup.__table__
+    resolution, bucket_start, metric = key[:3]
+    count, total, low, high, last_value, last_at = values
+    match = ((rollups.c.source == source) & (rollups.c.resolution == resolution)
+             & (rollups.c.metric == metric) & (rollups.c.bucket_start == bucket_start))
+    for name, value in zip(DIMENSIONS, key[3:]):
+        match = match & (rollups.c[name] == value)
+    newer = rollups.c.last_at <= last_at
+    merged = db.execute(rollups.update().where(match).values(
+        count=rollups.c.count + count,
+        total=rollups.c.total + total,
+        min_value=case((rollups.c.min_value <= low, rollups.c.min_value), else_=low),
+        max_value=case((rollups.c.max_value >= high, rollups.c.max_value), else_=high),
+        last_value=case((newer, last_value), else_=rollups.c.last_value),
+        last_at=case((newer, last_at), else_=rollups.c.last_at),
+    ))
+    return bool(merged.rowcount)
+
+
+def _upsert(db: Session, insert, source: str, aggregates: Dict[tuple, list]) -> None:
+    """
+    It adds every aggregate to its bucket, creating the missing ones, with one INSERT ... ON CONFLICT
+    DO UPDATE executed for all the buckets. They are written in key order, so that concurrent
+    writers lock the buckets they share in the same order.
+    """
+    rollups = ResultRollup.__table__
+    statement = insert(rollups)
+    excluded = statement.excluded
+    newer = rollups.c.last_at <= excluded.last_at
+    statement = statement.on_conflict_do_update(
+        index_elements=[column.name for column in
+                        next(constraint for constraint in rollups.constraints
+                             if constraint.name == "uq_result_rollups_bucket").columns],
+        set_={
+            "count": rollups.c.count + excluded.count,
+            "total": rollups.c.total + excluded.total,
+            "min_value": case((rollups.c.min_value <= excluded.min_value, rollups.c.min_value), else_=excluded.min_value),
+            "max_value": case((rollups.c.max_value >= excluded.max_value, rollups.c.max_value), else_=excluded.max_value),
+            "last_value": case((newer, excluded.last_value), else_=rollups.c.last_value),
+            "last_at": case((newer, excluded.last_at), else_=rollups.c.last_at),
+        })
+    buckets = []
+    for key in sorted(aggregates):
+        count, total, low, high, last_value, last_at = aggregates[key]
+        buckets.append({"source": source, "resolution": key[0], "bucket_start": key[1], "metric": key[2],
+                        **dict(zip(DIMENSIONS, key[3:])), "count": count, "total": total, "min_value": low,
+                        "max_value": high, "last_value": last_value, "last_at": last_at})
+    db.execute(statement, buckets)
+
+
+def record_rollups(db: Session, model, rows: Iterable[Dict[str, Any]], at: Optional[datetime] = None) -> int:
+    """
+    It adds freshly inserted results rows to the hourly and daily rollups of their series. It is
+    part of the caller's transaction, so the rollups commit or roll back with the rows themselves;
+    the buckets updated stay locked until then, so callers record the rollups last, right before
+    their commit. Rows of tables that are not rolled up are ignored.
+    
+    :param db: Session = Depends(get_db)
+    :type db: Session
+    :param model: The ORM entity the rows were inserted into (e.g. models.ProfilingEntity)
+    :param rows: The column values of the inserted rows
+    :type rows: Iterable[Dict[str, Any]]
+    :param at: When the rows were inserted, for the ones without created_at (now by default)
+    :type at: Optional[datetime]
+    :return: The number of buckets updated
+    """
+    source = MODEL_SOURCES.get(model)
+    if source is None:
+        return 0
+    aggregates = aggregate(source, rows, at)
+    if not aggregates:
+        return 0
+    insert = UPSERT_DIALECTS.get(db.get_bind().dialect.name)
+    if insert is not None:
+        _upsert(db, insert, source, aggregates)
+        return len(aggregates)
+    for key, values in sorted(aggregates.items()):
+        if _merge(db, source, key, values):
+            continue
+        count, total, low, high, last_value, last_at = values
+        try:
+            with db.begin_nested():
+                db.add(ResultRollup(source=source, resolution=key[0], bucket_start=key[1], metric=key[2],
+                                    **dict(zip(DIMENSIONS, key[3:])), count=count, total=total,
+                                    min_value=low, max_value=high, last_value=last_value, last_at=last_at))
+        except IntegrityError:
+            #Another writer created the bucket first, add to it
+            _merge(db, source, key, values)
+    return len(aggregates)
+
+
+def choose_resolution(start: datetime, end: datetime) -> str:
+    """
+    It returns the coarsest resolution that still gives ROLLUP_MIN_POINTS buckets over the range
+    """
+    for resolution, length in RESOLUTIONS.items():
+        if (end - start) >= length * ROLLUP_MIN_POINTS:
+            return resolution
+    return list(RESOLUTIONS)[-1]
+
+
+def rollup_series(db: Session, source: str, start: datetime, end: Optional[datetime] = None,
+                  resolution: Optional[str] = None, metric: Optional[str] = None,
+                  **dimensions: Optional[str]) -> Dict[str, Any]:
+    """
+    It returns the rolled up series of `source` over [start, end), one point per bucket. Buckets are
+    whole hours or days, so the first one may start before `start`.
+    
+    :param db: Session = Depends(get_db)
+    :type db: Session
+    :param source: One of the keys of ROLLUP_SOURCES
+    :type source: str
+    :param start: Beginning of the range
+    :type start: datetime
+    :param end: End of the range, now by default
+    :type end: Optional[datetime]
+    :param resolution: "hour" or "day", picked from the length of the range when None
+    :type resolution: Optional[str]
+    :param metric: Only the series of this results field
+    :type metric: Optional[str]
+    :param dimensions: Only the series with these fqn, table_name, column_name or feature_name
+    :return: A dictionary with the resolution used and the series with their points
+    """
+    if source not in ROLLUP_SOURCES:
+        raise ValueError(f"Unknown source '{source}', expected one of {list(ROLLUP_SOURCES)}")
+    start, end = _utc(start), _utc(end) or datetime.utcnow()
+    resolution = resolution or choose_resolution(start, end)
+    if resolution not in RESOLUTIONS:
+        raise ValueError(f"Unknown resolution '{resolution}', expected one of {list(RESOLUTIONS)}")
+
+    query = (db.query(ResultRollup)
+             .filter(ResultRollup.source == source)
+             .filter(ResultRollup.resolution == resolution)
+             .filter(ResultRollup.bucket_start >= bucket_of(start, resolution))
+             .filter(ResultRollup.bucket_start < end))
+    if metric is not None:
+        query = query.filter(ResultRollup.metric == metric)
+    for name, value in dimensions.items():
+        if name not in DIMENSIONS:
+            raise ValueError(f"Unknown dimension '{name}'")
+        if value is not None:
+            query = query.filter(getattr(ResultRollup, name) == value)
+    rows = query.order_by(ResultRollup.bucket_start).limit(ROLLUP_MAX_POINTS + 1).all()
+
+    series = {}
+    for row in rows[:ROLLUP_MAX_POINTS]:
+        key = (row.metric,) + tuple(getattr(row, name) for name in DIMENSIONS)
+        if key not in series:
+            series[key] = {"metric": row.metric, **{name: getattr(row, name) for name in DIMENSIONS}, "points": []}
+        series[key]["points"].append({
+            "bucket_start": row.bucket_start,
+            "count": row.count,
+            "min": row.min_value,
+            "max": row.max_value,
+            "mean": row.total / row.count if row.count else None,
+            "last": row.last_value,
+        })
+    return {"resolution": resolution, "Series": list(series.values()), "truncated": len(rows) > ROLLUP_MAX_POINTS}
+
+
+def roll_up_stored(db: Session, model, since: Optional[datetime] = None, until: Optional[datetime] = None,
+                   chunk_rows: int = ROLLUP_REBUILD_CHUNK) -> Tuple[int, int]:
+    """
+    It adds the stored results rows created in [since, until) to the rollups, reading them in
+    primary key order `chunk_rows` at a time. The caller deletes the rollups of the range first.
+    
+    :return: A tuple (raw rows read, bucket updates written)
+    """
+    table = model.__table__
+    primary_key = inspect(model).primary_key[0]
+    read = buckets = 0
+    last_id = None
+    while True:
+        query = select(table).order_by(primary_key).limit(max(1, chunk_rows))
+        if since is not None and "created_at" in table.c:
+            query = query.where(table.c.created_at >= since)
+        if until is not None and "created_at" in table.c:
+            query = query.where(table.c.created_at < until)
+        if last_id is not None:
+            query = query.where(primary_key > last_id)
+        rows = [dict(row) for row in db.execute(query).mappings()]
+        if not rows:
+            break
+        read += len(rows)
+        buckets += record_rollups(db, model, rows)
+        last_id = rows[-1][primary_key.key]
+    return read, buckets
+
+
+def retired_until(db: Session, model) -> Optional[datetime]:
+    """
+    It returns the end of the newest partition of a results table dropped or compacted by the
+    retention: the rollups before it are the only record left of those results
+    """
+    return (db.query(func.max(ResultPartition.range_end))
+            .filter(ResultPartition.table_name == model.__table__.name,
+                    ResultPartition.state.in_(("Dropped", "Compacted")))
+            .scalar())
+
+
+def rebuild_rollups(db: Session, source: str, since: Optional[datetime] = None,
+                    chunk_rows: int = ROLLUP_REBUILD_CHUNK) -> Dict[str, Any]:
+    """
+    It recomputes the rollups of `source` from the raw results, from the day of `since` onwards (all
+    of them by default). Used once for the results stored before the rollups existed, or after the
+    rollup layout was changed. The rollups of the partitions retired by the retention are kept: the
+    rebuild starts at the end of the newest one at the earliest, since their raw rows are gone.
+    
+    :return: A dictionary with the raw rows read, the bucket updates written and the moment the
+    rebuild started from
+    """
+    if source not in ROLLUP_SOURCES:
+        raise ValueError(f"Unknown source '{source}', expected one of {list(ROLLUP_SOURCES)}")
+    model = ROLLUP_SOURCES[source]
+    since = bucket_of(_utc(since), "day") if since is not None else None
+    retired = retired_until(db, model)
+    if retired is not None and (since is None or since < retired):
+        since = retired
+
+    stale = db.query(ResultRollup).filter(ResultRollup.source == source)
+    if since is not None:
+        stale = stale.filter(ResultRollup.bucket_start >= since)
+    stale.delete(synchronize_session=False)
+
+    read, buckets = roll_up_stored(db, model, since, chunk_rows=chunk_rows)
+    db.commit()
+    return {"Rows": read, "Bucket updates": buckets, "Since": since}
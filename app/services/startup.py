@@ -0,0 +1,43 @@
+import logging
+import time
+from contextlib import contextmanager
+from typing import Any, Dict
+
+startup_log = logging.getLogger("runml.startup")
+
+
+class StartupReport:
+    """
+    Where the cold start of a worker goes: the import of the app module and every startup step
+    """
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.import_seconds = None
+        self.ready_seconds = None
+        self.steps: Dict[str, float] = {}
+        self.details: Dict[str, Any] = {}
+
+    def imported(self) -> None:
+        self.import_seconds = round(time.perf_counter() - self.started, 4)
+
+    @contextmanager
+    def step(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.steps[name] = round(time.perf_counter() - start, 4)
+
+    def ready(self) -> None:
+        self.ready_seconds = round(time.perf_counter() - self.started, 4)
+        steps = ", ".join(f"{name} {seconds * 1000:.1f} ms" for name, seconds in self.steps.items())
+        startup_log.info("Worker ready in %.1f ms (import %.1f ms; %s)", self.ready_seconds * 1000,
+                         (self.import_seconds or 0) * 1000, steps)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"import_seconds": self.import_seconds, "steps": dict(self.steps),
+                "ready_seconds": self.ready_seconds, **self.details}
+
+
+#Created when the app module starts importing, so the import time covers it
+startup_report = StartupReport()
@@ -0,0 +1,112 @@
+import csv
+import os
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+
+#Rows per chunk when reading local extracts
+READ_CHUNK_ROWS = int(os.getenv("RUNML_READ_CHUNK_ROWS", "50000"))
+
+
+def read_columns(path: str) -> List[str]:
+    """
+    It returns the column names of a local CSV or Parquet file without reading its rows
+    """
+    if _is_parquet(path):
+        import pyarrow.parquet as pq
+        return list(pq.ParquetFile(path).schema_arrow.names)
+    with open(path, newline="") as f:
+        return next(csv.reader(f), [])
+
+
+def iter_column_chunks(path: str, columns: Optional[List[str]] = None,
+                       chunk_rows: int = READ_CHUNK_ROWS) -> Iterator[Dict[str, np.ndarray]]:
+    """
+    It streams a local CSV or Parquet file in chunks of at most `chunk_rows` rows, one array per
+    column, so that only one chunk is ever held in memory. CSV values come back as strings (empty
+    cells as ""); Parquet values keep their stored type.
+    
+    :param path: Path of a .csv or .parquet file
+    :type path: str
+    :param columns: The columns to read, all of them when None
+    :type columns: Optional[List[str]]
+    :param chunk_rows: Maximum number of rows per chunk
+    :type chunk_rows: int
+    :return: A generator of {column name: numpy array} dicts
+    """
+    chunk_rows = max(1, chunk_rows)
+    if _is_parquet(path):
+        yield from _iter_parquet(path, columns, chunk_rows)
+    else:
+        yield from _iter_csv(path, columns, chunk_rows)
+
+
+def to_numeric(values: np.ndarray) -> np.ndarray:
+    """
+    It converts a column chunk to float64, empty or unparsable cells becoming NaN
+    """
+    if values.dtype.kind in "biuf":
+        return values.astype(np.float64, copy=False)
+    try:
+        return np.where((values == "") | np.equal(values, None), "nan", values).astype(np.float64)
+    except (TypeError, ValueError):
+        pass
+    #Slow path, only taken by chunks holding text that is not a number
+    out = np.full(len(values), np.nan)
+    for i, value in enumerate(values):
+        try:
+            out[i] = float(value)
+        except (TypeError, ValueError):
+            pass
+    return out
+
+
+def is_numeric(values: np.ndarray) -> bool:
+    """
+    It tells whether every non-empty cell of a column chunk parses as a number
+    """
+    if values.dtype.kind in "biuf":
+        return True
+    present = values[(values != "") & ~np.equal(values, None)]
+    if not len(present):
+        return False
+    try:
+        present.astype(np.float64)
+        return True
+    except (TypeError, ValueError):
+        return False
+
+
+def _is_parquet(path: str) -> bool:
+    return path.lower().endswith((".parquet", ".pq"))
+
+
+def _iter_csv(path, columns, chunk_rows):
+    with open(path, newline="") as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+        wanted = columns or header
+        missing = [name for name in wanted if name not in header]
+        if missing:
+            raise KeyError(f"Columns not found in {path}: {missing}")
+        positions = [header.index(name) for name in wanted]
+        rows = []
+        for row in reader:
+            rows.append(row)
+            if len(rows) == chunk_rows:
+                yield _csv_chunk(rows, wanted, positions)
+                rows = []
+        if rows:
+            yield _csv_chunk(rows, wanted, positions)
+
+
+def _csv_chunk(rows, names, positions):
+    return {name: np.array([row[i] if i < len(row) else "" for row in rows], dtype=object)
+            for name, i in zip(names, positions)}
+
+
+def _iter_parquet(path, columns, chunk_rows):
+    import pyarrow.parquet as pq
+    parquet = pq.ParquetFile(path)
+    for batch in parquet.iter_batches(batch_size=chunk_rows, columns=columns):
+        yield {name: batch.column(i).to_numpy(zero_copy_only=False) for i, name in enumerate(batch.schema.names)}
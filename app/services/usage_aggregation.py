@@ -0,0 +1,227 @@
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Any, Dict, Iterator, List, Optional
+
+#Lines of the staging file handed to a worker at a time
+USAGE_CHUNK_LINES = int(os.getenv("RUNML_USAGE_CHUNK_LINES", "20000"))
+#Worker processes aggregating the chunks, 1 aggregates in the calling thread
+USAGE_WORKERS = int(os.getenv("RUNML_USAGE_WORKERS", str(min(4, os.cpu_count() or 1))))
+#Longest query text kept as the sample of a top query
+MAX_QUERY_CHARS = 2000
+
+#Fields of a TableUsageCount record the aggregation reads, newer and older OpenMetadata names
+_QUERY_LIST_KEYS = ("sqlQueries", "queries")
+_USER_KEYS = ("users", "userName", "user")
+
+
+def iter_staging_files(path: str) -> List[str]:
+    """
+    It returns the files written by the table-usage stage: `path` itself, or the files of `path`
+    when the stage wrote one file per service and day into a directory
+    """
+    if os.path.isdir(path):
+        return [os.path.join(path, name) for name in sorted(os.listdir(path))
+                if os.path.isfile(os.path.join(path, name))]
+    return [path]
+
+
+def iter_line_chunks(paths: List[str], chunk_lines: int = USAGE_CHUNK_LINES) -> Iterator[List[bytes]]:
+    """
+    It streams the staging files as lists of at most `chunk_lines` non blank lines, so that only the
+    chunks being aggregated are held in memory
+    """
+    chunk_lines = max(1, chunk_lines)
+    chunk = []
+    for path in paths:
+        with open(path, "rb") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    chunk.append(line)
+                    if len(chunk) >= chunk_lines:
+                        yield chunk
+                        chunk = []
+    if chunk:
+        yield chunk
+
+
+def _record(line: bytes) -> Dict[str, Any]:
+    record = json.loads(line)
+    #The stage of older OpenMetadata versions writes every record as a JSON encoded string
+    if isinstance(record, str):
+        record = json.loads(record)
+    if not isinstance(record, dict):
+        raise ValueError("A usage record must be a JSON object")
+    return record
+
+
+def _name(value: Any) -> Optional[str]:
+    if isinstance(value, dict):
+        value = value.get("fullyQualifiedName") or value.get("name") or value.get("table")
+    return str(value) if value not in (None, "") else None
+
+
+def _table_name(record: Dict[str, Any]) -> str:
+    table = record.get("table")
+    if isinstance(table, dict):
+        return _name(table) or "unknown"
+    parts = [record.get("databaseName"), record.get("databaseSchema"), table]
+    return ".".join(str(part) for part in parts if part) or "unknown"
+
+
+def _users(query: Dict[str, Any]) -> List[str]:
+    for key in _USER_KEYS:
+        users = query.get(key)
+        if users:
+            users = users if isinstance(users, list) else [users]
+            return [name for name in (_name(user) for user in users) if name]
+    return []
+
+
+def _column_name(value: Any) -> Optional[str]:
+    if isinstance(value, dict):
+        table, column = _name(value.get("table")), value.get("column")
+        if column:
+            return f"{table}.{column}" if table else str(column)
+        return _name(value)
+    return _name(value)
+
+
+def empty_aggregate() -> Dict[str, Any]:
+    return {"records": 0, "bad_lines": 0, "queries": 0, "tables": Counter(), "users": Counter(),
+            "joins": Counter(), "query_counts": Counter(), "query_text": {}, "first_date": None, "last_date": None}
+
+
+def aggregate_chunk(lines: List[bytes]) -> Dict[str, Any]:
+    """
+    It aggregates a chunk of TableUsageCount records: queries per table and per user, join
+    frequencies and occurrences per query text. Runs in the worker processes.
+    
+    :param lines: JSON lines of the staging file
+    :type lines: List[bytes]
+    :return: The partial aggregate of the chunk, merged by `merge_aggregates`
+    """
+    aggregate = empty_aggregate()
+    for line in lines:
+        try:
+            record = _record(line)
+        except ValueError:
+            aggregate["bad_lines"] += 1
+            continue
+        aggregate["records"] += 1
+        aggregate["tables"][_table_name(record)] += int(record.get("count") or 1)
+
+        day = record.get("date")
+        if day:
+            day = str(day)
+            if aggregate["first_date"] is None or day < aggregate["first_date"]:
+                aggregate["first_date"] = day
+            if aggregate["last_date"] is None or day > aggregate["last_date"]:
+                aggregate["last_date"] = day
+
+        queries = next((record[key] for key in _QUERY_LIST_KEYS if record.get(key)), None) or []
+        for query in queries:
+            if not isinstance(query, dict):
+                query = {"query": query}
+            aggregate["queries"] += 1
+            for user in _users(query) or ["unknown"]:
+                aggregate["users"][user] += 1
+            text = " ".join(str(query.get("query") or "").split())
+            if text:
+                digest = hashlib.sha1(text.encode("utf-8")).hexdigest()
+                aggregate["query_counts"][digest] += 1
+                aggregate["query_text"].setdefault(digest, text[:MAX_QUERY_CHARS])
+
+        for join in record.get("joins") or []:
+            if not isinstance(join, dict):
+                continue
+            left = _column_name(join.get("tableColumn"))
+            for joined in join.get("joinedWith") or []:
+                right = _column_name(joined)
+                if left and right:
+                    aggregate["joins"][" = ".join(sorted((left, right)))] += 1
+    return aggregate
+
+
+def merge_aggregates(total: Dict[str, Any], part: Dict[str, Any]) -> Dict[str, Any]:
+    for key in ("records", "bad_lines", "queries"):
+        total[key] += part[key]
+    for key in ("tables", "users", "joins", "query_counts"):
+        total[key].update(part[key])
+    for digest, text in part["query_text"].items():
+        total["query_text"].setdefault(digest, text)
+    if part["first_date"] is not None and (total["first_date"] is None or part["first_date"] < total["first_date"]):
+        total["first_date"] = part["first_date"]
+    if part["last_date"] is not None and (total["last_date"] is None or part["last_date"] > total["last_date"]):
+        total["last_date"] = part["last_date"]
+    return total
+
+
+def aggregate_usage(path: str, workers: int = USAGE_WORKERS, chunk_lines: int = USAGE_CHUNK_LINES) -> Dict[str, Any]:
+    """
+    It streams the staging file (or directory) of the table-usage stage and aggregates its chunks
+    in `workers` processes. At most two chunks per worker are read ahead, so memory stays bounded
+    by the chunk size and the number of distinct tables, users, joins and queries.
+    
+    :param path: The `filename` of the stage, e.g. /tmp/snowflake_usage
+    :type path: str
+    :param workers: Number of worker processes, 1 to aggregate in the calling thread
+    :type workers: int
+    :param chunk_lines: Lines per chunk
+    :type chunk_lines: int
+    :return: The merged aggregate
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No usage staging file at {path}")
+    chunks = iter_line_chunks(iter_staging_files(path), chunk_lines)
+    total = empty_aggregate()
+    first, second = next(chunks, None), next(chunks, None)
+    if workers <= 1 or second is None:
+        #A file of a single chunk is not worth starting the worker processes
+        for chunk in itertools.chain((first, second), chunks):
+            if chunk is not None:
+                merge_aggregates(total, aggregate_chunk(chunk))
+        return total
+    chunks = itertools.chain((first, second), chunks)
+
+    #The service runs threads, so the workers are spawned rather than forked from it
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        pending = set()
+        for chunk in chunks:
+            pending.add(pool.submit(aggregate_chunk, chunk))
+            if len(pending) >= workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    merge_aggregates(total, future.result())
+        for future in pending:
+            merge_aggregates(total, future.result())
+    return total
+
+
+def usage_summary(aggregate: Dict[str, Any], top: int) -> Dict[str, Any]:
+    """
+    It turns an aggregate into the compact summary stored for the dashboards: the totals and the
+    `top` most frequent tables, users, joins and queries
+    """
+    def ranked(counter: Counter, key: str) -> List[Dict[str, Any]]:
+        return [{key: name, "count": count} for name, count in counter.most_common(top)]
+
+    return {
+        "records": aggregate["records"],
+        "bad_lines": aggregate["bad_lines"],
+        "queries": aggregate["queries"],
+        "first_date": aggregate["first_date"],
+        "last_date": aggregate["last_date"],
+        "distinct": {"tables": len(aggregate["tables"]), "users": len(aggregate["users"]),
+                     "joins": len(aggregate["joins"]), "queries": len(aggregate["query_counts"])},
+        "tables": ranked(aggregate["tables"], "table"),
+        "users": ranked(aggregate["users"], "user"),
+        "joins": ranked(aggregate["joins"], "join"),
+        "top_queries": [{"query_hash": digest, "query": aggregate["query_text"][digest], "count": count}
+                        for digest, count in aggregate["query_counts"].most_common(top)],
+    }
@@ -0,0 +1,104 @@
+import json
+import os
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy import inspect
+from sqlalchemy.orm import Session
+
+import app.models.table_model as models
+from app.models.usage_summary_model import UsageSummary
+from app.services.usage_aggregation import USAGE_WORKERS, aggregate_usage, iter_staging_files, usage_summary
+
+#The `filename` of the stage and bulkSink of the usage YAML written by /ingest/snowflake/usage/create_yaml
+USAGE_STAGING_PATH = os.getenv("RUNML_USAGE_STAGING_PATH", "/tmp/snowflake_usage")
+#Entries kept in each ranked list of a summary
+USAGE_SUMMARY_TOP = int(os.getenv("RUNML_USAGE_SUMMARY_TOP", "100"))
+
+
+def staging_signature(path: str) -> Dict[str, Any]:
+    """
+    It returns the total size and the newest modification time of the staging files at `path`
+    """
+    stats = [os.stat(name) for name in iter_staging_files(path)]
+    return {"source_bytes": sum(stat.st_size for stat in stats),
+            "source_mtime": max((stat.st_mtime for stat in stats), default=0.0)}
+
+
+def _usage_result(db: Session, usage_result_id: Optional[int], dbservice_fqn: Optional[str]):
+    if usage_result_id is not None:
+        row = db.get(models.UsageIngestionEntity, usage_result_id)
+        if row is None:
+            raise ValueError(f"No usage result with id {usage_result_id}")
+        return row
+    query = db.query(models.UsageIngestionEntity)
+    if dbservice_fqn is not None and "dbservice_fqn" in inspect(models.UsageIngestionEntity).columns:
+        query = query.filter(models.UsageIngestionEntity.dbservice_fqn == dbservice_fqn)
+    primary_key = inspect(models.UsageIngestionEntity).primary_key[0]
+    return query.order_by(getattr(models.UsageIngestionEntity, primary_key.key).desc()).first()
+
+
+def summarize_usage(db: Session, path: str = USAGE_STAGING_PATH, usage_result_id: Optional[int] = None,
+                    dbservice_fqn: Optional[str] = None, force: bool = False,
+                    workers: int = USAGE_WORKERS) -> Tuple[UsageSummary, bool]:
+    """
+    It aggregates the staging file of a usage run and stores its summary, linked to the usage result
+    of the run. A staging file already summarized for that result, with the same size and
+    modification time, is not read again unless `force` is set.
+    
+    :param db: Session = Depends(get_db)
+    :type db: Session
+    :param path: The staging file or directory of the table-usage stage
+    :type path: str
+    :param usage_result_id: Primary key of the UsageIngestionEntity row, the newest row (of
+    `dbservice_fqn` when given) when None
+    :type usage_result_id: Optional[int]
+    :param dbservice_fqn: The database service of the run
+    :type dbservice_fqn: Optional[str]
+    :param force: Aggregate the file even when it was already summarized
+    :type force: bool
+    :param workers: Number of processes aggregating the chunks of the file
+    :type workers: int
+    :return: A tuple (summary row, True when the file was aggregated by this call)
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No usage staging file at {path}")
+    result = _usage_result(db, usage_result_id, dbservice_fqn)
+    result_id = inspect(result).identity[0] if result is not None else None
+    if dbservice_fqn is None and result is not None:
+        dbservice_fqn = getattr(result, "dbservice_fqn", None)
+    signature = staging_signature(path)
+
+    if not force:
+        existing = db.query(UsageSummary).filter(
+            UsageSummary.usage_result_id.is_(None) if result_id is None else UsageSummary.usage_result_id == result_id,
+            UsageSummary.source_path == path,
+            UsageSummary.source_bytes == signature["source_bytes"],
+            UsageSummary.source_mtime == signature["source_mtime"],
+        ).order_by(UsageSummary.id.desc()).first()
+        if existing is not None:
+            return existing, False
+
+    start = time.perf_counter()
+    summary = usage_summary(aggregate_usage(path, workers), USAGE_SUMMARY_TOP)
+    row = UsageSummary(usage_result_id=result_id, dbservice_fqn=dbservice_fqn, source_path=path,
+                       records=summary["records"], queries=summary["queries"], summary=json.dumps(summary),
+                       seconds=round(time.perf_counter() - start, 4), **signature)
+    db.add(row)
+    db.commit()
+    db.refresh(row)
+    return row, True
+
+
+def latest_usage_summary(db: Session, usage_result_id: Optional[int] = None,
+                         dbservice_fqn: Optional[str] = None) -> Optional[UsageSummary]:
+    """
+    It returns the newest summary of a usage result or of a database service, served by the
+    (usage_result_id, id) and (dbservice_fqn, id) indexes
+    """
+    query = db.query(UsageSummary)
+    if usage_result_id is not None:
+        query = query.filter(UsageSummary.usage_result_id == usage_result_id)
+    if dbservice_fqn is not None:
+        query = query.filter(UsageSummary.dbservice_fqn == dbservice_fqn)
+    return query.order_by(UsageSummary.id.desc()).first()
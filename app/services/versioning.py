@@ -0,0 +1,54 @@
+from sqlalchemy import Integer, cast, func, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.models.version_model import VERSIONED_FQN_COLUMNS, VersionCounter
+
+
+def _increment(db: Session, table_name: str, fqn: str):
+    """
+    It bumps the counter of (table_name, fqn) and reads the new value back. The UPDATE locks the
+    counter row until the surrounding transaction ends, so concurrent writers are serialized on it.
+    
+    :return: The allocated version, or None when the counter does not exist yet
+    """
+    counters = VersionCounter.__table__
+    key = (counters.c.table_name == table_name) & (counters.c.fqn == fqn)
+    bumped = db.execute(counters.update().where(key).values(last_version=counters.c.last_version + 1))
+    if not bumped.rowcount:
+        return None
+    return db.execute(select(counters.c.last_version).where(key)).scalar()
+
+
+def next_version(db: Session, model, fqn: str) -> int:
+    """
+    It allocates the next integer version of `fqn` in the versioned table of `model`. The cost is a
+    single counter row update, whatever the length of the history. The allocation is part of the
+    caller's transaction, so a rolled back save does not consume a version.
+    
+    :param db: Session = Depends(get_db)
+    :type db: Session
+    :param model: One of the versioned user-details entities (e.g. models.UserDetailsIngestion)
+    :param fqn: The dbservice_fqn / driftservice_fqn the version belongs to
+    :type fqn: str
+    :return: The version number, starting from 1
+    """
+    table_name = model.__tablename__
+    allocated = _increment(db, table_name, fqn)
+    if allocated is not None:
+        return allocated
+
+    #First save of this fqn since the counters were introduced, or since a purge removed its counter.
+    #The counter is seeded once from the highest "vN" already stored so that existing histories carry on;
+    #counting the rows would hand out a version that exists once some rows were deleted.
+    fqn_column = VERSIONED_FQN_COLUMNS[model]
+    seed = (db.query(func.max(cast(func.substr(model.version, 2), Integer)))
+            .filter(fqn_column == fqn, model.version.like("v%"))
+            .scalar()) or 0
+    try:
+        with db.begin_nested():
+            db.add(VersionCounter(table_name=table_name, fqn=fqn, last_version=seed + 1))
+        return seed + 1
+    except IntegrityError:
+        #Another writer created the counter first, take the next value from it
+        return _increment(db, table_name, fqn)
@@ -0,0 +1,339 @@
+import json
+import os
+import re
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional
+
+from app.schemas.schemas import SnowflakeIngestionYaml, SnowflakeProfilerYaml, SnowflakeUsageYaml
+
+#Directory the workflow YAMLs are written to, as /tmp/{file_name}.yaml
+YAML_DIR = os.getenv("RUNML_YAML_DIR", "/tmp")
+#fsync every YAML before it is renamed into place ("1"), the rename alone already keeps readers from
+#seeing a partial file
+YAML_FSYNC = os.getenv("RUNML_YAML_FSYNC", "0") == "1"
+#Threads rendering and writing the configs of a batch
+YAML_WORKERS = int(os.getenv("RUNML_YAML_WORKERS", "8"))
+#Most configs accepted by one batch request
+MAX_YAML_BATCH = int(os.getenv("RUNML_YAML_MAX_BATCH", "1000"))
+
+#The request schema of the create_yaml endpoint of each workflow type
+WORKFLOW_CONFIG_SCHEMAS = {
+    "metadata": SnowflakeIngestionYaml,
+    "usage": SnowflakeUsageYaml,
+    "profiler": SnowflakeProfilerYaml,
+}
+
+_WORKFLOW_CONFIG_SERVER = {
+    "openMetadataServerConfig": {
+        "hostPort": "http://localhost:8585/api",
+        "authProvider": "no-auth"
+    }
+}
+
+
+class Field:
+    """
+    A value of the template filled in with the field `name` of the request details
+    """
+    __slots__ = ("name",)
+
+    def __init__(self, name: str):
+        self.name = name
+
+
+class Format:
+    """
+    A string of the template built from the request details with str.format, e.g. "{database}.*"
+    """
+    __slots__ = ("pattern",)
+
+    def __init__(self, pattern: str):
+        self.pattern = pattern
+
+
+def _connection() -> Dict[str, Any]:
+    return {
+        "config": {
+            "type": "Snowflake",
+            "account": Field("host"),
+            "username": Field("username"),
+            "password": Field("password"),
+            "database": Field("database"),
+            "warehouse": Field("warehouse")
+        }
+    }
+
+
+#The workflow configs written by the create_yaml endpoints, one template per workflow type
+WORKFLOW_TEMPLATES = {
+    "metadata": {
+        "source": {
+            "type": "snowflake",
+            "serviceName": Field("dbservice_name"),
+            "serviceConnection": _connection(),
+            "sourceConfig": {
+                "config": {
+                    "includeTables": Field("include_tables"),
+                    "includeViews": Field("include_views"),
+                    "schemaFilterPattern": {
+                        "includes": [Format("{schema_pattern}.*")]
+                    }
+                }
+            }
+        },
+        "sink": {
+            "type": "metadata-rest",
+            "config": {}
+        },
+        "workflowConfig": _WORKFLOW_CONFIG_SERVER
+    },
+    "usage": {
+        "source": {
+            "type": "snowflake-usage",
+            "serviceName": Field("dbservice_name"),
+            "serviceConnection": _connection(),
+            "sourceConfig": {
+                "config": {
+                    "queryLogDuration": Field("queryLogDuration"),
+                    "resultLimit": Field("resultLimit")
+                }
+            }
+        },
+        "processor": {
+            "type": "query-parser",
+            "config": {}
+        },
+        "stage": {
+            "type": "table-usage",
+            "config": {
+                "filename": "/tmp/snowflake_usage"
+            }
+        },
+        "bulkSink": {
+            "type": "metadata-usage",
+            "config": {
+                "filename": "/tmp/snowflake_usage"
+            }
+        },
+        "workflowConfig": _WORKFLOW_CONFIG_SERVER
+    },
+    "profiler": {
+        "source": {
+            "type": "snowflake",
+            "serviceName": Field("dbservice_name"),
+            "serviceConnection": _connection(),
+            "sourceConfig": {
+                "config": {
+                    "type": "Profiler",
+                    "generateSampleData": True,
+                    "fqnFilterPattern": {
+                        "includes": [Format("{dbservice_name}.{database}")]
+                    }
+                }
+            }
+        },
+        "processor": {
+            "type": "orm-profiler",
+            "config": {
+                "test_suite": {
+                    "name": Field("test_suite_name"),
+                    "tests": [{
+                        "table": Format("{dbservice_name}.{database}.{testing_table_schema}.{testing_table_name}"),
+                        "profile_sample": 50,
+                        "table_tests": [{
+                            "testCase": {
+                                "tableTestType": Field("first_table_test_type"),
+                                "config": {"value": Field("first_table_test_value")}
+                            }
+                        }],
+                        "column_tests": [{
+                            "columnName": Field("testing_column_name"),
+                            "testCase": {
+                                "columnTestType": Field("column_test_type"),
+                                "config": {
+                                    "minValue": Field("column_test_min_value"),
+                                    "maxValue": Field("column_test_max_value")
+                                }
+                            }
+                        }]
+                    }]
+                }
+            }
+        },
+        "sink": {
+            "type": "metadata-rest",
+            "config": {}
+        },
+        "workflowConfig": _WORKFLOW_CONFIG_SERVER
+    },
+}
+
+
+def yaml_dumper():
+    """
+    It returns the C accelerated safe dumper of PyYAML when it was built with libyaml, the pure
+    Python one otherwise
+    """
+    import yaml
+    return getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+
+
+class CompiledTemplate:
+    """
+    A workflow template dumped to YAML once, with a marker in place of every request value. Rendering
+    only joins the YAML text between the markers with the values, each written as a YAML flow scalar.
+    """
+
+    def __init__(self, template: Dict[str, Any]):
+        import yaml
+        slots = []
+
+        def mark(node):
+            if isinstance(node, dict):
+                return {key: mark(value) for key, value in node.items()}
+            if isinstance(node, list):
+                return [mark(value) for value in node]
+            if isinstance(node, (Field, Format)):
+                slots.append(node)
+                return f"runml_slot_{len(slots) - 1}_"
+            return node
+
+        text = yaml.dump(mark(template), Dumper=yaml_dumper(), default_flow_style=False, sort_keys=True)
+        #The keys are sorted by the dumper, so the markers are read back in the order of the text
+        pieces = re.split(r"runml_slot_(\d+)_", text)
+        self.segments: List[str] = pieces[0::2]
+        self.slots: List[Any] = [slots[int(index)] for index in pieces[1::2]]
+        if len(self.slots) != len(slots):
+            raise ValueError("The YAML of the template lost some of its values")
+        self.fields = sorted({slot.name for slot in slots if isinstance(slot, Field)})
+
+    def render(self, values: Dict[str, Any]) -> str:
+        parts = [self.segments[0]]
+        for slot, segment in zip(self.slots, self.segments[1:]):
+            value = values[slot.name] if isinstance(slot, Field) else slot.pattern.format(**values)
+            parts.append(yaml_scalar(value))
+            parts.append(segment)
+        return "".join(parts)
+
+
+#Text JSON can quote for YAML: PyYAML refuses most C1 controls and the surrogates in a stream,
+#reads \x85 as a line break and the \u escapes of surrogate pairs as two characters
+_JSON_SAFE_TEXT = re.compile("[^\x7f-\x9f\ud800-\udfff\ufffe\uffff]*")
+
+
+def yaml_scalar(value: Any) -> str:
+    """
+    It writes a value as YAML on a single line: JSON for text, integers, booleans and null (JSON
+    scalars are YAML flow scalars), the YAML dumper in flow style for anything else (floats, whose
+    exponent form differs, lists and dicts)
+    """
+    if value is None or isinstance(value, (bool, int)):
+        return json.dumps(value)
+    if isinstance(value, str) and _JSON_SAFE_TEXT.fullmatch(value):
+        return json.dumps(value, ensure_ascii=False)
+    import yaml
+    return yaml.dump(value, Dumper=yaml_dumper(), default_flow_style=True, width=1 << 30).strip().replace("\n...", "")
+
+
+@lru_cache(maxsize=None)
+def compiled_template(workflow_type: str) -> CompiledTemplate:
+    if workflow_type not in WORKFLOW_TEMPLATES:
+        raise ValueError(f"Workflow type must be one of {list(WORKFLOW_TEMPLATES)}")
+    return CompiledTemplate(WORKFLOW_TEMPLATES[workflow_type])
+
+
+def render_workflow_config(workflow_type: str, details: Dict[str, Any]) -> str:
+    """
+    It renders the workflow YAML of a service from the precompiled template of its type
+    
+    :param workflow_type: "metadata", "usage" or "profiler"
+    :type workflow_type: str
+    :param details: The fields of the create_yaml request (SnowflakeIngestionYaml, ...)
+    :type details: Dict[str, Any]
+    :return: The YAML text
+    """
+    return compiled_template(workflow_type).render(details)
+
+
+def yaml_path(file_name: str) -> str:
+    if not file_name or os.path.basename(file_name) != file_name or file_name in (".", ".."):
+        raise ValueError(f"Invalid file name '{file_name}'")
+    return os.path.join(YAML_DIR, f"{file_name}.yaml")
+
+
+def write_atomic(path: str, text: str) -> None:
+    """
+    It writes `text` to a temporary file next to `path` and renames it over `path`, so that a
+    workflow reading the file sees either the previous config or the new one, never a partial one
+    """
+    directory = os.path.dirname(path) or "."
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(text)
+            if YAML_FSYNC:
+                f.flush()
+                os.fsync(f.fileno())
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+def write_workflow_config(workflow_type: str, details: Dict[str, Any]) -> str:
+    """
+    It renders the workflow YAML of a service and writes it atomically to /tmp/{file_name}.yaml
+    
+    :param workflow_type: "metadata", "usage" or "profiler"
+    :type workflow_type: str
+    :param details: The fields of the create_yaml request, file_name included
+    :type details: Dict[str, Any]
+    :return: The path of the YAML
+    """
+    path = yaml_path(details["file_name"])
+    write_atomic(path, render_workflow_config(workflow_type, details))
+    return path
+
+
+def write_workflow_configs(items: List[Dict[str, Any]], workers: int = YAML_WORKERS,
+                           on_written: Optional[Callable[[str, str], Any]] = None) -> List[Dict[str, Any]]:
+    """
+    It validates, renders and writes many workflow YAMLs in parallel. A failing item does not stop
+    the others.
+    
+    :param items: Dicts with the workflow_type of each config and its details, shaped like the
+    request of the create_yaml endpoint of that type
+    :type items: List[Dict[str, Any]]
+    :param workers: Number of threads rendering and writing the configs
+    :type workers: int
+    :param on_written: Called with (workflow_type, path) for every written config, its return value
+    is reported as the job of the item (e.g. to submit the workflow)
+    :return: One result per item, in the order of `items`
+    """
+    def write(index_item):
+        index, item = index_item
+        try:
+            workflow_type = item["workflow_type"]
+            if workflow_type not in WORKFLOW_CONFIG_SCHEMAS:
+                raise ValueError(f"Workflow type must be one of {list(WORKFLOW_CONFIG_SCHEMAS)}")
+            details = WORKFLOW_CONFIG_SCHEMAS[workflow_type].parse_obj(item["details"]).dict()
+            path = write_workflow_config(workflow_type, details)
+            result = {"index": index, "status": "Success", "path": path}
+            if on_written is not None:
+                result["job"] = on_written(workflow_type, path)
+            return result
+        except KeyError as e:
+            return {"index": index, "status": "Failed", "error": f"Missing field {e}"}
+        except Exception as e:
+            return {"index": index, "status": "Failed", "error": f"{e}"}
+
+    if len(items) <= 1 or workers <= 1:
+        return [write(pair) for pair in enumerate(items)]
+    with ThreadPoolExecutor(max_workers=min(workers, len(items))) as pool:
+        return list(pool.map(write, enumerate(items)))
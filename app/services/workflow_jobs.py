@@ -0,0 +1,296 @@
+import json
+import os
+import shlex
+import subprocess
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+import app.models.table_model as models
+from app.schemas.schemas import MetadataIngestRow, ProfilingResultsRow, UsageResultsRow
+from app.services.batch_ingest import bulk_insert
+
+#Command line run for each workflow type, {config} is replaced by the YAML path.
+#Override with RUNML_WORKFLOW_COMMAND_METADATA / _USAGE / _PROFILER, e.g. to run a stub executable.
+WORKFLOW_COMMANDS = {
+    "metadata": os.getenv("RUNML_WORKFLOW_COMMAND_METADATA", "metadata ingest -c {config}"),
+    "usage": os.getenv("RUNML_WORKFLOW_COMMAND_USAGE", "metadata usage -c {config}"),
+    "profiler": os.getenv("RUNML_WORKFLOW_COMMAND_PROFILER", "metadata profile -c {config}"),
+}
+
+#Result table and row schema each workflow type records its outcome into
+WORKFLOW_RESULTS = {
+    "metadata": (models.MetadataIngestionEntity, MetadataIngestRow),
+    "usage": (models.UsageIngestionEntity, UsageResultsRow),
+    "profiler": (models.ProfilingEntity, ProfilingResultsRow),
+}
+
+#Result row recorded for every finished job submitted without one, {service_fqn} is the service of the job
+DEFAULT_RESULT_TEMPLATES = {
+    "metadata": {"dbservice_fqn": "{service_fqn}", "status": "{status}"},
+    "usage": {"dbservice_fqn": "{service_fqn}", "status": "{status}"},
+    "profiler": {"dbservice_fqn": "{service_fqn}", "test_type": "workflowRun", "result": "{status}", "value": "{duration}"},
+}
+
+#Workflows running at the same time, in total and per database service
+MAX_RUNNING = int(os.getenv("RUNML_JOBS_MAX_RUNNING", "4"))
+MAX_RUNNING_PER_SERVICE = int(os.getenv("RUNML_JOBS_MAX_PER_SERVICE", "1"))
+#Jobs waiting for a slot before new submissions are refused
+MAX_QUEUED = int(os.getenv("RUNML_JOBS_MAX_QUEUED", "100"))
+#Finished jobs kept for the status endpoints
+JOB_HISTORY = int(os.getenv("RUNML_JOBS_HISTORY", "500"))
+#Seconds a workflow may run before it is stopped, 0 for no limit
+JOB_TIMEOUT = float(os.getenv("RUNML_JOBS_TIMEOUT", "0"))
+LOG_DIR = os.getenv("RUNML_JOBS_LOG_DIR", "/tmp/runml_jobs")
+
+FINISHED = ("Succeeded", "Failed", "Cancelled")
+
+
+def default_result_template(workflow_type: str) -> Dict[str, Any]:
+    """
+    It returns the result row recorded for jobs submitted without one: RUNML_JOBS_RESULT_TEMPLATE_<TYPE>
+    (a JSON object) when it is set, DEFAULT_RESULT_TEMPLATES otherwise
+    """
+    template = os.getenv(f"RUNML_JOBS_RESULT_TEMPLATE_{workflow_type.upper()}")
+    return json.loads(template) if template else DEFAULT_RESULT_TEMPLATES[workflow_type]
+
+
+def config_service(config_path: str) -> Optional[str]:
+    """
+    It reads the service a workflow YAML runs against (source.serviceName), None when the file
+    cannot be read
+    """
+    try:
+        import yaml
+        with open(config_path) as f:
+            return str(yaml.safe_load(f)["source"]["serviceName"])
+    except Exception:
+        return None
+
+
+def fill_placeholders(template: Any, context: Dict[str, Any]) -> Any:
+    """
+    It replaces {name} placeholders of `context` inside the string values of a result template.
+    A value made of a single placeholder takes the type of the context value.
+    """
+    if isinstance(template, dict):
+        return {key: fill_placeholders(value, context) for key, value in template.items()}
+    if isinstance(template, list):
+        return [fill_placeholders(value, context) for value in template]
+    if isinstance(template, str):
+        for name, value in context.items():
+            if template == "{" + name + "}":
+                return value
+            template = template.replace("{" + name + "}", str(value))
+    return template
+
+
+class WorkflowJob:
+    def __init__(self, workflow_type: str, config_path: str, result_template: Dict[str, Any], service_fqn: str):
+        self.job_id = uuid.uuid4().hex
+        self.workflow_type = workflow_type
+        self.config_path = config_path
+        self.service_fqn = service_fqn
+        self.result_template = result_template
+        self.status = "Queued"
+        self.exit_code = None
+        self.error = None
+        self.result_recorded = False
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.log_path = os.path.join(LOG_DIR, f"{self.job_id}.log")
+        self.process: Optional[subprocess.Popen] = None
+        self.cancel_requested = False
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.job_id, "workflow_type": self.workflow_type, "config_path": self.config_path,
+            "service_fqn": self.service_fqn, "status": self.status, "exit_code": self.exit_code, "error": self.error,
+            "result_recorded": self.result_recorded, "submitted_at": self.submitted_at,
+            "started_at": self.started_at, "finished_at": self.finished_at, "log_path": self.log_path,
+        }
+
+
+class WorkflowJobManager:
+    """
+    It runs the generated ingestion, usage and profiler workflows as separate processes, at most
+    `max_running` at a time and at most `max_running_per_service` against the same database service,
+    whatever their workflow type. Jobs beyond those limits wait in a FIFO queue, a job of a busy service
+    does not hold back the jobs of the others. The outcome of every finished job is recorded in the
+    result table of its type.
+    """
+
+    def __init__(self, session_factory: Callable[[], Session], max_running: int = MAX_RUNNING,
+                 max_running_per_service: int = MAX_RUNNING_PER_SERVICE, max_queued: int = MAX_QUEUED):
+        self.session_factory = session_factory
+        self.max_running = max(1, max_running)
+        self.max_running_per_service = max(1, max_running_per_service)
+        self.max_queued = max_queued
+        self._queue: "deque[WorkflowJob]" = deque()
+        self._running: Dict[str, int] = {}
+        self._jobs: "OrderedDict[str, WorkflowJob]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, workflow_type: str, config_path: str, result_template: Optional[Dict[str, Any]] = None,
+               service_fqn: Optional[str] = None) -> WorkflowJob:
+        """
+        It queues a workflow run of the YAML at `config_path`
+        
+        :param workflow_type: "metadata", "usage" or "profiler"
+        :type workflow_type: str
+        :param config_path: Path of the workflow YAML
+        :type config_path: str
+        :param result_template: The result row to record once the job ends; {job_id}, {service_fqn},
+        {status}, {exit_code}, {duration} and {config_path} placeholders are filled in
+        :param service_fqn: The database service the workflow runs against, read from the YAML when not given
+        :type service_fqn: Optional[str]
+        :return: The queued job
+        """
+        if workflow_type not in WORKFLOW_COMMANDS:
+            raise ValueError(f"Workflow type must be one of {list(WORKFLOW_COMMANDS)}")
+        #A YAML whose service cannot be read is only limited against the runs of the same file
+        service_fqn = service_fqn or config_service(config_path) or config_path
+        job = WorkflowJob(workflow_type, config_path,
+                          result_template if result_template is not None else default_result_template(workflow_type),
+                          service_fqn)
+        with self._lock:
+            if len(self._queue) >= self.max_queued:
+                raise RuntimeError("Too many queued jobs, try again later")
+            self._jobs[job.job_id] = job
+            self._queue.append(job)
+            self._forget_old_jobs()
+        self._dispatch()
+        return job
+
+    def get(self, job_id: str) -> Optional[WorkflowJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self, status: Optional[str] = None, workflow_type: Optional[str] = None,
+             service_fqn: Optional[str] = None) -> List[Dict[str, Any]]:
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return [job.to_dict() for job in jobs
+                if (status is None or job.status == status) and (workflow_type is None or job.workflow_type == workflow_type)
+                and (service_fqn is None or job.service_fqn == service_fqn)]
+
+    def cancel(self, job_id: str) -> Optional[WorkflowJob]:
+        """
+        It drops a queued job, or terminates the process of a running one
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.status in FINISHED:
+                return job
+            job.cancel_requested = True
+            dropped = job.status == "Queued"
+            if dropped:
+                self._queue.remove(job)
+                job.status = "Cancelled"
+                job.finished_at = time.time()
+            process = job.process
+        if dropped:
+            self._record_result(job)
+        elif process is not None:
+            process.terminate()
+        return job
+
+    def shutdown(self) -> None:
+        """
+        It cancels every queued and running job, e.g. when the service stops
+        """
+        with self._lock:
+            job_ids = [job.job_id for job in self._jobs.values() if job.status not in FINISHED]
+        for job_id in job_ids:
+            self.cancel(job_id)
+
+    def tail(self, job_id: str, lines: int = 100) -> Optional[List[str]]:
+        """
+        It returns the last `lines` lines written by the workflow, reading the log as a stream
+        """
+        job = self.get(job_id)
+        if job is None:
+            return None
+        if not os.path.exists(job.log_path):
+            return []
+        with open(job.log_path, errors="replace") as f:
+            return [line.rstrip("\n") for line in deque(f, maxlen=max(1, lines))]
+
+    def _forget_old_jobs(self) -> None:
+        finished = [job_id for job_id, job in self._jobs.items() if job.status in FINISHED]
+        for job_id in finished[:max(0, len(self._jobs) - JOB_HISTORY)]:
+            del self._jobs[job_id]
+
+    def _dispatch(self) -> None:
+        started = []
+        with self._lock:
+            for job in list(self._queue):
+                if sum(self._running.values()) >= self.max_running:
+                    break
+                if self._running.get(job.service_fqn, 0) >= self.max_running_per_service:
+                    continue
+                self._queue.remove(job)
+                job.status = "Running"
+                job.started_at = time.time()
+                self._running[job.service_fqn] = self._running.get(job.service_fqn, 0) + 1
+                started.append(job)
+        for job in started:
+            threading.Thread(target=self._run, args=(job,), name=f"workflow-{job.job_id}", daemon=True).start()
+
+    def _run(self, job: WorkflowJob) -> None:
+        try:
+            os.makedirs(LOG_DIR, exist_ok=True)
+            command = [part.replace("{config}", job.config_path)
+                       for part in shlex.split(WORKFLOW_COMMANDS[job.workflow_type])]
+            with open(job.log_path, "w") as log:
+                with self._lock:
+                    if job.cancel_requested:
+                        raise InterruptedError("Cancelled before start")
+                    job.process = subprocess.Popen(command, stdout=log, stderr=subprocess.STDOUT)
+                try:
+                    job.exit_code = job.process.wait(timeout=JOB_TIMEOUT or None)
+                except subprocess.TimeoutExpired:
+                    job.process.kill()
+                    job.exit_code = job.process.wait()
+                    job.error = f"Timed out after {JOB_TIMEOUT} seconds"
+            if job.cancel_requested:
+                job.status = "Cancelled"
+            else:
+                job.status = "Succeeded" if job.exit_code == 0 and job.error is None else "Failed"
+        except InterruptedError:
+            job.status = "Cancelled"
+        except Exception as e:
+            job.status = "Failed"
+            job.error = f"{e}"
+        finally:
+            job.finished_at = time.time()
+            job.process = None
+            with self._lock:
+                self._running[job.service_fqn] -= 1
+                if not self._running[job.service_fqn]:
+                    del self._running[job.service_fqn]
+            self._record_result(job)
+            self._dispatch()
+
+    def _record_result(self, job: WorkflowJob) -> None:
+        model, schema = WORKFLOW_RESULTS[job.workflow_type]
+        context = {"job_id": job.job_id, "service_fqn": job.service_fqn, "status": job.status, "exit_code": job.exit_code,
+                   "duration": round((job.finished_at or time.time()) - (job.started_at or job.submitted_at), 3),
+                   "config_path": job.config_path}
+        row = fill_placeholders(job.result_template, context)
+        try:
+            db = self.session_factory()
+            try:
+                summary = bulk_insert(db, model, schema, [row])
+            finally:
+                db.close()
+            job.result_recorded = summary["Inserted"] == 1
+            if not job.result_recorded:
+                job.error = job.error or summary["Results"][0].get("error")
+        except Exception as e:
+            job.error = job.error or f"Result not recorded: {e}"
@@ -0,0 +1,252 @@
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import inspect
+from sqlalchemy.orm import Session
+
+from app.services.alerts import alert_engine
+from app.services.json_responses import row_dict
+from app.services.metrics import (WRITE_BEHIND_FLUSH_LATENCY, WRITE_BEHIND_FLUSH_ROWS, WRITE_BEHIND_QUEUE_DEPTH,
+                                  WRITE_BEHIND_ROWS)
+from app.services.rollups import record_rollups, stamp_created_at
+
+#Queue the rows of the single result endpoints and insert them in batches ("1"), instead of one
+#commit per request
+WRITE_BEHIND = os.getenv("RUNML_WRITE_BEHIND", "0") == "1"
+#"flush" answers once the batch holding the row is committed, many requests sharing one commit;
+#"enqueue" answers as soon as the row is queued, the rows still queued are lost if the worker crashes
+WRITE_BEHIND_DURABILITY = os.getenv("RUNML_WRITE_BEHIND_DURABILITY", "flush")
+#Milliseconds a batch waits for more rows after its first one
+WRITE_BEHIND_FLUSH_MS = float(os.getenv("RUNML_WRITE_BEHIND_FLUSH_MS", "20"))
+#Most rows inserted by one batch, a full batch is written without waiting
+WRITE_BEHIND_MAX_ROWS = int(os.getenv("RUNML_WRITE_BEHIND_MAX_ROWS", "500"))
+#Most rows queued, a request finding the queue full waits RUNML_WRITE_BEHIND_ENQUEUE_TIMEOUT seconds
+#for room and then fails
+WRITE_BEHIND_QUEUE_SIZE = int(os.getenv("RUNML_WRITE_BEHIND_QUEUE_SIZE", "10000"))
+WRITE_BEHIND_ENQUEUE_TIMEOUT = float(os.getenv("RUNML_WRITE_BEHIND_ENQUEUE_TIMEOUT", "5"))
+#Seconds a "flush" request waits for its batch to be committed
+WRITE_BEHIND_COMMIT_TIMEOUT = float(os.getenv("RUNML_WRITE_BEHIND_COMMIT_TIMEOUT", "30"))
+#Seconds the shutdown waits for the queued rows to be written
+WRITE_BEHIND_DRAIN_SECONDS = float(os.getenv("RUNML_WRITE_BEHIND_DRAIN_SECONDS", "30"))
+
+DURABILITY_LEVELS = ("enqueue", "flush")
+
+write_behind_log = logging.getLogger("runml.write_behind")
+
+
+class BufferFull(Exception):
+    pass
+
+
+class _Pending:
+    __slots__ = ("model", "row", "received_at", "future")
+
+    def __init__(self, model, row: Dict[str, Any]):
+        self.model = model
+        self.row = row
+        self.received_at = datetime.utcnow()
+        self.future: Future = Future()
+
+
+class WriteBehindBuffer:
+    """
+    A bounded in-process queue of results rows, written by a background thread every
+    RUNML_WRITE_BEHIND_FLUSH_MS milliseconds or RUNML_WRITE_BEHIND_MAX_ROWS rows, whichever comes
+    first, with one transaction (and one commit to wait for) per batch. The rows of rolled up results
+    are added to their rollups in the same transaction.
+    """
+
+    def __init__(self, session_factory: Callable[[], Session], durability: str = WRITE_BEHIND_DURABILITY,
+                 flush_ms: float = WRITE_BEHIND_FLUSH_MS, max_rows: int = WRITE_BEHIND_MAX_ROWS,
+                 queue_size: int = WRITE_BEHIND_QUEUE_SIZE):
+        if durability not in DURABILITY_LEVELS:
+            raise ValueError(f"Write-behind durability must be one of {list(DURABILITY_LEVELS)}")
+        self.session_factory = session_factory
+        self.durability = durability
+        self.flush_seconds = max(0.0, flush_ms) / 1000
+        self.max_rows = max(1, max_rows)
+        self._queue: "queue.Queue[_Pending]" = queue.Queue(maxsize=max(1, queue_size))
+        self._closing = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._stats_lock = threading.Lock()
+        self._stats = {"batches": 0, "rows": 0, "failed": 0, "last_flush_seconds": None, "max_flush_seconds": 0.0}
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive() and not self._closing.is_set()
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._closing.clear()
+        self._thread = threading.Thread(target=self._flush_loop, name="write-behind", daemon=True)
+        self._thread.start()
+
+    def shutdown(self, timeout: float = WRITE_BEHIND_DRAIN_SECONDS) -> int:
+        """
+        It stops taking rows and waits for the queued ones to be written
+        
+        :return: The number of rows left unwritten when the timeout expired
+        """
+        self._closing.set()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+            if not self._thread.is_alive():
+                #Rows queued by requests racing the shutdown, after the thread saw an empty queue
+                while not self._queue.empty():
+                    self._flush(self._next_batch())
+        left = self._queue.qsize()
+        if left:
+            write_behind_log.error("%s queued results rows were not written before the shutdown", left)
+        return left
+
+    def submit(self, model, row: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        It queues a results row. With the "flush" durability it waits for the row to be committed
+        and returns its column values, id and created_at included; with "enqueue" it returns None
+        as soon as the row is queued.
+        
+        :param model: The ORM entity of the results table (e.g. models.ProfilingEntity)
+        :param row: The column values of the row
+        :type row: Dict[str, Any]
+        :return: The saved row, or None when it was only queued
+        """
+        if not self.running:
+            raise RuntimeError("The write-behind buffer is not running")
+        pending = _Pending(model, row)
+        #Stamped before the row is shared with the writer thread
+        stamp_created_at(model, [row], pending.received_at)
+        try:
+            self._queue.put(pending, timeout=WRITE_BEHIND_ENQUEUE_TIMEOUT)
+        except queue.Full:
+            WRITE_BEHIND_ROWS.inc(model.__tablename__, "rejected")
+            raise BufferFull(f"The write-behind queue is full ({self._queue.maxsize} rows)")
+        WRITE_BEHIND_QUEUE_DEPTH.set(self._queue.qsize())
+        if self.durability == "enqueue":
+            return None
+        try:
+            return pending.future.result(timeout=WRITE_BEHIND_COMMIT_TIMEOUT)
+        except TimeoutError:
+            raise TimeoutError(f"The row was queued but not committed within {WRITE_BEHIND_COMMIT_TIMEOUT} seconds")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        return {**stats, "running": self.running, "durability": self.durability, "queue_depth": self._queue.qsize(),
+                "queue_size": self._queue.maxsize, "flush_ms": self.flush_seconds * 1000, "max_rows": self.max_rows}
+
+    def _next_batch(self) -> List[_Pending]:
+        try:
+            first = self._queue.get(timeout=max(self.flush_seconds, 0.05))
+        except queue.Empty:
+            return []
+        batch = [first]
+        deadline = time.monotonic() + self.flush_seconds
+        while len(batch) < self.max_rows:
+            remaining = deadline - time.monotonic()
+            try:
+                #While closing, the queue is drained without waiting for more rows
+                if remaining <= 0 or self._closing.is_set():
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        WRITE_BEHIND_QUEUE_DEPTH.set(self._queue.qsize())
+        return batch
+
+    def _flush_loop(self) -> None:
+        while True:
+            batch = self._next_batch()
+            if batch:
+                self._flush(batch)
+            elif self._closing.is_set() and self._queue.empty():
+                return
+
+    def _flush(self, batch: List[_Pending]) -> None:
+        start = time.perf_counter()
+        try:
+            saved = self._write(batch)
+        except Exception as e:
+            if len(batch) > 1:
+                #One bad row must not fail the others: they are written one by one
+                write_behind_log.warning("Batch of %s results rows failed (%s), writing them one by one", len(batch), e)
+                for pending in batch:
+                    self._flush([pending])
+                return
+            pending = batch[0]
+            write_behind_log.error("Results row of %s not saved: %s", pending.model.__tablename__, e)
+            WRITE_BEHIND_ROWS.inc(pending.model.__tablename__, "failed")
+            with self._stats_lock:
+                self._stats["failed"] += 1
+            pending.future.set_exception(e)
+            return
+        elapsed = time.perf_counter() - start
+        WRITE_BEHIND_FLUSH_LATENCY.observe(elapsed)
+        WRITE_BEHIND_FLUSH_ROWS.observe(len(batch))
+        with self._stats_lock:
+            self._stats["batches"] += 1
+            self._stats["rows"] += len(batch)
+            self._stats["last_flush_seconds"] = round(elapsed, 6)
+            self._stats["max_flush_seconds"] = round(max(self._stats["max_flush_seconds"], elapsed), 6)
+        for pending, row in zip(batch, saved):
+            WRITE_BEHIND_ROWS.inc(pending.model.__tablename__, "written")
+            pending.future.set_result(row)
+
+    def _write(self, batch: List[_Pending]) -> List[Optional[Dict[str, Any]]]:
+        """
+        It inserts a batch in one transaction and, for the "flush" durability, reads the saved rows
+        back with one query per table. Only a failed commit fails the batch: the alert rules and
+        the read back run once it is committed, and a failure of theirs must not get the batch
+        written again.
+        """
+        with self.session_factory() as db:
+            objects, keys = self._commit(db, batch)
+            for model, rows in _by_model(batch).items():
+                try:
+                    alert_engine.observe(model, [pending.row for pending in rows], rows[0].received_at)
+                except Exception:
+                    write_behind_log.exception("Alert rules not checked for %s saved rows of %s", len(rows), model.__tablename__)
+            if self.durability == "enqueue":
+                return [None] * len(batch)
+            try:
+                for model, model_keys in keys.items():
+                    #Loads the expired rows, server defaults (created_at) included, in one query per table
+                    db.query(model).filter(inspect(model).primary_key[0].in_(model_keys)).all()
+                return [row_dict(obj) for obj in objects]
+            except Exception:
+                write_behind_log.exception("Saved results rows not read back, answering with the values sent")
+                return [dict(pending.row) for pending in batch]
+
+    def _commit(self, db: Session, batch: List[_Pending]) -> Tuple[List[Any], Dict[Any, List[Any]]]:
+        """
+        It inserts the rows of a batch with their rollups and commits them
+        
+        :return: A tuple (the saved objects in the order of the batch, their primary keys per model)
+        """
+        objects = [pending.model(**pending.row) for pending in batch]
+        db.add_all(objects)
+        by_model = _by_model(batch)
+        db.flush()
+        #Last, so that the buckets shared with concurrent writers are only locked until the commit
+        for model, rows in by_model.items():
+            record_rollups(db, model, [pending.row for pending in rows], rows[0].received_at)
+        keys = {}
+        for model in by_model:
+            primary_key = inspect(model).primary_key[0]
+            keys[model] = [getattr(obj, primary_key.key) for obj in objects if isinstance(obj, model)]
+        db.commit()
+        return objects, keys
+
+
+def _by_model(batch: List[_Pending]) -> Dict[Any, List[_Pending]]:
+    by_model: Dict[Any, List[_Pending]] = {}
+    for pending in batch:
+        by_model.setdefault(pending.model, []).append(pending)
+    return by_model
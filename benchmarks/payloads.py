@@ -0,0 +1,71 @@
+import random
+import typing
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from fastapi.routing import APIRoute
+from pydantic import BaseModel
+
+
+def body_schema(app, path: str, method: str = "POST"):
+    """
+    It returns the pydantic model of the request body of a route, None when it has no model body
+    """
+    for route in app.routes:
+        if isinstance(route, APIRoute) and route.path == path and method in route.methods:
+            if route.body_field is not None and isinstance(route.body_field.type_, type) \
+                    and issubclass(route.body_field.type_, BaseModel):
+                return route.body_field.type_
+            return None
+    raise KeyError(f"No {method} route at {path}")
+
+
+def _value(annotation, name: str, index: int, rng: random.Random, depth: int):
+    origin = typing.get_origin(annotation)
+    if origin is typing.Union:
+        options = [arg for arg in typing.get_args(annotation) if arg is not type(None)]
+        return _value(options[0], name, index, rng, depth) if options else None
+    if origin in (list, typing.List, set, tuple):
+        args = typing.get_args(annotation)
+        return [_value(args[0] if args else str, name, index + offset, rng, depth) for offset in range(3)]
+    if origin in (dict, typing.Dict):
+        return {f"{name}_key": f"{name}_{index}"}
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return synthesize(annotation, index, rng=rng, depth=depth + 1) if depth < 3 else {}
+    if annotation is bool:
+        return index % 2 == 0
+    if annotation is int:
+        return rng.randint(0, 10 ** 6)
+    if annotation is float:
+        return round(rng.random(), 6)
+    if annotation is datetime:
+        return datetime.utcnow().isoformat()
+    return f"{name}_{index}"
+
+
+def synthesize(schema, index: int, overrides: Optional[Dict[str, Any]] = None, rng: Optional[random.Random] = None,
+               depth: int = 0) -> Dict[str, Any]:
+    """
+    It builds a payload accepted by a pydantic model: every field gets a value of its type, derived
+    from the field name and `index`, unless `overrides` sets it. Fields of the overrides that the
+    model does not declare are left out, so the same overrides can be used with every schema.
+    
+    :param schema: The pydantic model of the route (e.g. SnowflakeUserDetails)
+    :param index: Number of the payload, makes the string fields unique
+    :type index: int
+    :param overrides: Values to use for some of the fields (e.g. the seeded project_name)
+    :type overrides: Optional[Dict[str, Any]]
+    :param rng: Source of the numeric values, seeded by the caller for reproducible runs
+    :type rng: Optional[random.Random]
+    :return: The payload as a dict ready to be sent as JSON
+    """
+    rng = rng or random.Random(index)
+    overrides = overrides or {}
+    payload = {}
+    for name, field in schema.__fields__.items():
+        key = field.alias or name
+        if name in overrides:
+            payload[key] = overrides[name]
+        else:
+            payload[key] = _value(field.outer_type_, name, index, rng, depth)
+    return payload
@@ -0,0 +1,349 @@
+"""
+Load test of the RunML API.
+
+The FastAPI app of main.py is booted in process against a throwaway database: a SQLite file by
+default, or any SQLAlchemy URL given with --database-url (e.g. an ephemeral Postgres container).
+Projects, tasks, config versions and results are seeded first, then every scenario below is driven
+with --requests requests spread over --concurrency threads. Throughput and p50/p95/p99 latencies are
+reported per scenario and compared with the stored baseline; the run fails (exit code 1) when a
+scenario got slower than the baseline by more than --tolerance, and (exit code 2) when there is no
+baseline to compare with, unless --allow-missing-baseline is given.
+
+    python benchmarks/run_benchmarks.py                  # run and compare with benchmarks/baseline.json
+    python benchmarks/run_benchmarks.py --save-baseline  # run and store the results as the baseline
+
+Request payloads are built from the pydantic schemas of the routes (see payloads.py). Not driven:
+/drift/compute and /drift/sketch/* (they read dataset files), /jobs/submit and /jobs/{job_id}/* (they
+start workflow processes) and /rollups/{source}/rebuild (maintenance).
+"""
+import argparse
+import json
+import math
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from payloads import body_schema, synthesize  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+#Settings that must match for a run to be compared with the baseline
+COMPARED_SETTINGS = ("projects", "tasks", "versions", "results", "requests", "concurrency", "batch_size", "dialect")
+
+
+def boot(database_url: str):
+    """
+    It points the app at the benchmark database before main.py is imported, so the tables are
+    created there and every session of the app, the read-only routes included, uses it
+    """
+    os.environ["RUNML_DATABASE_URL"] = database_url
+    #The reads are measured against the same database as the writes
+    os.environ.pop("RUNML_REPLICA_DATABASE_URL", None)
+
+    import main
+
+    return main, main.engine
+
+
+class Scenario:
+    def __init__(self, name: str, method: str, path: str, build: Callable[[int], Dict[str, Any]]):
+        self.name, self.method, self.path, self.build = name, method, path, build
+
+
+class Workload:
+    """
+    The seeded data and the request builders of every scenario
+    """
+    def __init__(self, app, settings: Dict[str, Any]):
+        self.app = app
+        self.settings = settings
+        self.pairs = [(f"bench_project_{p}", f"bench_task_{t}")
+                      for p in range(settings["projects"]) for t in range(settings["tasks"])]
+        self.service_fqns = [f"{project}||{task}||bench_service" for project, task in self.pairs]
+        self.drift_fqns = [f"{project}.{task}.bench_drift" for project, task in self.pairs]
+        self.started = datetime.utcnow()
+
+    def rng(self, index: int) -> random.Random:
+        return random.Random(f"{self.settings['seed']}:{index}")
+
+    def schema(self, path: str):
+        return body_schema(self.app, path)
+
+    def config(self, path: str, index: int, pair_index: int) -> Dict[str, Any]:
+        project, task = self.pairs[pair_index % len(self.pairs)]
+        overrides = {"project_name": project, "task_name": task, "dbservice_name": "bench_service",
+                     "drift_type": "bench_drift"}
+        return synthesize(self.schema(path), index, overrides, self.rng(index))
+
+    def result(self, path: str, index: int) -> Dict[str, Any]:
+        pick = index % len(self.pairs)
+        overrides = {"dbservice_fqn": self.service_fqns[pick], "driftservice_fqn": self.drift_fqns[pick],
+                     "feature_name": f"feature_{index % 20}", "table_name": f"table_{index % 10}",
+                     "column_name": f"column_{index % 50}"}
+        return synthesize(self.schema(path), index, overrides, self.rng(index))
+
+    def results(self, path: str, start: int, count: int) -> List[Dict[str, Any]]:
+        return [self.result(path, start + offset) for offset in range(count)]
+
+    def yaml(self, path: str, index: int) -> Dict[str, Any]:
+        return synthesize(self.schema(path), index, {"file_name": f"runml_bench_{index % 100}"}, self.rng(index))
+
+    def scenarios(self) -> List[Scenario]:
+        batch = self.settings["batch_size"]
+        #Offsets keep the payloads of the timed runs apart from the seeded ones
+        fresh = 10 ** 6
+        single_results = (
+            ("ingest_result", "/ingest/ingest_result"),
+            ("usage_result", "/ingest/usage_result"),
+            ("profiling_result", "/profiler/profiling_result"),
+            ("drift_output", "/drift/output_details"),
+        )
+        saves = (
+            ("save_ingestion_config", "/ingest/snowflake/metadata_details"),
+            ("save_usage_config", "/ingest/snowflake/usage_details"),
+            ("save_profiling_config", "/profiler/snowflake/input_details"),
+            ("save_drift_config", "/drift/input_details"),
+        )
+        lookups = (
+            ("choose_ingestion_config", "/ingest/metadata/choose_Row", "dbservice_fqn", self.service_fqns),
+            ("choose_usage_config", "/ingest/usage/choose_Row", "dbservice_fqn", self.service_fqns),
+            ("choose_profiling_config", "/profiler/choose_Row", "dbservice_fqn", self.service_fqns),
+            ("choose_drift_config", "/drift/choose_Row", "driftservice_fqn", self.drift_fqns),
+        )
+        yamls = (
+            ("ingestion_yaml", "/ingest/snowflake/create_yaml", "metadata"),
+            ("usage_yaml", "/ingest/snowflake/usage/create_yaml", "usage"),
+            ("profiler_yaml", "/profiler/snowflake/create_yaml", "profiler"),
+        )
+        since = (self.started - timedelta(days=1)).isoformat()
+
+        scenarios = [
+            Scenario("project_create", "POST", "/project/create",
+                     lambda i: {"json": synthesize(self.schema("/project/create"), i, {"project_name": f"bench_new_project_{i}"})}),
+            Scenario("task_create", "POST", "/task/create",
+                     lambda i: {"json": synthesize(self.schema("/task/create"), i,
+                                                   {"project_name": self.pairs[0][0], "task_name": f"bench_new_task_{i}"})}),
+        ]
+        scenarios += [Scenario(name, "POST", path, lambda i, path=path: {"json": self.config(path, fresh + i, i)})
+                      for name, path in saves]
+        scenarios += [Scenario(name, "POST", path, lambda i, key=key, fqns=fqns: {"params": {key: fqns[i % len(fqns)]}})
+                      for name, path, key, fqns in lookups]
+        scenarios += [Scenario(name, "POST", path, lambda i, path=path: {"json": self.yaml(path, i)}) for name, path, _ in yamls]
+        scenarios.append(Scenario("yaml_batch", "POST", "/workflow_configs/batch", lambda i: {"json": [
+            {"workflow_type": yamls[k % len(yamls)][2], "details": self.yaml(yamls[k % len(yamls)][1], i * batch + k)}
+            for k in range(batch)]}))
+        scenarios += [Scenario(name, "POST", path, lambda i, path=path: {"json": self.result(path, fresh + i)})
+                      for name, path in single_results]
+        scenarios += [Scenario(f"{name}_batch", "POST", f"{path}/batch",
+                               lambda i, path=path: {"json": self.results(path, fresh + i * batch, batch)})
+                      for name, path in single_results]
+        scenarios += [
+            Scenario("drift_output_stream", "POST", "/drift/output_details/stream",
+                     lambda i: {"params": {"upload_id": f"bench_upload_{i}"},
+                                "content": "\n".join(json.dumps(row) for row in
+                                                     self.results("/drift/output_details", fresh + i * batch, batch))}),
+            Scenario("drift_output_stream_progress", "GET", "/drift/output_details/stream/{upload_id}",
+                     lambda i: {"path": f"/drift/output_details/stream/bench_upload_{i}"}),
+            Scenario("history_configs", "GET", "/history/{resource}",
+                     lambda i: {"path": "/history/ingestion_configs",
+                                "params": {"fqn": self.service_fqns[i % len(self.service_fqns)], "limit": 20}}),
+            Scenario("history_results", "GET", "/history/{resource}",
+                     lambda i: {"path": "/history/drift_results", "params": {"limit": 100}}),
+            Scenario("rollups_drift", "GET", "/rollups/{source}",
+                     lambda i: {"path": "/rollups/drift", "params": {"start": since}}),
+            Scenario("rollups_profiling", "GET", "/rollups/{source}",
+                     lambda i: {"path": "/rollups/profiling", "params": {"start": since}}),
+            Scenario("jobs_list", "GET", "/jobs", lambda i: {}),
+            Scenario("cache_stats", "GET", "/cache/stats", lambda i: {}),
+            Scenario("metrics", "GET", "/metrics", lambda i: {}),
+            Scenario("task_delete", "POST", "/task/delete",
+                     lambda i: {"json": synthesize(self.schema("/task/delete"), i,
+                                                   {"project_name": self.pairs[0][0], "task_name": f"bench_new_task_{i}"})}),
+            Scenario("project_delete", "POST", "/project/delete",
+                     lambda i: {"json": synthesize(self.schema("/project/delete"), i, {"project_name": f"bench_new_project_{i}"})}),
+        ]
+        return scenarios
+
+
+def _failed(response) -> bool:
+    """
+    Handlers catch their exceptions and answer 200, so the error bodies count as failures too
+    """
+    if response.status_code >= 400:
+        return True
+    head = response.content[:512].lstrip()
+    return head.startswith(b'{"Error"') or (head.startswith(b"[") and b'"Error: ' in head)
+
+
+def seed(client, workload: Workload, settings: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    It creates the projects, tasks, config versions and results the scenarios read and write
+    """
+    start = time.perf_counter()
+    failures = 0
+    for project in sorted({project for project, _ in workload.pairs}):
+        failures += _failed(client.post("/project/create", json=synthesize(workload.schema("/project/create"), 0,
+                                                                             {"project_name": project})))
+    for project, task in workload.pairs:
+        failures += _failed(client.post("/task/create", json=synthesize(workload.schema("/task/create"), 0,
+                                                                          {"project_name": project, "task_name": task})))
+    for path in ("/ingest/snowflake/metadata_details", "/ingest/snowflake/usage_details",
+                 "/profiler/snowflake/input_details", "/drift/input_details"):
+        for version in range(settings["versions"]):
+            for pair_index in range(len(workload.pairs)):
+                index = version * len(workload.pairs) + pair_index
+                failures += _failed(client.post(path, json=workload.config(path, index, pair_index)))
+    for path in ("/ingest/ingest_result", "/ingest/usage_result", "/profiler/profiling_result", "/drift/output_details"):
+        for offset in range(0, settings["results"], 500):
+            rows = workload.results(path, offset, min(500, settings["results"] - offset))
+            response = client.post(f"{path}/batch", json=rows)
+            failures += _failed(response) or response.json().get("Failed", 0) > 0
+    return {"seconds": round(time.perf_counter() - start, 2), "failures": failures}
+
+
+def percentile(latencies: List[float], p: float) -> float:
+    if not latencies:
+        return 0.0
+    return latencies[max(0, math.ceil(p / 100 * len(latencies)) - 1)]
+
+
+def run_scenario(app, scenario: Scenario, requests: int, concurrency: int) -> Dict[str, Any]:
+    from fastapi.testclient import TestClient
+
+    local = threading.local()
+
+    def call(index: int):
+        client = getattr(local, "client", None)
+        if client is None:
+            client = local.client = TestClient(app)
+        kwargs = scenario.build(index)
+        path = kwargs.pop("path", scenario.path)
+        start = time.perf_counter()
+        response = client.request(scenario.method, path, **kwargs)
+        return time.perf_counter() - start, _failed(response)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(call, range(requests)))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(latency for latency, _ in outcomes)
+    return {
+        "requests": requests,
+        "errors": sum(1 for _, failed in outcomes if failed),
+        "throughput": round(requests / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+    }
+
+
+def compare(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """
+    It lists the scenarios that regressed: p50 or p95 latency above, or throughput below, the
+    baseline by more than `tolerance`, or more errors than the baseline
+    """
+    regressions = []
+    for name, current in results.items():
+        previous = baseline["scenarios"].get(name)
+        if previous is None:
+            continue
+        for key in ("p50_ms", "p95_ms"):
+            if current[key] > previous[key] * (1 + tolerance):
+                regressions.append(f"{name}: {key} {current[key]} > baseline {previous[key]}")
+        if current["throughput"] < previous["throughput"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {current['throughput']} < baseline {previous['throughput']}")
+        if current["errors"] > previous["errors"]:
+            regressions.append(f"{name}: errors {current['errors']} > baseline {previous['errors']}")
+    return regressions
+
+
+def print_report(results: Dict[str, Dict[str, Any]]) -> None:
+    print(f"{'scenario':<32}{'requests':>10}{'errors':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, result in results.items():
+        print(f"{name:<32}{result['requests']:>10}{result['errors']:>8}{result['throughput']:>10}"
+              f"{result['p50_ms']:>10}{result['p95_ms']:>10}{result['p99_ms']:>10}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Load test of the RunML API")
+    parser.add_argument("--database-url", help="SQLAlchemy URL of a throwaway database (a temporary SQLite file by default)")
+    parser.add_argument("--projects", type=int, default=10)
+    parser.add_argument("--tasks", type=int, default=5, help="Tasks per project")
+    parser.add_argument("--versions", type=int, default=10, help="Config versions per task and config type")
+    parser.add_argument("--results", type=int, default=10000, help="Seeded rows per results table")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--batch-size", type=int, default=100, help="Rows per batch and stream request")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--scenarios", help="Comma separated names of the scenarios to run (all by default)")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="Store the results as the baseline")
+    parser.add_argument("--allow-missing-baseline", action="store_true",
+                        help="Succeed without comparing when there is no baseline yet")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown against the baseline")
+    parser.add_argument("--report", help="Also write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="runml_bench_")
+    database_url = args.database_url or f"sqlite:///{os.path.join(workdir, 'bench.db')}?timeout=30"
+    #The create_yaml routes write their YAMLs next to the database, removed with it
+    os.environ["RUNML_YAML_DIR"] = workdir
+    try:
+        main_module, engine = boot(database_url)
+        from fastapi.testclient import TestClient
+
+        settings = {"projects": args.projects, "tasks": args.tasks, "versions": args.versions,
+                    "results": args.results, "requests": args.requests, "concurrency": args.concurrency,
+                    "batch_size": args.batch_size, "seed": args.seed, "dialect": engine.dialect.name}
+        workload = Workload(main_module.app, settings)
+        selected = set(args.scenarios.split(",")) if args.scenarios else None
+
+        results = {}
+        with TestClient(main_module.app) as client:
+            seeding = seed(client, workload, settings)
+            print(f"Seeded in {seeding['seconds']} s ({seeding['failures']} failed requests)")
+            for scenario in workload.scenarios():
+                if selected is None or scenario.name in selected:
+                    results[scenario.name] = run_scenario(main_module.app, scenario, args.requests, args.concurrency)
+        print_report(results)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {"recorded_at": datetime.utcnow().isoformat(), "settings": settings, "scenarios": results}
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}, run with --save-baseline to record one")
+        return 0 if args.allow_missing_baseline else 2
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    mismatched = [key for key in COMPARED_SETTINGS if baseline["settings"].get(key) != settings[key]]
+    if mismatched:
+        print(f"The baseline was recorded with different {', '.join(mismatched)}, the runs cannot be compared")
+        return 2
+    regressions = compare(results, baseline, args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,20 +1,103 @@
-from fastapi import FastAPI, Depends
+#Imported first so that the startup report covers the import of everything below
+from app.services.startup import startup_report
+from fastapi import FastAPI, Depends, Body, Query, Request
+from fastapi.responses import PlainTextResponse
+from typing import List, Optional
+from datetime import datetime
 import app.models.table_model as models
+import app.models.version_model
+import app.models.latest_model
+import app.models.sketch_model
+import app.models.history_model
+import app.models.rollup_model
+import app.models.schema_model
+import app.models.purge_model
+import app.models.usage_summary_model
+import app.models.partition_model
+import app.models.alert_model
 from app.schemas.schemas import *
-from app.databases.database import engine,get_db
+from app.schemas.drift_schemas import DriftComputeRequest, DriftSketchCompute, DriftSketchUpdate
+from app.schemas.job_schemas import WorkflowConfigRequest, WorkflowJobSubmit
+from app.schemas.alert_schemas import AlertRuleCreate
+from app.schemas.quality_schemas import LocalQualityTestRun
+from app.schemas.response_schemas import *
+from app.databases.routing import REPLICA_SCHEMA_SETUP, engine, get_db, get_read_db, has_replica, pool_stats, read_engine
+from app.databases.async_database import ASYNC_ROUTES_ENABLED
+from app.databases.schema_setup import ensure_schema
+from app.services.batch_ingest import BATCH_CHUNK_SIZE, bulk_insert
+from app.services.ndjson_stream import ingest_ndjson, stream_progress
+from app.services.config_store import latest_config, save_config
+from app.services.config_cache import latest_config_cache
+from app.services.registry import project_task_registry, registry_changed
+from app.services.history import history_page
+from app.services.rollups import rebuild_rollups, record_rollups, rollup_series, stamp_created_at
+from app.services.alerts import alert_engine, alert_event_dict, rule_dict
+from app.services.workflow_jobs import WorkflowJobManager
+from app.services.workflow_configs import MAX_YAML_BATCH, write_workflow_config, write_workflow_configs
+from app.services.purge import PurgeJobManager, purge_job_dict
+from app.services.retention import PartitionMaintenance
+from app.services.write_behind import WRITE_BEHIND, WriteBehindBuffer
+from app.services.usage_summaries import USAGE_STAGING_PATH, latest_usage_summary, summarize_usage
+from app.services.json_responses import FastJSONResponse, raw_json_document, row_dict
+from app.services.metrics import METRICS_ENABLED, MetricsMiddleware, install_sqlalchemy_hooks, render_metrics
 from sqlalchemy.orm import Session
-import uvicorn, json,yaml,time,requests
+import json
 
 #Let us create a FastAPI instance
-app = FastAPI()
+#Responses are rendered by orjson when it is installed (RUNML_JSON_RESPONSE=json for the standard library)
+app = FastAPI(default_response_class=FastJSONResponse)
 
-#Let us now call a method that creates our tables defined inside 'models'
-models.Base.metadata.create_all(bind=engine)
-#Argument  -- bind -- it is our 'engine'
-#Once this statement is run, all the tables are created inside the database of PostgreSQL
+#Per route latency, status and database work, served at /metrics (RUNML_METRICS=0 turns it off)
+if(METRICS_ENABLED):
+    app.add_middleware(MetricsMiddleware)
+    install_sqlalchemy_hooks(engine,read_engine)
 
+#The async handlers are served under /async next to the sync ones when RUNML_ASYNC_ROUTES=1
+if(ASYNC_ROUTES_ENABLED):
+    from app.routers.async_routes import router as async_router
+    app.include_router(async_router)
 
-@app.post("/project/create",tags = ["Project"])
+#Runs the generated workflow YAMLs in separate processes, see the WORKFLOW JOBS section
+workflow_jobs = WorkflowJobManager(lambda: Session(engine))
+#Runs the cascading purges of projects and tasks in the background, see the PURGE section
+purge_jobs = PurgeJobManager(lambda: Session(engine))
+#Creates the partitions of the results tables ahead of time and applies their retention, see the PARTITIONS section
+partition_maintenance = PartitionMaintenance(engine,lambda: Session(engine))
+#Batches the rows of the single result endpoints when RUNML_WRITE_BEHIND=1, see the WRITE BEHIND section
+write_behind = WriteBehindBuffer(lambda: Session(engine))
+
+startup_report.imported()
+
+#Importing this module does not touch the database, the schema is set up when the worker starts
+@app.on_event("startup")
+def setup_schema():
+    """
+    It creates the tables defined inside 'models' in the database, unless the schema fingerprint
+    stored by a previous start shows that nothing changed (see RUNML_SCHEMA_SETUP)
+    """
+    with startup_report.step("schema"):
+        startup_report.details["schema"] = ensure_schema(engine,models.Base.metadata)
+        if(REPLICA_SCHEMA_SETUP and has_replica()):
+            startup_report.details["replica_schema"] = ensure_schema(read_engine,models.Base.metadata)
+
+@app.on_event("startup")
+def warm_registry():
+    """
+    It loads the existing projects and tasks into the registry used to validate config saves
+    """
+    with startup_report.step("registry"):
+        with Session(engine) as db:
+            project_task_registry.warm(db)
+
+@app.on_event("startup")
+def report_startup():
+    """
+    It logs how long the worker took to get ready, see GET /startup
+    """
+    startup_report.ready()
+
+
+@app.post("/project/create",tags = ["Project"],responses=documented(either(ProjectCreated)))
 def create_row(proj:ProjectRow,db: Session = Depends(get_db)):
     """
     It takes in a ProjectRow object and creates a new row in the database
@@ -28,21 +111,22 @@ def create_row(proj:ProjectRow,db: Session = Depends(get_db)):
     try:
         project_dict = proj.dict()
         new_row = models.ProjectEntity(**project_dict)
-        proj_details = db.query(models.ProjectEntity).filter(models.ProjectEntity.project_name == proj.project_name)
-        if(not proj_details.count()):
+        project_exists, _ = project_task_registry.lookup(db,proj.project_name)
+        if(not project_exists):
             #Let us now add this row to the table
             db.add(new_row)
         
             #Let us now commit the changes made
             db.commit()
             db.refresh(new_row)
-            return {"Message":"Project Created Successfully","Project Details": new_row}
+            project_task_registry.add_project(proj.project_name)
+            return {"Message":"Project Created Successfully","Project Details": row_dict(new_row)}
         else:
-            return {"Message: Project creation failed. Please give a valid Project name."}
+            return {"Message": "Project creation failed. Please give a valid Project name."}
     except Exception as e:
-        return {f"Error: {e}","Message: Project Creation Failed"}
+        return {"Error": f"{e}","Message": "Project Creation Failed"}
 
-@app.post("/project/delete",tags=["Project"])
+@app.post("/project/delete",tags=["Project"],responses=documented(either()))
 def delete_row(row:ProjectRow,db: Session = Depends(get_db)):
     """
     We are deleting a row from the table
@@ -62,14 +146,17 @@ def delete_row(row:ProjectRow,db: Session = Depends(get_db)):
         #For this, we use 'delete()'
         my_row.delete(synchronize_session=False)
         #Argument -- synchronize_session = False
+        #The other workers reload their registry once they see the deletion
+        registry_changed(db)
         
         #Let us now commit the changes
         db.commit()
-        return {"Message: Project Deleted Successfully"}
+        project_task_registry.discard_project(row.project_name)
+        return {"Message": "Project Deleted Successfully"}
     except Exception as e:
-        return {f"Error: {e}","Message: Project Deletion Failed"}
+        return {"Error": f"{e}","Message": "Project Deletion Failed"}
 
-@app.post("/task/create",tags = ["Task"])
+@app.post("/task/create",tags = ["Task"],responses=documented(either(TaskCreated)))
 def create_row(row:TaskRow,db: Session = Depends(get_db)):
     """
     It creates a new row in the Task table if the project name is valid and the task name is unique
@@ -83,25 +170,25 @@ def create_row(row:TaskRow,db: Session = Depends(get_db)):
     try:
         task_dict = row.dict()
         new_row = models.TaskEntity(**task_dict)
-        proj_row = db.query(models.ProjectEntity).filter(models.ProjectEntity.project_name == row.project_name)
-        if(proj_row.count()):
-            task_row = db.query(models.TaskEntity).filter(models.TaskEntity.project_name == row.project_name).filter(models.TaskEntity.task_name == row.task_name)
-            if(not task_row.count()):            
+        project_exists, task_exists = project_task_registry.lookup(db,row.project_name,row.task_name)
+        if(project_exists):
+            if(not task_exists):
                 db.add(new_row)
                 db.commit()
                 db.refresh(new_row)
+                project_task_registry.add_task(row.project_name,row.task_name)
                 return {"Message": "Task Created Successfully",
-                "Task Details": new_row,
-                "Project Details":task_row.first()}
+                "Task Details": row_dict(new_row),
+                "Project Details":row_dict(new_row)}
             else:
-                return {"Message: Task creation failed. Please give a valid Task name."}
+                return {"Message": "Task creation failed. Please give a valid Task name."}
         else:
-            return {"Message: Task creation failed. Please give a valid Project name."}
+            return {"Message": "Task creation failed. Please give a valid Project name."}
                 
     except Exception as e:
-        return {f"Error: {e}","Message: Task Creation Failed"}
+        return {"Error": f"{e}","Message": "Task Creation Failed"}
 
-@app.post("/task/delete",tags=["Task"])
+@app.post("/task/delete",tags=["Task"],responses=documented(either()))
 def delete_row(row:TaskRow,db: Session = Depends(get_db)):
     """
     We are querying the table, filtering the row we want to delete, deleting it, and committing the
@@ -118,10 +205,12 @@ def delete_row(row:TaskRow,db: Session = Depends(get_db)):
         query = db.query(models.TaskEntity)
         my_row = query.filter(models.TaskEntity.task_name == row.task_name)
         my_row.delete(synchronize_session=False)
+        registry_changed(db)
         db.commit()
-        return {"Message: Task Deleted Successfully"}
+        project_task_registry.discard_task(row.task_name)
+        return {"Message": "Task Deleted Successfully"}
     except Exception as e:
-        return {f"Error: {e}","Message: Task Deletion Failed"}
+        return {"Error": f"{e}","Message": "Task Deletion Failed"}
 
 #_____________________________________________________________________________________________________________________________
 #_____________________________________________________________________________________________________________________________
@@ -131,7 +220,7 @@ def delete_row(row:TaskRow,db: Session = Depends(get_db)):
 #Let us now save the result of the ingestion process to a table
 #This API is run immediately after the ingestion process is completed.
 #It is best if we run this inside the inegstion process itself.
-@app.post("/ingest/ingest_result",tags = ["Metadata Ingestion"])
+@app.post("/ingest/ingest_result",tags = ["Metadata Ingestion"],responses=documented(either(RowAdded)))
 def ingest_results(details:MetadataIngestRow,db: Session = Depends(get_db)):
     """
     It takes a MetadataIngestRow object, converts it to a dictionary, creates a new
@@ -146,17 +235,43 @@ def ingest_results(details:MetadataIngestRow,db: Session = Depends(get_db)):
     """
     try:
         details_dict = details.dict()
+        #With RUNML_WRITE_BEHIND=1 the row is committed with the other rows of its batch, see the WRITE BEHIND section
+        if(write_behind.running):
+            saved = write_behind.submit(models.MetadataIngestionEntity,details_dict)
+            return {"Message": "Added Successfully" if(saved is not None) else "Queued for saving","Details": saved if(saved is not None) else details_dict}
         new_row = models.MetadataIngestionEntity(**details_dict)
         db.add(new_row)
         db.commit()
         db.refresh(new_row)
-        return {"Message: Added Successfully",f"Details:{new_row}"}
+        return {"Message": "Added Successfully","Details": row_dict(new_row)}
     except Exception as e:
-        return{f"Error: {e}", "Message: Addition Failed"}
+        return {"Error": f"{e}","Message": "Addition Failed"}
+
+@app.post("/ingest/ingest_result/batch",tags = ["Metadata Ingestion"],responses=documented(either(BatchResponse)))
+def ingest_results_batch(rows:List[dict] = Body(...),chunk_size:int = BATCH_CHUNK_SIZE,db: Session = Depends(get_db)):
+    """
+    It takes a list of MetadataIngestRow objects and inserts them into the MetadataIngestionEntity
+    table in chunks of `chunk_size` rows under a single transaction
+    
+    :param rows: The list of ingestion results, each one shaped like a MetadataIngestRow
+    :type rows: List[dict]
+    :param chunk_size: Number of rows written by a single insert statement
+    :type chunk_size: int
+    :param db: Session = Depends(get_db)
+    :type db: Session
+    :return: A dictionary with the inserted and failed counts and a success or error entry per item
+    """
+    try:
+        summary = bulk_insert(db,models.MetadataIngestionEntity,MetadataIngestRow,rows,chunk_size)
+        #Rendered here, so that the per-item results skip the jsonable_encoder pass of FastAPI
+        return FastJSONResponse({"Message": "Batch processed", **summary})
+    except Exception as e:
+        db.rollback()
+        return {"Error": f"{e}","Message": "Batch addition failed"}
 
 
 #Create an API to save user details
-@app.post("/ingest/snowflake/metadata_details",tags=['Snowflake Ingestion'])
+@app.post("/ingest/snowflake/metadata_details",tags=['Snowflake Ingestion'],responses=documented(either(ConfigSaved)))
 def ingest_snow_meta(details:SnowflakeUserDetails,db: Session = Depends(get_db)):
     """
     It takes in a `SnowflakeUserDetails` object, and saves it to the database
@@ -174,121 +289,75 @@ def ingest_snow_meta(details:SnowflakeUserDetails,db: Session = Depends(get_db))
 
         details_dict["dbservice_name"] = f"{details.project_name}||{details.task_name}||{details.dbservice_name}"
         
-        proj_row = db.query(models.ProjectEntity).filter(models.ProjectEntity.project_name == details.project_name)
-        if(proj_row.count()):
-            task_row = db.query(models.TaskEntity).filter(models.TaskEntity.project_name == details.project_name).filter(models.TaskEntity.task_name == details.task_name)
-            if(task_row.count()):
-                versions = db.query(models.UserDetailsIngestion).filter(models.UserDetailsIngestion.dbservice_fqn == details_dict["dbservice_name"])
+        project_exists, task_exists = project_task_registry.lookup(db,details.project_name,details.task_name)
+        if(project_exists):
+            if(task_exists):
                 final_dict = {
                     "project_name":details.project_name,
                     "task_name":details.task_name,
                     "user_details":json.dumps(details_dict),
-                    "dbservice_fqn":details_dict["dbservice_name"],
-                    "version":f"v{versions.count()+1}"
+                    "dbservice_fqn":details_dict["dbservice_name"]
                 }
     
-                new_row = models.UserDetailsIngestion(**final_dict)
-                db.add(new_row)
-                db.commit()
-                db.refresh(new_row)
-                return {"Message": "User details saved successfully","dbservice_fqn":final_dict["dbservice_fqn"]}
+                new_row, created = save_config(db,models.UserDetailsIngestion,final_dict)
+                return {"Message": "User details saved successfully" if(created) else "User details unchanged, latest version kept","dbservice_fqn":final_dict["dbservice_fqn"],"version":new_row.version,"Deduplicated":not created}
             else:
-                return {"Message: User details not saved. Please give a valid Task name."}
+                return {"Message": "User details not saved. Please give a valid Task name."}
         else:
-            return {"Message: User details not saved. Please give a valid Project name."}
+            return {"Message": "User details not saved. Please give a valid Project name."}
 
     except Exception as e:
         return {"Error": f"{e}","Message": "User details not saved"}
 
 #Let us return the row which contains the details of the metadata to be ingested
-@app.post("/ingest/metadata/choose_Row",tags=["Metadata Ingestion"])
-def ingest_metadata(dbservice_fqn:str,db: Session = Depends(get_db)):
+@app.post("/ingest/metadata/choose_Row",tags=["Metadata Ingestion"],responses=documented(either(ServiceConfig)))
+def ingest_metadata(dbservice_fqn:str,db: Session = Depends(get_read_db)):
     """
     It returns the latest metadata row for a given database service
     
     :param dbservice_fqn: This is the name of the database service that you want to ingest metadata from
     :type dbservice_fqn: str
-    :param db: Session = Depends(get_db)
+    :param db: Session = Depends(get_read_db)
     :type db: Session
     :return: The return value is a dict with two keys.
     """
     try:
-        meta_row = db.query(models.UserDetailsIngestion).filter(models.UserDetailsIngestion.dbservice_fqn == dbservice_fqn)
-        if(meta_row.count()):
-            all_rows = meta_row.order_by(models.UserDetailsIngestion.created_at.desc())
-            return all_rows.first()
+        latest_row = latest_config(db,models.UserDetailsIngestion,dbservice_fqn)
+        if(latest_row is not None):
+            #The saved user_details JSON text is sent as it is, without being parsed and encoded again
+            return raw_json_document(latest_row,"user_details")
         else:
             return {"Message":"No databaseService exists by the given name."}
     except Exception as e:
-        return {f"Error: {e}","Message: Metadata Ingestion not possible."}
+        return {"Error": f"{e}","Message": "Metadata Ingestion not possible."}
 
 #Create a Yaml file
-@app.post("/ingest/snowflake/create_yaml",tags = ["Snowflake Ingestion"])
-def ingest_metadata(details:SnowflakeIngestionYaml):
+@app.post("/ingest/snowflake/create_yaml",tags = ["Snowflake Ingestion"],responses=documented(either(YamlCreated)))
+def ingest_metadata(details:SnowflakeIngestionYaml,run_workflow:bool = False):
     """
     It takes in a dictionary of details and creates a yaml file with the details
     
     :param details: SnowflakeIngestionYaml
     :type details: SnowflakeIngestionYaml
+    :param run_workflow: Also submit the YAML to the workflow job runner
+    :type run_workflow: bool
     :return: A dictionary with two keys: Message and Path.
     """
-    ingestion_dict = {
-        "source": {
-            "type":'snowflake',
-            "serviceName": details.dbservice_name,
-            "serviceConnection": {
-            "config": {
-                "type": "Snowflake",
-                "account": details.host,
-                "username": details.username,
-                "password": details.password,
-                "database": details.database,
-                "warehouse": details.warehouse
-                
-            }
-            },
-            "sourceConfig": {
-            "config":{
-                "includeTables": details.include_tables,
-                
-                "includeViews":  details.include_views,
-                "schemaFilterPattern":{
-                "includes": [f"{details.schema_pattern}.*"]
-                }
-                
-            
-                
-            }
-            }
-        },
-        "sink": {
-            "type": "metadata-rest",
-            "config": {}
-        },
-        "workflowConfig": {
-            "openMetadataServerConfig": {
-            "hostPort": "http://localhost:8585/api",
-            "authProvider": "no-auth"
-            }
-        }
-        }
-    ingestion_yaml = yaml.dump(data=ingestion_dict)
-    try:
-        with open(f"/tmp/{details.file_name}.yaml","w") as f:
-            f.write(ingestion_yaml)
-        yaml_path = {"path":f"/tmp/{details.file_name}.yaml"}
+    #The YAML is rendered from a template compiled once per workflow type, and renamed into place once written
+    try:
+        yaml_path = {"path":write_workflow_config("metadata",details.dict())}
+        if(run_workflow):
+            return {"Message":"Yaml Successfully Created", "Path":yaml_path, "Job":submit_workflow("metadata",yaml_path["path"])}
         return {"Message":"Yaml Successfully Created", "Path":yaml_path}
-        # return on_success_response(201,"Successfully written to Yaml",data=yaml_path)
-    except:
-        # return on_error_response(401,"Write Operation Failed",data=None)
-        return {"Message":"Yaml Creation Failed"}
+    except Exception as e:
+        return {"Error": f"{e}","Message":"Yaml Creation Failed"}
 
 
 
 #_____________________________________________________________________________________________________________________________
 #_____________________________________________________________________________________________________________________________
 #SNOWFLAKE USAGE
-@app.post("/ingest/snowflake/usage_details",tags=['Snowflake Usage'])
+@app.post("/ingest/snowflake/usage_details",tags=['Snowflake Usage'],responses=documented(either(ConfigSaved)))
 def ingest_snow_meta(details:SnowflakeUsageDetails,db: Session = Depends(get_db)):
     """
     It takes in a `SnowflakeUsageDetails` object, and saves it to the database
@@ -305,123 +374,69 @@ def ingest_snow_meta(details:SnowflakeUsageDetails,db: Session = Depends(get_db)
         details_dict = details.dict()
         details_dict["dbservice_name"] = f"{details.project_name}||{details.task_name}||{details.dbservice_name}"
         
-        proj_row = db.query(models.ProjectEntity).filter(models.ProjectEntity.project_name == details.project_name)
-        if(proj_row.count()):
-            task_row = db.query(models.TaskEntity).filter(models.TaskEntity.project_name == details.project_name).filter(models.TaskEntity.task_name == details.task_name)
-            if(task_row.count()):
-                versions = db.query(models.UserDetailsUsageIngestion).filter(models.UserDetailsUsageIngestion.dbservice_fqn == details_dict["dbservice_name"])
+        project_exists, task_exists = project_task_registry.lookup(db,details.project_name,details.task_name)
+        if(project_exists):
+            if(task_exists):
                 final_dict = {
                     "project_name":details.project_name,
                     "task_name":details.task_name,
                     "user_details":json.dumps(details_dict),
-                    "dbservice_fqn":details_dict["dbservice_name"],
-                    "version":f"v{versions.count()+1}"
+                    "dbservice_fqn":details_dict["dbservice_name"]
                 }
     
-                new_row = models.UserDetailsUsageIngestion(**final_dict)
-                db.add(new_row)
-                db.commit()
-                db.refresh(new_row)
-                return {"Message": "User details saved successfully","dbservice_fqn":final_dict["dbservice_fqn"]}
+                new_row, created = save_config(db,models.UserDetailsUsageIngestion,final_dict)
+                return {"Message": "User details saved successfully" if(created) else "User details unchanged, latest version kept","dbservice_fqn":final_dict["dbservice_fqn"],"version":new_row.version,"Deduplicated":not created}
             else:
-                return {"Message: User details not saved. Please give a valid Task name."}
+                return {"Message": "User details not saved. Please give a valid Task name."}
         else:
-            return {"Message: User details not saved. Please give a valid Project name."}
+            return {"Message": "User details not saved. Please give a valid Project name."}
 
     except Exception as e:
-        return {f"Error: {e}","Message: User details not saved"}
+        return {"Error": f"{e}","Message": "User details not saved"}
 
-@app.post("/ingest/snowflake/usage/create_yaml",tags = ["Snowflake Usage"])
-def ingest_usage(details:SnowflakeUsageYaml):
+@app.post("/ingest/snowflake/usage/create_yaml",tags = ["Snowflake Usage"],responses=documented(either(YamlCreated)))
+def ingest_usage(details:SnowflakeUsageYaml,run_workflow:bool = False):
     """
     It takes in a dictionary of details and creates a yaml file in the /tmp directory
     
     :param details: SnowflakeUsageYaml = SnowflakeUsageYaml(
     :type details: SnowflakeUsageYaml
+    :param run_workflow: Also submit the YAML to the workflow job runner
+    :type run_workflow: bool
     :return: A dictionary with two keys: Message and Path.
     """
-    usage_dict = {
-            "source": {
-                "type": "snowflake-usage",
-                "serviceName": details.dbservice_name,
-                "serviceConnection": {
-                    "config": {
-                        "type": "Snowflake",
-                        "account": details.host,
-                        "username": details.username,
-                        "password": details.password,
-                        "database": details.database,
-                        "warehouse": details.warehouse
-                    }
-                },
-                "sourceConfig": {
-                    "config": {
-                        "queryLogDuration": details.queryLogDuration,
-                        "resultLimit": details.resultLimit
-                    }
-                }
-            },
-            "processor": {
-                "type": "query-parser",
-                "config": {}
-            },
-            "stage":{
-                "type": "table-usage",
-                "config":{
-                    "filename": "/tmp/snowflake_usage"
-                }
-                
-            },
-            "bulkSink": {
-                "type": "metadata-usage",
-                "config": {
-                    "filename": "/tmp/snowflake_usage"
-                }
-            },
-            "workflowConfig": {
-                    "openMetadataServerConfig": {
-                        "hostPort": "http://localhost:8585/api",
-                        "authProvider": "no-auth"
-                    }
-                }
-            }
-        
-    usage_yaml = yaml.dump(data=usage_dict)
     try:
-        with open(f"/tmp/{details.file_name}.yaml","w") as f:
-            f.write(usage_yaml)
-        yaml_path = {"path":f"/tmp/{details.file_name}.yaml"}
+        yaml_path = {"path":write_workflow_config("usage",details.dict())}
+        if(run_workflow):
+            return {"Message":"Yaml Successfully Created", "Path":yaml_path, "Job":submit_workflow("usage",yaml_path["path"])}
         return {"Message":"Yaml Successfully Created", "Path":yaml_path}
-        # return on_success_response(201,"Yaml Successfully Created",data=yaml_path)
-    except:
-        # return on_error_response(401,"Write Operation Failed",data=None)
-        return {"Message":"Yaml Creation Failed"}
+    except Exception as e:
+        return {"Error": f"{e}","Message":"Yaml Creation Failed"}
 
 #Let us return the row which contains the details of the metadata to be ingested
-@app.post("/ingest/usage/choose_Row",tags=["Usage Ingestion"])
-def ingest_usage(dbservice_fqn:str,db: Session = Depends(get_db)):
+@app.post("/ingest/usage/choose_Row",tags=["Usage Ingestion"],responses=documented(either(ServiceConfig)))
+def ingest_usage(dbservice_fqn:str,db: Session = Depends(get_read_db)):
     """
     It takes a database service name as input and returns the last ingested usage data for that database
     service
     
     :param dbservice_fqn: The fully qualified name of the database service
     :type dbservice_fqn: str
-    :param db: Session = Depends(get_db)
+    :param db: Session = Depends(get_read_db)
     :type db: Session
     :return: The return value is a dictionary with two keys.
     """
     try:
-        meta_row = db.query(models.UserDetailsUsageIngestion).filter(models.UserDetailsUsageIngestion.dbservice_fqn == dbservice_fqn)
-        if(meta_row.count()):
-            all_rows = meta_row.order_by(models.UserDetailsUsageIngestion.created_at.desc())
-            return all_rows.first()
+        latest_row = latest_config(db,models.UserDetailsUsageIngestion,dbservice_fqn)
+        if(latest_row is not None):
+            return raw_json_document(latest_row,"user_details")
         else:
             return {"Message":"No databaseService exists by the given name."}
     except Exception as e:
-        return {f"Error: {e}","Message: Usage Ingestion not possible."}
+        return {"Error": f"{e}","Message": "Usage Ingestion not possible."}
 
 
-@app.post("/ingest/usage_result",tags = ["Usage Ingestion"])
+@app.post("/ingest/usage_result",tags = ["Usage Ingestion"],responses=documented(either(RowAdded)))
 def ingest_results(details:UsageResultsRow,db: Session = Depends(get_db)):
     """
     It takes a UsageResultsRow object, converts it to a dictionary, creates a new UsageIngestionEntity
@@ -436,16 +451,89 @@ def ingest_results(details:UsageResultsRow,db: Session = Depends(get_db)):
     """
     try:
         details_dict = details.dict()
+        #With RUNML_WRITE_BEHIND=1 the row is committed with the other rows of its batch, see the WRITE BEHIND section
+        if(write_behind.running):
+            saved = write_behind.submit(models.UsageIngestionEntity,details_dict)
+            return {"Message": "Added Successfully" if(saved is not None) else "Queued for saving","Details": saved if(saved is not None) else details_dict}
         new_row = models.UsageIngestionEntity(**details_dict)
         db.add(new_row)
         db.commit()
         db.refresh(new_row)
-        return {"Message: Added Successfully",f"Details:{new_row}"}
+        return {"Message": "Added Successfully","Details": row_dict(new_row)}
     except Exception as e:
-        return{f"Error: {e}", "Message: Addition Failed"}
+        return {"Error": f"{e}","Message": "Addition Failed"}
+
+@app.post("/ingest/usage_result/batch",tags = ["Usage Ingestion"],responses=documented(either(BatchResponse)))
+def ingest_results_batch(rows:List[dict] = Body(...),chunk_size:int = BATCH_CHUNK_SIZE,db: Session = Depends(get_db)):
+    """
+    It takes a list of UsageResultsRow objects and inserts them into the UsageIngestionEntity table
+    in chunks of `chunk_size` rows under a single transaction
+    
+    :param rows: The list of usage results, each one shaped like a UsageResultsRow
+    :type rows: List[dict]
+    :param chunk_size: Number of rows written by a single insert statement
+    :type chunk_size: int
+    :param db: Session = Depends(get_db)
+    :type db: Session
+    :return: A dictionary with the inserted and failed counts and a success or error entry per item
+    """
+    try:
+        summary = bulk_insert(db,models.UsageIngestionEntity,UsageResultsRow,rows,chunk_size)
+        return FastJSONResponse({"Message": "Batch processed", **summary})
+    except Exception as e:
+        db.rollback()
+        return {"Error": f"{e}","Message": "Batch addition failed"}
+
+#The usage workflow leaves its staged query log in /tmp/snowflake_usage, let us summarize it for the dashboards
+@app.post("/ingest/usage/summarize",tags = ["Usage Ingestion"],responses=documented(either(UsageSummaryResponse)))
+def summarize_usage_staging(usage_result_id:Optional[int] = None,dbservice_fqn:Optional[str] = None,force:bool = False,db: Session = Depends(get_db)):
+    """
+    It streams the staging file of the usage workflow and stores the query counts per table and per
+    user, the join frequencies and the top queries, linked to the usage result of the run
+    
+    :param usage_result_id: The UsageIngestionEntity row of the run, the newest one when not given
+    :type usage_result_id: Optional[int]
+    :param dbservice_fqn: The database service of the run
+    :type dbservice_fqn: Optional[str]
+    :param force: Aggregate the staging file again even when it did not change
+    :type force: bool
+    :param db: Session = Depends(get_db)
+    :type db: Session
+    :return: The stored summary
+    """
+    try:
+        row, aggregated = summarize_usage(db,USAGE_STAGING_PATH,usage_result_id,dbservice_fqn,force)
+        message = "Usage summarized" if(aggregated) else "Staging file unchanged, stored summary kept"
+        return raw_json_document({"Message":message,**row_dict(row)},"summary")
+    except Exception as e:
+        db.rollback()
+        return {"Error": f"{e}","Message": "Usage not summarized"}
+
+@app.get("/ingest/usage/summary",tags = ["Usage Ingestion"],responses=documented(either(UsageSummaryResponse)))
+def usage_summary_details(usage_result_id:Optional[int] = None,dbservice_fqn:Optional[str] = None,db: Session = Depends(get_read_db)):
+    """
+    It returns the newest stored usage summary of a usage result or of a database service
+    
+    :param usage_result_id: The UsageIngestionEntity row of the run
+    :type usage_result_id: Optional[int]
+    :param dbservice_fqn: The database service of the run
+    :type dbservice_fqn: Optional[str]
+    :param db: Session = Depends(get_read_db)
+    :type db: Session
+    :return: The stored summary
+    """
+    try:
+        row = latest_usage_summary(db,usage_result_id,dbservice_fqn)
+        if(row is not None):
+            #The summary is stored as JSON text and sent as it is
+            return raw_json_document({"Message":"Usage summary",**row_dict(row)},"summary")
+        else:
+            return {"Message": "No usage summary exists for the given usage result or service."}
+    except Exception as e:
+        return {"Error": f"{e}","Message": "Usage summary not found"}
 #_____________________________________________________________________________________________________________________________
 #_____________________________________________________________________________________________________________________________
-@app.post("/profiler/snowflake/input_details",tags=['Snowflake Profiler and Data Quality'])
+@app.post("/profiler/snowflake/input_details",tags=['Snowflake Profiler and Data Quality'],responses=documented(either(ConfigSaved)))
 def snow_profiler_data(details:SnowflakeProfiler,db: Session = Depends(get_db)):
     """
     It takes in a JSON object, converts it to a dictionary, adds a new key-value pair to the dictionary,
@@ -464,104 +552,71 @@ def snow_profiler_data(details:SnowflakeProfiler,db: Session = Depends(get_db)):
 
         details_dict["dbservice_name"] = f"{details.project_name}||{details.task_name}||{details.dbservice_name}"
         
-        proj_row = db.query(models.ProjectEntity).filter(models.ProjectEntity.project_name == details.project_name)
-        if(proj_row.count()):
-            task_row = db.query(models.TaskEntity).filter(models.TaskEntity.project_name == details.project_name).filter(models.TaskEntity.task_name == details.task_name)
-            if(task_row.count()):
-                versions = db.query(models.UserDetailsProfiling).filter(models.UserDetailsProfiling.dbservice_fqn == details_dict["dbservice_name"])
+        project_exists, task_exists = project_task_registry.lookup(db,details.project_name,details.task_name)
+        if(project_exists):
+            if(task_exists):
                 final_dict = {
                     "project_name":details.project_name,
                     "task_name":details.task_name,
                     "user_details":json.dumps(details_dict),
-                    "dbservice_fqn":details_dict["dbservice_name"],
-                    "version":f"v{versions.count()+1}"
+                    "dbservice_fqn":details_dict["dbservice_name"]
                 }
     
-                new_row = models.UserDetailsProfiling(**final_dict)
-                db.add(new_row)
-                db.commit()
-                db.refresh(new_row)
-                return {"Message": "User details saved successfully","dbservice_fqn":final_dict["dbservice_fqn"]}
+                new_row, created = save_config(db,models.UserDetailsProfiling,final_dict)
+                return {"Message": "User details saved successfully" if(created) else "User details unchanged, latest version kept","dbservice_fqn":final_dict["dbservice_fqn"],"version":new_row.version,"Deduplicated":not created}
             else:
-                return {"Message: User details not saved. Please give a valid Task name."}
+                return {"Message": "User details not saved. Please give a valid Task name."}
         else:
-            return {"Message: User details not saved. Please give a valid Project name."}
+            return {"Message": "User details not saved. Please give a valid Project name."}
 
     except Exception as e:
         return {"Error": f"{e}","Message": "User details not saved"}
 
 #Choose the latest row
-@app.post("/profiler/choose_Row",tags=["Data Profiling and Quality"])
-def ingest_metadata(dbservice_fqn:str,db: Session = Depends(get_db)):
+@app.post("/profiler/choose_Row",tags=["Data Profiling and Quality"],responses=documented(either(ServiceConfig)))
+def ingest_metadata(dbservice_fqn:str,db: Session = Depends(get_read_db)):
     """
     It takes in a dbservice_fqn and returns the metadata of the most recent version of the database
     service
     
     :param dbservice_fqn: The name of the database service
     :type dbservice_fqn: str
-    :param db: Session = Depends(get_db)
+    :param db: Session = Depends(get_read_db)
     :type db: Session
     :return: The return type is a dict.
     """
     try:
-        meta_row = db.query(models.UserDetailsProfiling).filter(models.UserDetailsProfiling.dbservice_fqn == dbservice_fqn)
-        if(meta_row.count()):
-            all_rows = meta_row.order_by(models.UserDetailsProfiling.created_at.desc())
-            return all_rows.first()
+        latest_row = latest_config(db,models.UserDetailsProfiling,dbservice_fqn)
+        if(latest_row is not None):
+            return raw_json_document(latest_row,"user_details")
         else:
             return {"Message":"No databaseService exists by the given name."}
     except Exception as e:
-        return {f"Error: {e}","Message: Metadata Ingestion not possible."}
+        return {"Error": f"{e}","Message": "Metadata Ingestion not possible."}
 
 #Create Yaml
 #Create Yaml
-@app.post("/profiler/snowflake/create_yaml",tags = ["Snowflake Profiler and Data Quality"])
-def profiling(details:SnowflakeProfilerYaml):
+@app.post("/profiler/snowflake/create_yaml",tags = ["Snowflake Profiler and Data Quality"],responses=documented(either(YamlCreated)))
+def profiling(details:SnowflakeProfilerYaml,run_workflow:bool = False):
     """
     It takes in a dictionary of values and creates a yaml file with the values in the dictionary
     
     :param details: SnowflakeProfilerYaml
     :type details: SnowflakeProfilerYaml
+    :param run_workflow: Also submit the YAML to the workflow job runner
+    :type run_workflow: bool
     :return: a dictionary with two keys: Message and Path.
     """
-    profiler_dict =  {'source': {'type': 'snowflake', 'serviceName': details.dbservice_name, 'serviceConnection': {'config': {'type': 'Snowflake', 'username': details.username, 'password': details.password, 'database': details.database, 'warehouse': details.warehouse, 'account': details.host
-            }
-        }, 'sourceConfig': {'config': {'type': 'Profiler', 'generateSampleData': True, 'fqnFilterPattern': {'includes': [f'{details.dbservice_name}.{details.database}'
-                    ]
-                }
-            }
-        }
-    }, 'processor': {'type': 'orm-profiler', 'config': {'test_suite': {'name': details.test_suite_name, 'tests': [
-                    {'table': f'{details.dbservice_name}.{details.database}.{details.testing_table_schema}.{details.testing_table_name}', 'profile_sample': 50, 'table_tests': [
-                            {'testCase': {'tableTestType': details.first_table_test_type, 'config': {'value': details.first_table_test_value
-                                    }
-                                }
-                            }
-                        ], 'column_tests': [
-                            {'columnName': details.testing_column_name, 'testCase': {'columnTestType': details.column_test_type, 'config': {'minValue': details.column_test_min_value, 'maxValue': details.column_test_max_value
-                                    }
-                                }
-                            }
-                        ]
-                    }
-                ]
-            }
-        }
-    }, 'sink': {'type': 'metadata-rest', 'config': {}
-    }, 'workflowConfig': {'openMetadataServerConfig': {'hostPort': 'http://localhost:8585/api', 'authProvider': 'no-auth'}}}
-    profiler_yaml = yaml.dump(data=profiler_dict)
-    try:
-        with open(f"/tmp/{details.file_name}.yaml","w") as f:
-            f.write(profiler_yaml)
-        yaml_path = {"path":f"/tmp/{details.file_name}.yaml"}
+    try:
+        yaml_path = {"path":write_workflow_config("profiler",details.dict())}
+        if(run_workflow):
+            return {"Message":"Yaml Successfully Created", "Path":yaml_path, "Job":submit_workflow("profiler",yaml_path["path"])}
         return {"Message":"Yaml Successfully Created", "Path":yaml_path}
-        # return on_success_response(201,"Successfully written to Yaml",data=yaml_path)
-    except:
-        # return on_error_response(401,"Write Operation Failed",data=None)
-        return {"Message":"Yaml Creation Failed"}
+    except Exception as e:
+        return {"Error": f"{e}","Message":"Yaml Creation Failed"}
 
 #Load output to postgres_db
-@app.post("/profiler/profiling_result",tags = ["Data Profiling and Quality"])
+@app.post("/profiler/profiling_result",tags = ["Data Profiling and Quality"],responses=documented(either(RowAdded)))
 def ingest_results(details:ProfilingResultsRow,db: Session = Depends(get_db)):
     """
     It takes a ProfilingResultsRow object and adds it to the database
@@ -574,19 +629,82 @@ def ingest_results(details:ProfilingResultsRow,db: Session = Depends(get_db)):
     """
     try:
         details_dict = details.dict()
+        #With RUNML_WRITE_BEHIND=1 the row is committed with the other rows of its batch, see the WRITE BEHIND section
+        if(write_behind.running):
+            saved = write_behind.submit(models.ProfilingEntity,details_dict)
+            return {"Message": "Added Successfully" if(saved is not None) else "Queued for saving","Details": saved if(saved is not None) else details_dict}
+        stamp_created_at(models.ProfilingEntity,[details_dict])
         new_row = models.ProfilingEntity(**details_dict)
         db.add(new_row)
+        record_rollups(db,models.ProfilingEntity,[details_dict])
         db.commit()
         db.refresh(new_row)
-        return {"Message: Added Successfully",f"Details:{new_row}"}
+        alert_engine.observe(models.ProfilingEntity,[details_dict])
+        return {"Message": "Added Successfully","Details": row_dict(new_row)}
     except Exception as e:
-        return{f"Error: {e}", "Message: Addition Failed"}
+        return {"Error": f"{e}","Message": "Addition Failed"}
+
+@app.post("/profiler/profiling_result/batch",tags = ["Data Profiling and Quality"],responses=documented(either(BatchResponse)))
+def ingest_results_batch(rows:List[dict] = Body(...),chunk_size:int = BATCH_CHUNK_SIZE,db: Session = Depends(get_db)):
+    """
+    It takes a list of ProfilingResultsRow objects and inserts them into the ProfilingEntity table in
+    chunks of `chunk_size` rows under a single transaction
+    
+    :param rows: The list of profiling results, each one shaped like a ProfilingResultsRow
+    :type rows: List[dict]
+    :param chunk_size: Number of rows written by a single insert statement
+    :type chunk_size: int
+    :param db: Session = Depends(get_db)
+    :type db: Session
+    :return: A dictionary with the inserted and failed counts and a success or error entry per item
+    """
+    try:
+        summary = bulk_insert(db,models.ProfilingEntity,ProfilingResultsRow,rows,chunk_size)
+        return FastJSONResponse({"Message": "Batch processed", **summary})
+    except Exception as e:
+        db.rollback()
+        return {"Error": f"{e}","Message": "Batch addition failed"}
+
+#Run the test suite of a profiler YAML against local CSV or Parquet extracts, e.g. in CI, without Snowflake
+@app.post("/profiler/local_tests",tags = ["Data Profiling and Quality"],responses=documented(either(QualityTestsRun)))
+def profiler_local_tests(details:LocalQualityTestRun,db: Session = Depends(get_db)):
+    """
+    It runs the table and column tests of a profiler test suite against local CSV or Parquet files,
+    read in chunks, with the tables spread over worker processes, and optionally saves one row per
+    test to the ProfilingEntity table
+    
+    :param details: LocalQualityTestRun - the test definitions, the local files and how to save the results
+    :type details: LocalQualityTestRun
+    :param db: Session = Depends(get_db)
+    :type db: Session
+    :return: A dictionary with the passed, failed and aborted counts, the results and, when saved, the per-row outcome
+    """
+    #The test module loads numpy, so it is imported by the first request instead of at startup
+    from app.services import quality_tests
+    try:
+        tables, service = quality_tests.load_test_tables(details.config_path,
+                                                         details.profiler.dict() if(details.profiler) else None,
+                                                         details.paths,[table.dict() for table in details.tables])
+        dbservice_fqn = details.dbservice_fqn or service
+        if(details.save_results and not dbservice_fqn):
+            return {"Message": "Tests not run. Please give a dbservice_fqn to save the results."}
+        workers = details.workers if(details.workers is not None) else quality_tests.QUALITY_WORKERS
+        results = quality_tests.run_quality_tests(tables,workers,details.chunk_rows)
+        counts = {outcome: sum(1 for result in results if result["result"] == outcome) for outcome in ("Success","Failed","Aborted")}
+        response = {"Message": "Tests run","Passed": counts["Success"],"Failed": counts["Failed"],"Aborted": counts["Aborted"],"Results": results}
+        if(details.save_results):
+            rows = quality_tests.to_profiling_rows(results,dbservice_fqn,details.result_template,details.field_map)
+            response["Saved"] = bulk_insert(db,models.ProfilingEntity,ProfilingResultsRow,rows)
+        return response
+    except Exception as e:
+        db.rollback()
+        return {"Error": f"{e}","Message": "Tests not run"}
 
 
 # _______________________________________________________________________________________________________
 #_____________________________________________________________________________________________________________________________
 #DRIFT SERVICE
-@app.post("/drift/input_details",tags =["Drift"])
+@app.post("/drift/input_details",tags =["Drift"],responses=documented(either(DriftConfigSaved)))
 def drift_service(details:FeatureDriftInputDetails,db: Session = Depends(get_db)):
     """
     > The function takes in a FeatureDriftInputDetails object and a database session object as input and
@@ -605,33 +723,27 @@ def drift_service(details:FeatureDriftInputDetails,db: Session = Depends(get_db)
 
         details_dict["driftservice_fqn"] = f"{details.project_name}.{details.task_name}.{details.drift_type}"
         
-        proj_row = db.query(models.ProjectEntity).filter(models.ProjectEntity.project_name == details.project_name)
-        if(proj_row.count()):
-            task_row = db.query(models.TaskEntity).filter(models.TaskEntity.project_name == details.project_name).filter(models.TaskEntity.task_name == details.task_name)
-            if(task_row.count()):
-                versions = db.query(models.DriftServiceDetails).filter(models.DriftServiceDetails.driftservice_fqn == details_dict["driftservice_fqn"])
+        project_exists, task_exists = project_task_registry.lookup(db,details.project_name,details.task_name)
+        if(project_exists):
+            if(task_exists):
                 final_dict = {
                     "project_name":details.project_name,
                     "task_name":details.task_name,
                     "input_details":json.dumps(details_dict),
-                    "driftservice_fqn":details_dict["driftservice_fqn"],
-                    "version":f"v{versions.count()+1}"
+                    "driftservice_fqn":details_dict["driftservice_fqn"]
                 }
     
-                new_row = models.DriftServiceDetails(**final_dict)
-                db.add(new_row)
-                db.commit()
-                db.refresh(new_row)
-                return {"Message": "User details saved successfully","driftservice_fqn":final_dict["driftservice_fqn"]}
+                new_row, created = save_config(db,models.DriftServiceDetails,final_dict)
+                return {"Message": "User details saved successfully" if(created) else "User details unchanged, latest version kept","driftservice_fqn":final_dict["driftservice_fqn"],"version":new_row.version,"Deduplicated":not created}
             else:
-                return {"Message: User details not saved. Please give a valid Task name."}
+                return {"Message": "User details not saved. Please give a valid Task name."}
         else:
-            return {"Message: User details not saved. Please give a valid Project name."}
+            return {"Message": "User details not saved. Please give a valid Project name."}
 
     except Exception as e:
-        return {f"Error: {e}","Message: User details not saved"}
+        return {"Error": f"{e}","Message": "User details not saved"}
 
-@app.post("/drift/output_details",tags = ["Drift"])
+@app.post("/drift/output_details",tags = ["Drift"],responses=documented(either(RowAdded)))
 def drift_dumps(details:DriftDumpRow,db: Session = Depends(get_db)):
     """
     It takes a row of data from the DriftDumpRow class, and adds it to the DriftService_Dump table in
@@ -645,37 +757,829 @@ def drift_dumps(details:DriftDumpRow,db: Session = Depends(get_db)):
     """
     try:
         details_dict = details.dict()
+        #With RUNML_WRITE_BEHIND=1 the row is committed with the other rows of its batch, see the WRITE BEHIND section
+        if(write_behind.running):
+            saved = write_behind.submit(models.DriftService_Dump,details_dict)
+            return {"Message": "Successfully saved the output" if(saved is not None) else "Queued for saving","Details": saved if(saved is not None) else details_dict}
+        stamp_created_at(models.DriftService_Dump,[details_dict])
         new_row = models.DriftService_Dump(**details_dict)
         db.add(new_row)
+        record_rollups(db,models.DriftService_Dump,[details_dict])
         db.commit()
         db.refresh(new_row)
-        return {"Message": "Successfully saved the output"}
+        alert_engine.observe(models.DriftService_Dump,[details_dict])
+        return {"Message": "Successfully saved the output","Details": row_dict(new_row)}
            
     except Exception as e:
-        return {f"Error: {e}","Message: Output not saved"}
+        return {"Error": f"{e}","Message": "Output not saved"}
+
+@app.post("/drift/output_details/batch",tags = ["Drift"],responses=documented(either(BatchResponse)))
+def drift_dumps_batch(rows:List[dict] = Body(...),chunk_size:int = BATCH_CHUNK_SIZE,db: Session = Depends(get_db)):
+    """
+    It takes a list of DriftDumpRow objects and inserts them into the DriftService_Dump table in
+    chunks of `chunk_size` rows under a single transaction
+    
+    :param rows: The list of drift outputs, each one shaped like a DriftDumpRow
+    :type rows: List[dict]
+    :param chunk_size: Number of rows written by a single insert statement
+    :type chunk_size: int
+    :param db: Session = Depends(get_db)
+    :type db: Session
+    :return: A dictionary with the inserted and failed counts and a success or error entry per item
+    """
+    try:
+        summary = bulk_insert(db,models.DriftService_Dump,DriftDumpRow,rows,chunk_size)
+        return FastJSONResponse({"Message": "Batch processed", **summary})
+    except Exception as e:
+        db.rollback()
+        return {"Error": f"{e}","Message": "Batch addition failed"}
+
+@app.post("/drift/output_details/stream",tags = ["Drift"],responses=documented(either(StreamProgressResponse)))
+async def drift_dumps_stream(request:Request,chunk_size:int = BATCH_CHUNK_SIZE,upload_id:Optional[str] = None,db: Session = Depends(get_db)):
+    """
+    It reads an NDJSON body of DriftDumpRow objects, one per line, as it arrives and saves it to the
+    DriftService_Dump table every `chunk_size` lines. The body is never held in memory as a whole, so
+    a whole drift run can be shipped over one connection.
+    
+    :param request: The incoming request, its body is consumed as a stream
+    :type request: Request
+    :param chunk_size: Number of rows written by a single insert statement
+    :type chunk_size: int
+    :param upload_id: Identifier to follow the progress at /drift/output_details/stream/{upload_id}
+    :type upload_id: Optional[str]
+    :param db: Session = Depends(get_db)
+    :type db: Session
+    :return: A dictionary with the line, inserted and failed counts and the first errors
+    """
+    summary = await ingest_ndjson(request.stream(),db,models.DriftService_Dump,DriftDumpRow,chunk_size,upload_id)
+    if(summary["status"] == "Completed"):
+        return FastJSONResponse({"Message": "Stream processed", **summary})
+    else:
+        return FastJSONResponse({"Message": "Stream interrupted", **summary})
+
+@app.get("/drift/output_details/stream/{upload_id}",tags = ["Drift"],responses=documented(either(StreamProgressResponse)))
+def drift_dumps_stream_progress(upload_id:str):
+    """
+    It returns the progress of an NDJSON upload sent to /drift/output_details/stream
+    
+    :param upload_id: The identifier of the upload
+    :type upload_id: str
+    :return: A dictionary with the status and the line, inserted and failed counts
+    """
+    progress = stream_progress.get(upload_id)
+    if(progress is not None):
+        return FastJSONResponse({"Message": "Upload progress", **progress})
+    else:
+        return {"Message": "No upload exists by the given id."}
+
+@app.post("/drift/compute",tags = ["Drift"],responses=documented(either(DriftComputed)))
+def drift_compute(details:DriftComputeRequest,db: Session = Depends(get_db)):
+    """
+    It computes PSI, KS, Jensen-Shannon and chi-square drift for every feature of a current dataset
+    against a reference dataset, both read from local CSV or Parquet files in bounded chunks, and
+    optionally saves one row per (feature, metric) to the DriftService_Dump table
+    
+    :param details: DriftComputeRequest - the datasets, features, metrics and how to save the results
+    :type details: DriftComputeRequest
+    :param db: Session = Depends(get_db)
+    :type db: Session
+    :return: A dictionary with the drift results and, when saved, the per-row outcome
+    """
+    #The drift modules load numpy, so they are imported by the first drift request instead of at startup
+    from app.services import drift_engine
+    try:
+        results = drift_engine.compute_drift(details.reference_path,details.current_path,
+                                             details.numerical_features,details.categorical_features,
+                                             details.metrics,details.bins,details.ks_bins,
+                                             details.chunk_rows,details.thresholds)
+        if(details.driftservice_fqn):
+            results = [{"driftservice_fqn":details.driftservice_fqn,**result} for result in results]
+        response = {"Message": "Drift computed", "Results": results}
+        if(details.save_results):
+            rows = drift_engine.to_dump_rows(results,details.dump_template,details.field_map)
+            response["Saved"] = bulk_insert(db,models.DriftService_Dump,DriftDumpRow,rows)
+        return response
+    except Exception as e:
+        db.rollback()
+        return {"Error": f"{e}","Message": "Drift computation failed"}
+
+@app.post("/drift/sketch/update",tags = ["Drift"],responses=documented(either(SketchesUpdated)))
+def drift_sketch_update(details:DriftSketchUpdate,db: Session = Depends(get_db)):
+    """
+    It folds a new local CSV or Parquet file into the persisted per-feature sketches (histograms and
+    category frequency tables) of a drift service for one time window. Only the new file is read.
+    
+    :param details: DriftSketchUpdate - the drift service, the side, the file and the window
+    :type details: DriftSketchUpdate
+    :param db: Session = Depends(get_db)
+    :type db: Session
+    :return: A dictionary with the window and the number of rows added per feature
+    """
+    from app.services import drift_engine, drift_sketches
+    try:
+        numerical, categorical = details.numerical_features, details.categorical_features
+        if(numerical is None and categorical is None):
+            numerical, categorical = drift_engine.infer_features(details.path,details.chunk_rows)
+        summary = drift_sketches.update_sketches(db,details.driftservice_fqn,details.role,details.path,
+                                                 list(numerical or []),list(categorical or []),
+                                                 details.window_start,chunk_rows=details.chunk_rows)
+        return {"Message": "Sketches updated", **summary}
+    except Exception as e:
+        db.rollback()
+        return {"Error": f"{e}","Message": "Sketch update failed"}
+
+@app.post("/drift/sketch/compute",tags = ["Drift"],responses=documented(either(DriftComputed)))
+def drift_sketch_compute(details:DriftSketchCompute,db: Session = Depends(get_db)):
+    """
+    It computes drift from the persisted sketches: the reference and current windows of the given
+    ranges are merged per feature and compared, without reading any raw data again
+    
+    :param details: DriftSketchCompute - the drift service, the window ranges and the metrics
+    :type details: DriftSketchCompute
+    :param db: Session = Depends(get_db)
+    :type db: Session
+    :return: A dictionary with the drift results and, when saved, the per-row outcome
+    """
+    from app.services import drift_engine, drift_sketches
+    try:
+        reference = drift_sketches.merged_sketches(db,details.driftservice_fqn,"reference",details.reference_start,details.reference_end)
+        current = drift_sketches.merged_sketches(db,details.driftservice_fqn,"current",details.current_start,details.current_end)
+        results = drift_sketches.drift_from_sketches(reference,current,details.metrics,details.bins,details.thresholds)
+        results = [{"driftservice_fqn":details.driftservice_fqn,**result} for result in results]
+        response = {"Message": "Drift computed", "Results": results}
+        if(details.save_results):
+            rows = drift_engine.to_dump_rows(results,details.dump_template,details.field_map)
+            response["Saved"] = bulk_insert(db,models.DriftService_Dump,DriftDumpRow,rows)
+        return response
+    except Exception as e:
+        db.rollback()
+        return {"Error": f"{e}","Message": "Drift computation failed"}
+
+@app.get("/drift/sketch/summary",tags = ["Drift"],responses=documented(either(SketchSummary)))
+def drift_sketch_summary(driftservice_fqn:str,role:str = "current",start:Optional[datetime] = None,end:Optional[datetime] = None,db: Session = Depends(get_read_db)):
+    """
+    It returns the quantiles or top categories of every feature of a drift service, merged over the
+    windows of [start, end)
+    
+    :param driftservice_fqn: The fully qualified name of the drift service
+    :type driftservice_fqn: str
+    :param role: "reference" or "current"
+    :type role: str
+    :param start: Start of the first window, all windows when not given
+    :type start: Optional[datetime]
+    :param end: End of the range, excluded
+    :type end: Optional[datetime]
+    :param db: Session = Depends(get_read_db)
+    :type db: Session
+    :return: A dictionary with one summary per feature
+    """
+    from app.services import drift_sketches
+    try:
+        merged = drift_sketches.merged_sketches(db,driftservice_fqn,role,start,end)
+        return {"Message": "Sketch summary", "Features": {name: drift_sketches.describe(sketch) for name, sketch in merged.items()}}
+    except Exception as e:
+        return {"Error": f"{e}","Message": "Sketch summary failed"}
 
 #choose latest row
-@app.post("/drift/choose_Row",tags=["Drift"])
-def choose_latest_row(driftservice_fqn:str,db: Session = Depends(get_db)):
+@app.post("/drift/choose_Row",tags=["Drift"],responses=documented(either(DriftServiceConfig)))
+def choose_latest_row(driftservice_fqn:str,db: Session = Depends(get_read_db)):
     """
     It takes a string as input, and returns the latest row from the database table, where the column
     "driftservice_fqn" matches the input string
     
     :param driftservice_fqn: This is the name of the service that you want to get the latest row for
     :type driftservice_fqn: str
-    :param db: Session = Depends(get_db)
+    :param db: Session = Depends(get_read_db)
     :type db: Session
     :return: A single row from the database.
     """
     try:
-        meta_row = db.query(models.DriftServiceDetails).filter(models.DriftServiceDetails.driftservice_fqn == driftservice_fqn)
-        if(meta_row.count()):
-            all_rows = meta_row.order_by(models.DriftServiceDetails.created_at.desc())
-            return all_rows.first()
+        latest_row = latest_config(db,models.DriftServiceDetails,driftservice_fqn)
+        if(latest_row is not None):
+            return raw_json_document(latest_row,"input_details")
         else:
             return {"Message":"No Service exists by the given name."}
     except Exception as e:
-        return {f"Error: {e}","Message: Fetching latest row failed."}
+        return {"Error": f"{e}","Message": "Fetching latest row failed."}
+
+
+#______________________________________________________________________________________________________________________
+#_____________________________________________________________________________________________________________________________
+#HISTORY
+@app.get("/history/{resource}",tags=["History"],responses=documented(either(HistoryPage)))
+def history(resource:str,limit:int = 100,cursor:Optional[str] = None,fqn:Optional[str] = None,
+            project_name:Optional[str] = None,task_name:Optional[str] = None,
+            created_after:Optional[datetime] = None,created_before:Optional[datetime] = None,
+            filters:Optional[List[str]] = Query(None),fields:Optional[str] = None,db: Session = Depends(get_read_db)):
+    """
+    It pages through the version history of the user-details configs (ingestion_configs,
+    usage_configs, profiling_configs, drift_configs) or through the results (ingestion_results,
+    usage_results, profiling_results, drift_results), newest first
+    
+    :param resource: The table to read
+    :type resource: str
+    :param limit: Rows per page
+    :type limit: int
+    :param cursor: The next_cursor returned with the previous page
+    :type cursor: Optional[str]
+    :param fqn: Only the rows of this dbservice_fqn / driftservice_fqn
+    :type fqn: Optional[str]
+    :param project_name: Only the rows of this project
+    :type project_name: Optional[str]
+    :param task_name: Only the rows of this task
+    :type task_name: Optional[str]
+    :param created_after: Only the rows created at or after this moment
+    :type created_after: Optional[datetime]
+    :param created_before: Only the rows created before this moment
+    :type created_before: Optional[datetime]
+    :param filters: Extra equality filters, each written as column:value
+    :type filters: Optional[List[str]]
+    :param fields: Comma separated list of the columns to return
+    :type fields: Optional[str]
+    :param db: Session = Depends(get_read_db)
+    :type db: Session
+    :return: A dictionary with the rows, the cursor of the next page and whether there is one
+    """
+    try:
+        field_list = [name.strip() for name in fields.split(",") if name.strip()] if fields else None
+        page = history_page(db,resource,limit,cursor,fqn,project_name,task_name,
+                            created_after,created_before,filters,field_list)
+        return FastJSONResponse({"Message":"History page",**page})
+    except Exception as e:
+        return {"Error": f"{e}","Message":"History not available"}
+
+
+#______________________________________________________________________________________________________________________
+#_____________________________________________________________________________________________________________________________
+#ROLLUPS
+@app.get("/rollups/{source}",tags=["Rollups"],responses=documented(either(RollupsResponse)))
+def rollups(source:str,start:datetime,end:Optional[datetime] = None,resolution:Optional[str] = None,
+            metric:Optional[str] = None,fqn:Optional[str] = None,table_name:Optional[str] = None,
+            column_name:Optional[str] = None,feature_name:Optional[str] = None,db: Session = Depends(get_read_db)):
+    """
+    It returns the hourly or daily min, max, mean, count and last value of the profiling or drift
+    results over a time range, one series per service/table/column/feature and results field. The
+    daily rollups are used when the range is long enough, the hourly ones otherwise.
+    
+    :param source: "profiling" or "drift"
+    :type source: str
+    :param start: Beginning of the range
+    :type start: datetime
+    :param end: End of the range, now by default
+    :type end: Optional[datetime]
+    :param resolution: "hour" or "day" to force a resolution
+    :type resolution: Optional[str]
+    :param metric: Only the series of this results field (e.g. drift_score)
+    :type metric: Optional[str]
+    :param fqn: Only the series of this dbservice_fqn / driftservice_fqn
+    :type fqn: Optional[str]
+    :param table_name: Only the series of this table
+    :type table_name: Optional[str]
+    :param column_name: Only the series of this column
+    :type column_name: Optional[str]
+    :param feature_name: Only the series of this feature
+    :type feature_name: Optional[str]
+    :param db: Session = Depends(get_read_db)
+    :type db: Session
+    :return: A dictionary with the resolution used and the series with one point per bucket
+    """
+    try:
+        result = rollup_series(db,source,start,end,resolution,metric,fqn=fqn,table_name=table_name,
+                               column_name=column_name,feature_name=feature_name)
+        return {"Message":"Rollups",**result}
+    except Exception as e:
+        return {"Error": f"{e}","Message":"Rollups not available"}
+
+@app.post("/rollups/{source}/rebuild",tags=["Rollups"],responses=documented(either(RollupsRebuilt)))
+def rollups_rebuild(source:str,since:Optional[datetime] = None,db: Session = Depends(get_db)):
+    """
+    It recomputes the rollups of the profiling or drift results from the stored rows, e.g. for the
+    results saved before the rollups existed. The rollups of the partitions retired by the retention
+    are kept, their rows are gone.
+    
+    :param source: "profiling" or "drift"
+    :type source: str
+    :param since: Only recompute the days from this moment onwards, all of them by default
+    :type since: Optional[datetime]
+    :param db: Session = Depends(get_db)
+    :type db: Session
+    :return: A dictionary with the number of rows read and bucket updates written
+    """
+    try:
+        summary = rebuild_rollups(db,source,since)
+        return {"Message":"Rollups rebuilt",**summary}
+    except Exception as e:
+        db.rollback()
+        return {"Error": f"{e}","Message":"Rollups not rebuilt"}
+
+
+#______________________________________________________________________________________________________________________
+#_____________________________________________________________________________________________________________________________
+#ALERTS
+#The profiling and drift results are checked against the alert rules as they are saved, by every
+#results endpoint; the alerts are stored in alert_events and delivered to the RUNML_ALERT_SINKS
+@app.on_event("startup")
+def start_alerts():
+    """
+    It loads the alert rules and starts the thread delivering the alerts
+    """
+    with startup_report.step("alerts"):
+        alert_engine.start(lambda: Session(engine))
+
+@app.on_event("shutdown")
+def stop_alerts():
+    """
+    It delivers the alerts already fired and stops the delivery thread
+    """
+    alert_engine.shutdown()
+
+@app.post("/alerts/rules",tags=["Alerts"],responses=documented(either(AlertRuleResponse)))
+def create_alert_rule(rule:AlertRuleCreate,db: Session = Depends(get_db)):
+    """
+    It saves an alert rule, checked from now on against the results of the series it matches
+    
+    :param rule: AlertRuleCreate
+    :type rule: AlertRuleCreate
+    :param db: Session = Depends(get_db)
+    :type db: Session
+    :return: A dictionary with the saved rule
+    """
+    try:
+        new_rule = alert_engine.add_rule(db,rule.dict())
+        return {"Message":"Alert rule saved","Rule":rule_dict(new_rule)}
+    except Exception as e:
+        db.rollback()
+        return {"Error": f"{e}","Message":"Alert rule not saved"}
+
+@app.get("/alerts/rules",tags=["Alerts"],responses=documented(either(AlertRuleList)))
+def alert_rules(db: Session = Depends(get_read_db)):
+    """
+    It returns every alert rule
+    
+    :param db: Session = Depends(get_read_db)
+    :type db: Session
+    :return: A dictionary with the rules
+    """
+    try:
+        rules = alert_engine.rules(db)
+        return {"Message":"Alert rules","Rules":[rule_dict(rule) for rule in rules]}
+    except Exception as e:
+        return {"Error": f"{e}","Message":"Alert rules not available"}
+
+@app.post("/alerts/rules/{rule_id}/delete",tags=["Alerts"],responses=documented(either(AlertRuleResponse)))
+def delete_alert_rule(rule_id:int,db: Session = Depends(get_db)):
+    """
+    It deletes an alert rule, the alerts it fired are kept
+    
+    :param rule_id: The id of the rule
+    :type rule_id: int
+    :param db: Session = Depends(get_db)
+    :type db: Session
+    :return: A dictionary with the deleted rule
+    """
+    try:
+        rule = alert_engine.delete_rule(db,rule_id)
+        if(rule is not None):
+            return {"Message":"Alert rule deleted","Rule":rule_dict(rule)}
+        else:
+            return {"Message":"No alert rule exists by the given id."}
+    except Exception as e:
+        db.rollback()
+        return {"Error": f"{e}","Message":"Alert rule not deleted"}
+
+@app.get("/alerts",tags=["Alerts"],responses=documented(either(AlertList)))
+def alerts(rule_id:Optional[int] = None,fqn:Optional[str] = None,state:Optional[str] = None,limit:int = 100,
+           db: Session = Depends(get_read_db)):
+    """
+    It returns the alerts fired and resolved, newest first
+    
+    :param rule_id: Only the alerts of this rule
+    :type rule_id: Optional[int]
+    :param fqn: Only the alerts of this dbservice_fqn / driftservice_fqn
+    :type fqn: Optional[str]
+    :param state: "Firing" or "Resolved"
+    :type state: Optional[str]
+    :param limit: Most alerts returned (at most 1000)
+    :type limit: int
+    :param db: Session = Depends(get_read_db)
+    :type db: Session
+    :return: A dictionary with the alerts
+    """
+    try:
+        events = alert_engine.events(db,rule_id,fqn,state,limit)
+        return {"Message":"Alerts","Alerts":[alert_event_dict(event) for event in events]}
+    except Exception as e:
+        return {"Error": f"{e}","Message":"Alerts not available"}
+
+@app.get("/alerts/stats",tags=["Alerts"],responses=documented(AlertStats))
+def alerts_stats():
+    """
+    It returns the rules loaded, the series tracked and the evaluation and delivery counters of the
+    alert engine of this worker
+    
+    :return: A dictionary with the alert engine counters
+    """
+    return {"Message":"Alert engine statistics","Stats":alert_engine.stats()}
+
+
+#______________________________________________________________________________________________________________________
+#_____________________________________________________________________________________________________________________________
+#WORKFLOW CONFIGS
+@app.post("/workflow_configs/batch",tags=["Workflow Configs"],responses=documented(either(YamlBatchResponse)))
+def create_yaml_batch(items:List[WorkflowConfigRequest],run_workflow:bool = False):
+    """
+    It writes the workflow YAMLs of many services in one call, rendered and written in parallel, the
+    way the create_yaml endpoints write one
+    
+    :param items: The workflow type and the create_yaml body of every service
+    :type items: List[WorkflowConfigRequest]
+    :param run_workflow: Also submit every written YAML to the workflow job runner
+    :type run_workflow: bool
+    :return: A dictionary with the created and failed counts and the path or error of every item
+    """
+    if(len(items) > MAX_YAML_BATCH):
+        return {"Message": f"Too many configs, at most {MAX_YAML_BATCH} per batch."}
+    try:
+        results = write_workflow_configs([item.dict() for item in items],on_written=submit_workflow if(run_workflow) else None)
+        created = sum(1 for result in results if result["status"] == "Success")
+        return FastJSONResponse({"Message":"Batch processed","Created":created,"Failed":len(results) - created,"Results":results})
+    except Exception as e:
+        return {"Error": f"{e}","Message": "Yaml Creation Failed"}
+
+#______________________________________________________________________________________________________________________
+#_____________________________________________________________________________________________________________________________
+#WORKFLOW JOBS
+def submit_workflow(workflow_type:str,config_path:str):
+    """
+    It queues a generated YAML on the workflow job runner for the create_yaml endpoints, the service
+    of the job is read from the YAML
+    
+    :return: The job details, or a dictionary with the error when the job was refused
+    """
+    try:
+        return workflow_jobs.submit(workflow_type,config_path).to_dict()
+    except Exception as e:
+        return {"Error": f"{e}"}
+
+@app.on_event("shutdown")
+def stop_workflow_jobs():
+    """
+    It stops the queued and running workflows when the service shuts down
+    """
+    workflow_jobs.shutdown()
+
+@app.post("/jobs/submit",tags=["Workflow Jobs"],responses=documented(either(JobResponse)))
+def submit_job(details:WorkflowJobSubmit):
+    """
+    It queues a run of a generated ingestion, usage or profiler YAML. The job starts as soon as the
+    total and per database service concurrency limits allow it.
+    
+    :param details: WorkflowJobSubmit - the workflow type, the YAML path, its service and the result row to record
+    :type details: WorkflowJobSubmit
+    :return: A dictionary with the job details
+    """
+    try:
+        job = workflow_jobs.submit(details.workflow_type,details.config_path,details.result_details,details.service_fqn)
+        return {"Message":"Job submitted","Job":job.to_dict()}
+    except Exception as e:
+        return {"Error": f"{e}","Message":"Job submission failed"}
+
+@app.get("/jobs",tags=["Workflow Jobs"],responses=documented(JobList))
+def list_jobs(status:Optional[str] = None,workflow_type:Optional[str] = None,service_fqn:Optional[str] = None):
+    """
+    It lists the queued, running and recently finished jobs
+    
+    :param status: Only the jobs in this status (Queued, Running, Succeeded, Failed, Cancelled)
+    :type status: Optional[str]
+    :param workflow_type: Only the jobs of this workflow type
+    :type workflow_type: Optional[str]
+    :param service_fqn: Only the jobs run against this database service
+    :type service_fqn: Optional[str]
+    :return: A dictionary with the jobs
+    """
+    return {"Message":"Jobs","Jobs":workflow_jobs.list(status,workflow_type,service_fqn)}
+
+@app.get("/jobs/{job_id}",tags=["Workflow Jobs"],responses=documented(either(JobResponse)))
+def job_status(job_id:str):
+    """
+    It returns the status of a job
+    
+    :param job_id: The identifier returned at submission
+    :type job_id: str
+    :return: A dictionary with the job details
+    """
+    job = workflow_jobs.get(job_id)
+    if(job is not None):
+        return {"Message":"Job status","Job":job.to_dict()}
+    else:
+        return {"Message":"No job exists by the given id."}
+
+@app.get("/jobs/{job_id}/logs",tags=["Workflow Jobs"],responses=documented(either(JobLogs)))
+def job_logs(job_id:str,lines:int = 100):
+    """
+    It returns the last lines written by the workflow of a job
+    
+    :param job_id: The identifier returned at submission
+    :type job_id: str
+    :param lines: Number of lines to return
+    :type lines: int
+    :return: A dictionary with the log lines
+    """
+    log_lines = workflow_jobs.tail(job_id,lines)
+    if(log_lines is not None):
+        return {"Message":"Job logs","Logs":log_lines}
+    else:
+        return {"Message":"No job exists by the given id."}
+
+@app.post("/jobs/{job_id}/cancel",tags=["Workflow Jobs"],responses=documented(either(JobResponse)))
+def cancel_job(job_id:str):
+    """
+    It removes a queued job from its queue, or stops the process of a running job
+    
+    :param job_id: The identifier returned at submission
+    :type job_id: str
+    :return: A dictionary with the job details
+    """
+    job = workflow_jobs.cancel(job_id)
+    if(job is not None):
+        return {"Message":"Cancellation requested","Job":job.to_dict()}
+    else:
+        return {"Message":"No job exists by the given id."}
+
+
+#______________________________________________________________________________________________________________________
+#_____________________________________________________________________________________________________________________________
+#PURGE
+#/project/delete and /task/delete only remove the project or task rows, these endpoints also remove
+#every config, result, sketch and rollup depending on them, chunk by chunk in a background job
+@app.on_event("startup")
+def start_purge_jobs():
+    """
+    It starts picking up the queued purges, and the ones left unfinished by a stopped or crashed worker
+    """
+    purge_jobs.start()
+
+@app.on_event("shutdown")
+def stop_purge_jobs():
+    """
+    It stops the running purges after their current chunk, they are resumed by the next worker
+    """
+    purge_jobs.shutdown()
+
+@app.post("/project/purge",tags=["Project"],responses=documented(either(JobResponse)))
+def purge_project(row:ProjectRow,db: Session = Depends(get_db)):
+    """
+    It queues the deletion of a project, its tasks and every row depending on them
+    
+    :param row: ProjectRow
+    :type row: ProjectRow
+    :param db: Session = Depends(get_db)
+    :type db: Session
+    :return: A dictionary with the purge job, follow its progress with /purge/{job_id}
+    """
+    try:
+        job, created = purge_jobs.submit(db,row.project_name)
+        return {"Message": "Project purge queued" if(created) else "A purge of this project is already in progress","Job":purge_job_dict(job)}
+    except Exception as e:
+        return {"Error": f"{e}","Message": "Project purge failed"}
+
+@app.post("/task/purge",tags=["Task"],responses=documented(either(JobResponse)))
+def purge_task(row:TaskRow,db: Session = Depends(get_db)):
+    """
+    It queues the deletion of a task of a project and of every row depending on it
+    
+    :param row: TaskRow
+    :type row: TaskRow
+    :param db: Session = Depends(get_db)
+    :type db: Session
+    :return: A dictionary with the purge job, follow its progress with /purge/{job_id}
+    """
+    try:
+        job, created = purge_jobs.submit(db,row.project_name,row.task_name)
+        return {"Message": "Task purge queued" if(created) else "A purge of this task is already in progress","Job":purge_job_dict(job)}
+    except Exception as e:
+        return {"Error": f"{e}","Message": "Task purge failed"}
+
+@app.get("/purge",tags=["Purge"],responses=documented(either(JobList)))
+def list_purges(status:Optional[str] = None,limit:int = Query(100,ge=1,le=1000),db: Session = Depends(get_db)):
+    """
+    It lists the purges, newest first
+    
+    :param status: Only the purges in this status (Queued, Running, Succeeded, Failed, Cancelled)
+    :type status: Optional[str]
+    :param limit: Number of purges to return
+    :type limit: int
+    :return: A dictionary with the purges
+    """
+    try:
+        return {"Message":"Purges","Jobs":[purge_job_dict(job) for job in purge_jobs.list(db,status,limit)]}
+    except Exception as e:
+        return {"Error": f"{e}","Message": "Purges not listed"}
+
+@app.get("/purge/{job_id}",tags=["Purge"],responses=documented(either(JobResponse)))
+def purge_status(job_id:str,db: Session = Depends(get_db)):
+    """
+    It returns the progress of a purge: the step reached and the rows deleted per table
+    
+    :param job_id: The identifier returned by /project/purge or /task/purge
+    :type job_id: str
+    :return: A dictionary with the purge job
+    """
+    job = purge_jobs.get(db,job_id)
+    if(job is not None):
+        return {"Message":"Purge status","Job":purge_job_dict(job)}
+    else:
+        return {"Message":"No purge exists by the given id."}
+
+@app.post("/purge/{job_id}/cancel",tags=["Purge"],responses=documented(either(JobResponse)))
+def cancel_purge(job_id:str,db: Session = Depends(get_db)):
+    """
+    It cancels a queued purge, or stops a running one after its current chunk
+    
+    :param job_id: The identifier returned by /project/purge or /task/purge
+    :type job_id: str
+    :return: A dictionary with the purge job
+    """
+    try:
+        job = purge_jobs.cancel(db,job_id)
+        if(job is not None):
+            return {"Message":"Cancellation requested","Job":purge_job_dict(job)}
+        else:
+            return {"Message":"No purge exists by the given id."}
+    except Exception as e:
+        return {"Error": f"{e}","Message": "Purge not cancelled"}
+
+@app.post("/purge/{job_id}/resume",tags=["Purge"],responses=documented(either(JobResponse)))
+def resume_purge(job_id:str,db: Session = Depends(get_db)):
+    """
+    It queues a failed or cancelled purge again, it carries on from the step it had reached
+    
+    :param job_id: The identifier returned by /project/purge or /task/purge
+    :type job_id: str
+    :return: A dictionary with the purge job
+    """
+    try:
+        job = purge_jobs.resume(db,job_id)
+        if(job is not None):
+            return {"Message":"Purge resumed" if(job.status == "Queued") else "Only failed or cancelled purges can be resumed","Job":purge_job_dict(job)}
+        else:
+            return {"Message":"No purge exists by the given id."}
+    except Exception as e:
+        return {"Error": f"{e}","Message": "Purge not resumed"}
+
+#______________________________________________________________________________________________________________________
+#_____________________________________________________________________________________________________________________________
+#PARTITIONS
+#The metadata, usage, profiling and drift results are partitioned by month of created_at (see
+#RUNML_PARTITIONING), and the partitions older than RUNML_RETENTION_DAYS are dropped or compacted whole
+@app.on_event("startup")
+def start_partition_maintenance():
+    """
+    It creates the partitions of the results tables ahead of time, then starts applying the
+    retention in the background. No table is converted to native partitions at startup.
+    """
+    with startup_report.step("partitions"):
+        startup_report.details["partitions"] = partition_maintenance.run(retention=False,convert=False)
+    partition_maintenance.start()
+
+@app.on_event("shutdown")
+def stop_partition_maintenance():
+    """
+    It stops the background partition maintenance
+    """
+    partition_maintenance.shutdown()
+
+@app.get("/partitions",tags=["Partitions"],responses=documented(either(PartitionStatus)))
+def partitions(db: Session = Depends(get_db)):
+    """
+    It returns the layout (native Postgres partitions or catalog ranges), the retention and the
+    partitions of every results table, with the report of the last maintenance run
+    
+    :param db: Session = Depends(get_db)
+    :type db: Session
+    :return: A dictionary with the partitions of every results table
+    """
+    try:
+        return {"Message":"Partitions","Status":partition_maintenance.status(db)}
+    except Exception as e:
+        return {"Error": f"{e}","Message":"Partitions not available"}
+
+@app.post("/partitions/maintain",tags=["Partitions"],responses=documented(either(PartitionReport)))
+def partitions_maintain(retention:bool = True,dry_run:bool = False):
+    """
+    It creates the missing partitions now and applies the retention, instead of waiting for the
+    next background run
+    
+    :param retention: Apply the retention too, not only create the partitions
+    :type retention: bool
+    :param dry_run: Only report the partitions the retention would drop or compact
+    :type dry_run: bool
+    :return: A dictionary with the partitions created and retired per results table
+    """
+    try:
+        return {"Message":"Partition maintenance done","Report":partition_maintenance.run(retention,dry_run)}
+    except Exception as e:
+        return {"Error": f"{e}","Message":"Partition maintenance failed"}
+
+@app.post("/partitions/{source}/convert",tags=["Partitions"],responses=documented(either(PartitionReport)))
+def partitions_convert(source:str):
+    """
+    It converts a results table to native Postgres partitions, whatever its size. The table is
+    locked while its rows are copied.
+    
+    :param source: "metadata", "usage", "profiling" or "drift"
+    :type source: str
+    :return: A dictionary with the rows copied and the partitions created
+    """
+    try:
+        return {"Message":"Partition conversion done","Report":partition_maintenance.convert(source)}
+    except Exception as e:
+        return {"Error": f"{e}","Message":"Partition conversion failed"}
+
+
+#______________________________________________________________________________________________________________________
+#_____________________________________________________________________________________________________________________________
+#WRITE BEHIND
+#With RUNML_WRITE_BEHIND=1 the single result endpoints (ingest_result, usage_result, profiling_result and
+#output_details) queue their row, and a background thread inserts the queued rows every
+#RUNML_WRITE_BEHIND_FLUSH_MS milliseconds with one commit per batch
+@app.on_event("startup")
+def start_write_behind():
+    """
+    It starts the thread writing the queued results rows
+    """
+    if(WRITE_BEHIND):
+        write_behind.start()
+
+@app.on_event("shutdown")
+def stop_write_behind():
+    """
+    It stops queueing results rows and writes the ones already queued before the worker exits
+    """
+    write_behind.shutdown()
+
+@app.get("/write_behind/stats",tags=["Metrics"],responses=documented(WriteBehindStats))
+def write_behind_stats():
+    """
+    It returns the queue depth, the batches and rows written and the flush latency of the
+    write-behind buffer of this worker
+    
+    :return: A dictionary with the buffer counters
+    """
+    return {"Message":"Write-behind buffer statistics","Stats":write_behind.stats()}
+
+
+#______________________________________________________________________________________________________________________
+#_____________________________________________________________________________________________________________________________
+#LATEST CONFIG CACHE
+@app.get("/cache/stats",tags=["Cache"],responses=documented(CacheStats))
+def cache_stats():
+    """
+    It returns the size and the hit, miss and eviction counters of the latest config cache used by
+    the choose_Row endpoints of this worker
+    
+    :return: A dictionary with the cache counters
+    """
+    return {"Message":"Latest config cache statistics","Stats":latest_config_cache.stats()}
+
+
+#______________________________________________________________________________________________________________________
+#_____________________________________________________________________________________________________________________________
+#STARTUP
+@app.get("/startup",tags=["Metrics"],responses=documented(StartupReportResponse))
+def startup():
+    """
+    It returns where the cold start of this worker went: the import of this module, the schema
+    check (with the action taken) and the other startup steps
+    
+    :return: A dictionary with the import, per step and total seconds
+    """
+    return {"Message":"Startup report","Report":startup_report.to_dict()}
+
+
+#______________________________________________________________________________________________________________________
+#_____________________________________________________________________________________________________________________________
+#METRICS
+@app.get("/metrics",tags=["Metrics"],response_class=PlainTextResponse)
+def metrics():
+    """
+    It returns the request latency, status and handled error counters, the per request SQL statement
+    count and time, the SQL statement, pool checkout and commit latencies of this worker in the
+    Prometheus text format
+    
+    :return: The metrics as text/plain
+    """
+    return PlainTextResponse(render_metrics(),media_type="text/plain; version=0.0.4")
+
+@app.get("/db/pool_stats",tags=["Metrics"],responses=documented(PoolStats))
+def db_pool_stats():
+    """
+    It returns the connection pool occupancy of the primary engine and of the read replica engine
+    serving the read-only routes (choose_Row, history, rollups and summaries)
+    
+    :return: A dictionary with the pool size, checked in, checked out and overflow connections per engine
+    """
+    return {"Message":"Pool stats","Stats":pool_stats()}
 
 
 #______________________________________________________________________________________________________________________
@@ -683,4 +1587,5 @@ def choose_latest_row(driftservice_fqn:str,db: Session = Depends(get_db)):
 
 
 if(__name__=="__main__"):
+    import uvicorn
     uvicorn.run("main:app",reload=True)
\ No newline at end of file
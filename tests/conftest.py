@@ -0,0 +1,69 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+#The service models and schemas (app/models/table_model.py, app/schemas/schemas.py) are deployed with
+#the service and are not kept in this repository: the test modules that need them skip themselves
+#with pytest.importorskip when they cannot be imported.
+#Every test runs against a throwaway SQLite database. The settings are read when the app modules are
+#imported, so they are set before anything below imports them.
+_DATABASE_DIR = tempfile.mkdtemp(prefix="runml-tests-")
+os.environ.setdefault("RUNML_DATABASE_URL", f"sqlite:///{os.path.join(_DATABASE_DIR, 'primary.db')}")
+os.environ.setdefault("RUNML_ALERT_SINKS", "log")
+os.environ.setdefault("RUNML_PARTITION_MAINTENANCE_SECONDS", "0")
+os.environ.setdefault("RUNML_JOBS_LOG_DIR", os.path.join(_DATABASE_DIR, "jobs"))
+os.environ.setdefault("RUNML_YAML_DIR", _DATABASE_DIR)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _reset(engine) -> None:
+    """
+    It empties every table and the in-process caches, so that each test starts from a blank service
+    """
+    import app.models.table_model as models
+    from sqlalchemy.orm import Session
+    from app.services.alerts import alert_engine
+    from app.services.config_cache import latest_config_cache
+    from app.services.registry import project_task_registry
+
+    with engine.begin() as conn:
+        for table in reversed(models.Base.metadata.sorted_tables):
+            conn.execute(table.delete())
+    latest_config_cache.clear()
+    with Session(engine) as db:
+        project_task_registry.warm(db)
+        alert_engine.reload(db)
+
+
+@pytest.fixture(scope="session")
+def engine():
+    #main imports every model, so that the whole schema is created
+    import main
+    import app.models.table_model as models
+    from app.databases.routing import engine
+
+    models.Base.metadata.create_all(engine)
+    return engine
+
+
+@pytest.fixture
+def db(engine):
+    from sqlalchemy.orm import Session
+
+    _reset(engine)
+    session = Session(engine)
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def client(engine):
+    from fastapi.testclient import TestClient
+    import main
+
+    _reset(engine)
+    with TestClient(main.app) as test_client:
+        yield test_client
@@ -0,0 +1,63 @@
+import pytest
+
+pytest.importorskip("app.models.table_model")
+pytest.importorskip("app.schemas.schemas")
+
+import app.models.table_model as models
+from app.services.alerts import AlertEngine, alert_engine, validate_rule
+
+
+def _rule(**fields):
+    return {"name": "high value", "source": "profiling", "metric": "value", "kind": "threshold",
+            "fqn": "*", "feature": "*", "operator": ">", "threshold": 5.0, **fields}
+
+
+def _profiling_row(value):
+    return {"dbservice_fqn": "svc", "table_name": "orders", "column_name": "amount",
+            "test_type": "columnValuesToBeBetween", "result": "Success", "value": value}
+
+
+def test_rule_on_a_numeric_field_is_accepted():
+    assert validate_rule(_rule())["consecutive"] == 1
+    assert validate_rule(_rule(kind="consecutive_breach"))["consecutive"] == 3
+
+
+@pytest.mark.parametrize("fields, error", [
+    ({"metric": "result"}, "not numeric"),
+    ({"metric": "no_such_field"}, "no field"),
+    ({"source": "metadata"}, "Source must be one of"),
+    ({"operator": "=="}, "Operator must be one of"),
+    ({"kind": "consecutive_breach", "consecutive": 0}, "at least 1"),
+])
+def test_invalid_rules_are_refused(fields, error):
+    with pytest.raises(ValueError, match=error):
+        validate_rule(_rule(**fields))
+
+
+def test_rule_endpoint_refuses_a_text_metric(client):
+    body = client.post("/alerts/rules", json=_rule(metric="test_type")).json()
+
+    assert body["Message"] == "Alert rule not saved" and "not numeric" in body["Error"]
+
+
+def test_breach_fires_once_and_resolves(db):
+    engine = AlertEngine(sink_names=[])
+    engine.add_rule(db, _rule())
+
+    fired = [engine.observe(models.ProfilingEntity, [_profiling_row(value)]) for value in (1.0, 9.0, 10.0, "n/a", 2.0)]
+
+    assert fired == [0, 1, 0, 0, 1]
+
+
+def test_alert_failure_does_not_fail_the_saved_result(client, db, monkeypatch):
+    client.post("/alerts/rules", json=_rule())
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("alert state broken")
+    monkeypatch.setattr(alert_engine, "_evaluate", fail)
+
+    single = client.post("/profiler/profiling_result", json=_profiling_row(9.0)).json()
+    batch = client.post("/profiler/profiling_result/batch", json=[_profiling_row(9.0)]).json()
+
+    assert single["Message"] == "Added Successfully" and batch["Inserted"] == 1
+    assert db.query(models.ProfilingEntity).count() == 2
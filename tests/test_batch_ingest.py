@@ -0,0 +1,43 @@
+import pytest
+
+pytest.importorskip("app.models.table_model")
+pytest.importorskip("app.schemas.schemas")
+
+import app.models.table_model as models
+from app.schemas.schemas import ProfilingResultsRow
+from app.services.batch_ingest import bulk_insert
+
+
+def _profiling_row(value, fqn="svc"):
+    return {"dbservice_fqn": fqn, "table_name": "orders", "column_name": "amount",
+            "test_type": "columnValuesToBeBetween", "result": "Success", "value": value}
+
+
+def test_bulk_insert_writes_every_chunk(db):
+    rows = [_profiling_row(float(value)) for value in range(7)]
+
+    summary = bulk_insert(db, models.ProfilingEntity, ProfilingResultsRow, rows, chunk_size=3)
+
+    assert summary["Inserted"] == 7 and summary["Failed"] == 0
+    assert [item["index"] for item in summary["Results"]] == list(range(7))
+    assert db.query(models.ProfilingEntity).count() == 7
+
+
+def test_bulk_insert_reports_invalid_items_without_failing_the_batch(db):
+    rows = [_profiling_row(1.0), {"table_name": "no fqn"}, _profiling_row(2.0)]
+
+    summary = bulk_insert(db, models.ProfilingEntity, ProfilingResultsRow, rows, chunk_size=2)
+
+    assert summary["Inserted"] == 2 and summary["Failed"] == 1
+    assert summary["Results"][1]["status"] == "Error"
+    assert {row.value for row in db.query(models.ProfilingEntity)} == {1.0, 2.0}
+
+
+def test_batch_endpoint_returns_per_item_outcome(client):
+    response = client.post("/profiler/profiling_result/batch?chunk_size=2",
+                           json=[_profiling_row(1.0), _profiling_row(2.0), {"value": 3.0}])
+
+    body = response.json()
+    assert response.status_code == 200
+    assert body["Inserted"] == 2 and body["Failed"] == 1
+    assert [item["status"] for item in body["Results"]] == ["Success", "Success", "Error"]
@@ -0,0 +1,114 @@
+import json
+import time
+
+import pytest
+
+pytest.importorskip("app.models.table_model")
+pytest.importorskip("app.schemas.schemas")
+
+from sqlalchemy import event
+
+import app.models.table_model as models
+from app.services import config_store
+from app.services.config_cache import LatestConfigCache, latest_config_cache
+from app.services.config_store import latest_config, save_config
+
+FQN = "p||t||svc"
+
+
+def _config(run):
+    return {"project_name": "p", "task_name": "t", "dbservice_fqn": FQN,
+            "user_details": json.dumps({"dbservice_name": FQN, "run": run})}
+
+
+def _save_from_another_worker(db, monkeypatch, run):
+    #Another worker invalidates its own cache only
+    with monkeypatch.context() as patch:
+        patch.setattr(latest_config_cache, "invalidate", lambda key: None)
+        return save_config(db, models.UserDetailsIngestion, _config(run))[0]
+
+
+def test_save_invalidates_the_cached_latest_config(db):
+    save_config(db, models.UserDetailsIngestion, _config(1))
+    assert latest_config(db, models.UserDetailsIngestion, FQN)["version"] == "v1"
+
+    save_config(db, models.UserDetailsIngestion, _config(2))
+
+    assert latest_config(db, models.UserDetailsIngestion, FQN)["version"] == "v2"
+
+
+@pytest.fixture
+def validate_every_hit(monkeypatch):
+    #An interval of 0 disables the validation, the smallest positive one checks on every hit
+    monkeypatch.setattr(config_store, "CACHE_VALIDATE_SECONDS", 1e-9)
+
+
+def test_polling_is_served_from_the_cache_without_a_query(engine, db):
+    save_config(db, models.UserDetailsIngestion, _config(1))
+    latest_config(db, models.UserDetailsIngestion, FQN)
+    hits = latest_config_cache.hits
+    statements = []
+
+    def count(*args):
+        statements.append(args[2])
+    event.listen(engine, "before_cursor_execute", count)
+    try:
+        for _ in range(3):
+            assert latest_config(db, models.UserDetailsIngestion, FQN)["version"] == "v1"
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+
+    assert latest_config_cache.hits == hits + 3
+    assert statements == []
+
+
+def test_save_made_by_another_worker_is_seen_once_the_entry_expires(db, monkeypatch):
+    save_config(db, models.UserDetailsIngestion, _config(1))
+    assert latest_config(db, models.UserDetailsIngestion, FQN)["version"] == "v1"
+    _save_from_another_worker(db, monkeypatch, 2)
+    assert latest_config(db, models.UserDetailsIngestion, FQN)["version"] == "v1"
+
+    expired = time.monotonic() + latest_config_cache.ttl + 1
+    monkeypatch.setattr(time, "monotonic", lambda: expired)
+
+    assert latest_config(db, models.UserDetailsIngestion, FQN)["version"] == "v2"
+
+
+def test_save_made_by_another_worker_is_not_hidden_when_validating(db, monkeypatch, validate_every_hit):
+    save_config(db, models.UserDetailsIngestion, _config(1))
+    assert latest_config(db, models.UserDetailsIngestion, FQN)["version"] == "v1"
+
+    _save_from_another_worker(db, monkeypatch, 2)
+
+    assert latest_config(db, models.UserDetailsIngestion, FQN)["version"] == "v2"
+    assert latest_config_cache.stats()["stale"] == 1
+
+
+def test_cached_absence_is_dropped_once_another_worker_saves(db, monkeypatch, validate_every_hit):
+    assert latest_config(db, models.UserDetailsIngestion, FQN) is None
+
+    _save_from_another_worker(db, monkeypatch, 1)
+
+    assert latest_config(db, models.UserDetailsIngestion, FQN)["version"] == "v1"
+
+
+def test_value_loaded_before_an_invalidation_is_not_cached():
+    cache = LatestConfigCache(max_entries=4, ttl=60)
+    generation = cache.generation
+    cache.invalidate(("table", "fqn"))
+
+    cache.put(("table", "fqn"), "old", generation)
+
+    assert cache.get(("table", "fqn")) is None
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = LatestConfigCache(max_entries=2, ttl=60)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+
+    cache.put("c", 3)
+
+    assert cache.get("b") is None and cache.get("a") == 1
+    assert cache.stats()["evictions"] == 1
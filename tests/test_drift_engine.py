@@ -0,0 +1,43 @@
+import json
+import math
+
+import numpy as np
+
+from app.services.drift_engine import chi_square, compute_drift, score
+
+
+def test_chi_square_of_identical_distributions_shows_no_drift():
+    statistic, p_value = chi_square(np.array([50, 30, 20]), np.array([50, 30, 20]))
+
+    assert statistic < 1e-3 and p_value > 0.99
+
+
+def test_chi_square_stays_finite_when_a_category_is_missing_on_one_side():
+    for expected, actual in (([50, 30, 20], [60, 40, 0]), ([50, 30, 0], [50, 30, 20])):
+        statistic, p_value = chi_square(np.array(expected), np.array(actual))
+
+        assert math.isfinite(statistic) and math.isfinite(p_value)
+
+
+def test_chi_square_of_an_empty_sample_is_defined():
+    assert chi_square(np.array([50, 30, 20]), np.array([0, 0, 0])) == (0.0, 1.0)
+    assert chi_square(np.array([]), np.array([])) == (0.0, 1.0)
+
+
+def test_scores_of_an_empty_sample_serialize_as_strict_json():
+    results = [score(metric, np.array([5.0, 3.0]), np.array([0.0, 0.0]), 0.05)
+               for metric in ("psi", "ks", "jensen_shannon", "chi_square")]
+
+    json.dumps(results, allow_nan=False)
+
+
+def test_compute_drift_with_an_empty_current_file(tmp_path):
+    reference, current = tmp_path / "reference.csv", tmp_path / "current.csv"
+    reference.write_text("amount,country\n" + "".join(f"{value},{'fr' if value % 2 else 'de'}\n" for value in range(100)))
+    current.write_text("amount,country\n")
+
+    results = compute_drift(str(reference), str(current), ["amount"], ["country"],
+                            ["psi", "ks", "jensen_shannon", "chi_square"], 10, 100, 1000, {})
+
+    assert results
+    json.dumps(results, allow_nan=False, default=str)
@@ -0,0 +1,45 @@
+import time
+
+import pytest
+from sqlalchemy.orm import Session
+
+pytest.importorskip("app.models.table_model")
+pytest.importorskip("app.schemas.schemas")
+
+import app.models.table_model as models
+from app.services.purge import PurgeJobManager
+from app.services.registry import ProjectTaskRegistry
+
+
+def _purge(engine, db, project_name, task_name=None):
+    manager = PurgeJobManager(lambda: Session(engine))
+    job, _ = manager.submit(db, project_name, task_name)
+    manager._claim_and_start()
+    deadline = time.time() + 15
+    while manager.get(db, job.job_id).status not in ("Succeeded", "Failed"):
+        assert time.time() < deadline, "timed out"
+        time.sleep(0.02)
+        db.expire_all()
+    return manager.get(db, job.job_id)
+
+
+def test_purge_is_seen_by_the_registry_of_other_workers(engine, db):
+    db.add_all([models.ProjectEntity(project_name="p"), models.TaskEntity(project_name="p", task_name="t")])
+    db.commit()
+    other_worker = ProjectTaskRegistry(check_interval=0)
+    other_worker.warm(db)
+
+    assert _purge(engine, db, "p").status == "Succeeded"
+
+    assert other_worker.lookup(db, "p", "t") == (False, False)
+
+
+def test_task_purge_keeps_the_project(engine, db):
+    db.add_all([models.ProjectEntity(project_name="p"), models.TaskEntity(project_name="p", task_name="t")])
+    db.commit()
+    other_worker = ProjectTaskRegistry(check_interval=0)
+    other_worker.warm(db)
+
+    assert _purge(engine, db, "p", "t").status == "Succeeded"
+
+    assert other_worker.lookup(db, "p", "t") == (True, False)
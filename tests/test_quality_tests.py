@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("app.schemas.schemas")
+
+from app.services import quality_tests
+from app.services.quality_tests import ValuesToBeUnique
+
+
+def _duplicates(chunks):
+    check = ValuesToBeUnique({})
+    for chunk in chunks:
+        check.update(np.asarray(chunk))
+    return check.outcome()["value"]
+
+
+def test_duplicates_are_counted_within_and_across_chunks(monkeypatch):
+    #Small enough for the chunk values to be merged several times
+    monkeypatch.setattr(quality_tests, "READ_CHUNK_ROWS", 3)
+    rng = np.random.default_rng(7)
+    values = rng.integers(0, 50, size=400)
+
+    chunks = [values[start:start + 7] for start in range(0, len(values), 7)]
+
+    assert _duplicates(chunks) == len(values) - len(np.unique(values))
+
+
+def test_missing_values_and_text_chunks():
+    chunks = [np.array(["a", "b", "", None], dtype=object), np.array(["b", "c", "c"], dtype=object),
+              np.array([np.nan, 1.0])]
+
+    assert _duplicates(chunks) == 2
+    assert _duplicates([np.array([1, 2]), np.array([3, 4])]) == 0
@@ -0,0 +1,94 @@
+import pytest
+
+pytest.importorskip("app.models.table_model")
+pytest.importorskip("app.schemas.schemas")
+
+from sqlalchemy import event
+
+import app.models.table_model as models
+from app.services.registry import ProjectTaskRegistry, project_task_registry, registry_changed
+
+
+def _create(db, project_name, task_name=None):
+    db.add(models.ProjectEntity(project_name=project_name))
+    if task_name is not None:
+        db.add(models.TaskEntity(project_name=project_name, task_name=task_name))
+    db.commit()
+
+
+def _delete_from_another_worker(db, project_name):
+    db.query(models.TaskEntity).filter(models.TaskEntity.project_name == project_name).delete(synchronize_session=False)
+    db.query(models.ProjectEntity).filter(models.ProjectEntity.project_name == project_name).delete(synchronize_session=False)
+    registry_changed(db)
+    db.commit()
+
+
+def test_known_pairs_are_answered_from_memory(db):
+    _create(db, "p", "t")
+    registry = ProjectTaskRegistry()
+    registry.warm(db)
+    #Removed behind the registry's back, without a generation bump: only memory can still answer
+    db.query(models.TaskEntity).delete(synchronize_session=False)
+    db.commit()
+
+    assert registry.lookup(db, "p", "t") == (True, True)
+
+
+def test_pairs_created_by_another_worker_are_found(db):
+    registry = ProjectTaskRegistry()
+    registry.warm(db)
+
+    _create(db, "p", "t")
+
+    assert registry.lookup(db, "p", "t") == (True, True)
+    assert registry.lookup(db, "p", "other") == (True, False)
+    assert registry.lookup(db, "missing") == (False, False)
+
+
+def test_known_pairs_are_answered_without_a_query_between_checks(engine, db):
+    _create(db, "p", "t")
+    registry = ProjectTaskRegistry(check_interval=60)
+    registry.warm(db)
+    statements = []
+
+    def count(*args):
+        statements.append(args[2])
+    event.listen(engine, "before_cursor_execute", count)
+    try:
+        for _ in range(3):
+            assert registry.lookup(db, "p", "t") == (True, True)
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+
+    assert statements == []
+
+
+def test_deletion_by_another_worker_is_seen(db):
+    _create(db, "p", "t")
+    registry = ProjectTaskRegistry(check_interval=0)
+    registry.warm(db)
+    assert registry.lookup(db, "p", "t") == (True, True)
+
+    _delete_from_another_worker(db, "p")
+
+    assert registry.lookup(db, "p", "t") == (False, False)
+
+
+def test_project_deleted_elsewhere_can_be_created_again(client, db, monkeypatch):
+    monkeypatch.setattr(project_task_registry, "check_interval", 0)
+    assert client.post("/project/create", json={"project_name": "p"}).json()["Message"] == "Project Created Successfully"
+
+    _delete_from_another_worker(db, "p")
+
+    assert client.post("/project/create", json={"project_name": "p"}).json()["Message"] == "Project Created Successfully"
+
+
+def test_task_delete_endpoint_bumps_the_generation(client, db):
+    client.post("/project/create", json={"project_name": "p"})
+    client.post("/task/create", json={"project_name": "p", "task_name": "t"})
+    other_worker = ProjectTaskRegistry(check_interval=0)
+    other_worker.warm(db)
+
+    client.post("/task/delete", json={"project_name": "p", "task_name": "t"})
+
+    assert other_worker.lookup(db, "p", "t") == (True, False)
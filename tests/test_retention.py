@@ -0,0 +1,89 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy.orm import Session
+
+pytest.importorskip("app.models.table_model")
+pytest.importorskip("app.schemas.schemas")
+
+import app.models.table_model as models
+from app.databases.partitioning import convert_to_partitioned
+from app.models.rollup_model import ResultRollup
+from app.services.retention import PartitionMaintenance, ensure_rollups
+from app.services.rollups import rebuild_rollups, record_rollups
+
+NOW = datetime(2026, 10, 17, 12)
+OLD = datetime(2024, 1, 15, 10, 30)
+
+
+def _store(db, value, created_at, rolled_up=True):
+    row = {"dbservice_fqn": "svc", "table_name": "orders", "column_name": "amount",
+           "test_type": "columnValuesToBeBetween", "result": "Success", "value": value, "created_at": created_at}
+    db.add(models.ProfilingEntity(**row))
+    if rolled_up:
+        record_rollups(db, models.ProfilingEntity, [row])
+    db.commit()
+
+
+def _hourly_count(db, bucket_start):
+    return sum(row.count for row in db.query(ResultRollup).filter(ResultRollup.resolution == "hour",
+                                                                  ResultRollup.bucket_start == bucket_start))
+
+
+@pytest.fixture
+def retire(engine, monkeypatch):
+    monkeypatch.setenv("RUNML_RETENTION_PROFILING_DAYS", "30")
+    return lambda: PartitionMaintenance(engine, lambda: Session(engine), interval=0).run(now=NOW)
+
+
+def test_rebuild_keeps_the_rollups_of_retired_partitions(db, retire):
+    _store(db, 1.0, OLD)
+    _store(db, 2.0, NOW)
+    retire()
+    assert db.query(models.ProfilingEntity).count() == 1
+
+    summary = rebuild_rollups(db, "profiling")
+
+    assert summary["Rows"] == 1 and summary["Since"] == datetime(2026, 9, 1)
+    assert _hourly_count(db, datetime(2024, 1, 15, 10)) == 1
+    assert _hourly_count(db, datetime(2026, 10, 17, 12)) == 1
+
+
+def test_rebuild_since_a_retired_range_is_clamped(db, retire):
+    _store(db, 1.0, OLD)
+    retire()
+
+    assert rebuild_rollups(db, "profiling", since=datetime(2024, 1, 1))["Since"] == datetime(2026, 9, 1)
+    assert _hourly_count(db, datetime(2024, 1, 15, 10)) == 1
+
+
+def test_partly_rolled_up_range_is_rolled_up_again_before_it_is_retired(db, retire):
+    _store(db, 1.0, OLD)
+    _store(db, 2.0, OLD, rolled_up=False)
+    _store(db, 3.0, OLD.replace(hour=11), rolled_up=False)
+
+    report = retire()
+
+    compacted = next(item for item in report["tables"]["profiling"]["retired"] if item["partition"].endswith("20240101"))
+    assert compacted["rolled_up"] == 3
+    assert _hourly_count(db, datetime(2024, 1, 15, 10)) == 2
+    assert _hourly_count(db, datetime(2024, 1, 15, 11)) == 1
+
+
+def test_covered_range_is_not_rolled_up_again(db):
+    _store(db, 1.0, OLD)
+    _store(db, 2.0, OLD)
+
+    assert ensure_rollups(db, models.ProfilingEntity, datetime(2024, 1, 1), datetime(2024, 2, 1)) == 0
+    assert _hourly_count(db, datetime(2024, 1, 15, 10)) == 2
+
+
+def test_large_table_is_left_alone_without_being_locked(engine, db):
+    _store(db, 1.0, NOW)
+    _store(db, 2.0, NOW)
+
+    #SQLite has no LOCK TABLE: the size is checked before it
+    with engine.begin() as conn:
+        report = convert_to_partitioned(conn, models.ProfilingEntity.__table__, max_rows=1)
+
+    assert report["action"] == "skipped"
@@ -0,0 +1,64 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy import event
+
+pytest.importorskip("app.models.table_model")
+pytest.importorskip("app.schemas.schemas")
+
+import app.models.table_model as models
+from app.models.rollup_model import ResultRollup
+from app.schemas.schemas import ProfilingResultsRow
+from app.services.batch_ingest import bulk_insert
+from app.services.rollups import rebuild_rollups, record_rollups
+
+
+def _profiling_row(value):
+    return {"dbservice_fqn": "svc", "table_name": "orders", "column_name": "amount",
+            "test_type": "columnValuesToBeBetween", "result": "Success", "value": value}
+
+
+def _rollups(db):
+    return sorted((row.resolution, row.bucket_start, row.metric, row.count, row.total, row.min_value,
+                   row.max_value, row.last_value, row.last_at) for row in db.query(ResultRollup))
+
+
+def test_rows_are_rolled_up_at_their_stored_created_at(db, client):
+    bulk_insert(db, models.ProfilingEntity, ProfilingResultsRow, [_profiling_row(1.0), _profiling_row(2.0)])
+    client.post("/profiler/profiling_result", json=_profiling_row(3.0))
+    db.expire_all()
+
+    latest = db.query(models.ProfilingEntity).order_by(models.ProfilingEntity.created_at.desc()).first()
+    hourly = db.query(ResultRollup).filter(ResultRollup.resolution == "hour").one()
+    assert hourly.last_at == latest.created_at
+
+
+def test_rebuilt_rollups_match_the_live_ones(db, client):
+    bulk_insert(db, models.ProfilingEntity, ProfilingResultsRow, [_profiling_row(float(value)) for value in range(5)])
+    client.post("/profiler/profiling_result", json=_profiling_row(7.0))
+    db.expire_all()
+    live = _rollups(db)
+
+    rebuild_rollups(db, "profiling")
+
+    assert _rollups(db) == live
+
+
+def test_existing_buckets_are_merged_with_one_statement(engine, db):
+    moment = datetime(2026, 10, 17, 12, 30)
+    record_rollups(db, models.ProfilingEntity, [_profiling_row(5.0)], moment)
+    statements = []
+
+    def count(*args):
+        statements.append(args[2])
+    event.listen(engine, "before_cursor_execute", count)
+    try:
+        record_rollups(db, models.ProfilingEntity, [_profiling_row(1.0), _profiling_row(9.0)], moment.replace(minute=45))
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+    db.commit()
+
+    assert len(statements) == 1
+    hourly = db.query(ResultRollup).filter(ResultRollup.resolution == "hour", ResultRollup.metric == "value").one()
+    assert (hourly.count, hourly.total, hourly.min_value, hourly.max_value) == (3, 15.0, 1.0, 9.0)
+    assert hourly.last_at == moment.replace(minute=45)
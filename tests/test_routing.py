@@ -0,0 +1,79 @@
+import json
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+pytest.importorskip("app.models.table_model")
+pytest.importorskip("app.schemas.schemas")
+
+import app.models.table_model as models
+from app.databases import database, routing
+from app.schemas.schemas import ProfilingResultsRow
+from app.services.batch_ingest import bulk_insert
+from app.services.config_store import save_config
+
+
+@pytest.fixture
+def replica(engine, monkeypatch, tmp_path):
+    replica_engine = create_engine(f"sqlite:///{tmp_path / 'replica.db'}")
+    monkeypatch.setattr(routing, "read_engine", replica_engine)
+    monkeypatch.setattr(routing, "ReadSessionLocal", sessionmaker(bind=replica_engine))
+    monkeypatch.setattr(routing.write_clock, "last_write", float("-inf"))
+    return replica_engine
+
+
+def _read_bind():
+    sessions = routing.get_read_db()
+    db = next(sessions)
+    try:
+        return db.get_bind()
+    finally:
+        sessions.close()
+
+
+def _write(work):
+    with routing.SessionLocal() as db:
+        work(db)
+        db.commit()
+
+
+def test_results_writes_keep_the_reads_on_the_replica(db, replica):
+    _write(lambda session: bulk_insert(session, models.ProfilingEntity, ProfilingResultsRow,
+                                       [{"dbservice_fqn": "svc", "value": 1.0}]))
+    _write(lambda session: session.add(models.ProfilingEntity(dbservice_fqn="svc", value=2.0)))
+
+    assert not routing.write_clock.recent(routing.REPLICA_MAX_LAG)
+    assert _read_bind() is replica
+
+
+def test_reads_fall_back_to_the_primary_after_a_config_write(db, replica):
+    config = {"project_name": "p", "task_name": "t", "dbservice_fqn": "p||t||svc",
+              "user_details": json.dumps({"dbservice_name": "p||t||svc"})}
+    _write(lambda session: save_config(session, models.UserDetailsIngestion, config))
+
+    assert _read_bind() is routing.engine
+
+
+def test_bulk_delete_of_a_project_counts_as_a_write(db, replica):
+    _write(lambda session: session.query(models.ProjectEntity)
+           .filter(models.ProjectEntity.project_name == "p").delete(synchronize_session=False))
+
+    assert _read_bind() is routing.engine
+
+
+def test_rolled_back_write_does_not_count(db, replica):
+    with routing.SessionLocal() as session:
+        session.add(models.ProjectEntity(project_name="p"))
+        session.flush()
+        session.rollback()
+
+    assert _read_bind() is replica
+
+
+def test_primary_reuses_the_engine_of_the_database_module_without_a_url(tmp_path):
+    assert routing.primary_engine(None) is database.engine
+
+    primary = routing.primary_engine(f"sqlite:///{tmp_path / 'primary.db'}")
+    assert primary is not database.engine
+    primary.dispose()
@@ -0,0 +1,59 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from sqlalchemy.orm import Session
+
+pytest.importorskip("app.models.table_model")
+pytest.importorskip("app.schemas.schemas")
+
+import app.models.table_model as models
+from app.services.config_store import save_config
+from app.services.versioning import next_version
+
+
+def _config(fqn, run):
+    return {"project_name": "p", "task_name": "t", "dbservice_fqn": fqn,
+            "user_details": json.dumps({"dbservice_name": fqn, "run": run})}
+
+
+def test_versions_follow_each_other(db):
+    versions = [save_config(db, models.UserDetailsIngestion, _config("p||t||svc", run))[0].version for run in range(3)]
+
+    assert versions == ["v1", "v2", "v3"]
+
+
+def test_concurrent_saves_get_distinct_versions(engine, db):
+    def save(run):
+        with Session(engine) as session:
+            return save_config(session, models.UserDetailsIngestion, _config("p||t||svc", run))[0].version
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        versions = list(pool.map(save, range(16)))
+
+    assert sorted(versions, key=lambda version: int(version[1:])) == [f"v{number}" for number in range(1, 17)]
+    assert db.query(models.UserDetailsIngestion).count() == 16
+
+
+def test_counter_is_seeded_from_existing_history(db):
+    for number in (1, 2):
+        db.add(models.UserDetailsIngestion(**_config("p||t||old", number), version=f"v{number}"))
+    db.commit()
+
+    assert next_version(db, models.UserDetailsIngestion, "p||t||old") == 3
+
+
+def test_counter_is_seeded_past_the_highest_version_after_deletions(db):
+    #v2 to v4 deleted, e.g. by hand or by a purge that also removed the counter
+    for number in (1, 5):
+        db.add(models.UserDetailsIngestion(**_config("p||t||old", number), version=f"v{number}"))
+    db.commit()
+
+    assert next_version(db, models.UserDetailsIngestion, "p||t||old") == 6
+
+
+def test_rolled_back_save_does_not_consume_a_version(db):
+    assert next_version(db, models.UserDetailsIngestion, "p||t||svc") == 1
+    db.rollback()
+
+    assert next_version(db, models.UserDetailsIngestion, "p||t||svc") == 1
@@ -0,0 +1,108 @@
+import os
+import sys
+import time
+
+import pytest
+import yaml
+from sqlalchemy.orm import Session
+
+pytest.importorskip("app.models.table_model")
+pytest.importorskip("app.schemas.schemas")
+
+import app.models.table_model as models
+from app.services import workflow_jobs
+from app.services.workflow_jobs import WorkflowJobManager
+
+#Stands in for the `metadata` CLI: it runs until the test creates <config>.release, then exits with
+#the exit_code of its YAML
+STUB_WORKFLOW = """
+import os, sys, time
+import yaml
+
+config = yaml.safe_load(open(sys.argv[1]))
+print("running", config["source"]["serviceName"], flush=True)
+deadline = time.time() + 30
+while not os.path.exists(sys.argv[1] + ".release") and time.time() < deadline:
+    time.sleep(0.02)
+sys.exit(config.get("exit_code", 0))
+"""
+
+
+def _wait(predicate, timeout=15.0):
+    deadline = time.time() + timeout
+    while not predicate():
+        assert time.time() < deadline, "timed out"
+        time.sleep(0.02)
+
+
+@pytest.fixture
+def manager(engine, tmp_path, monkeypatch):
+    stub = tmp_path / "stub_workflow.py"
+    stub.write_text(STUB_WORKFLOW)
+    for workflow_type in workflow_jobs.WORKFLOW_COMMANDS:
+        monkeypatch.setitem(workflow_jobs.WORKFLOW_COMMANDS, workflow_type, f"{sys.executable} {stub} {{config}}")
+    jobs = WorkflowJobManager(lambda: Session(engine), max_running=4, max_running_per_service=1)
+    yield jobs
+    jobs.shutdown()
+    _wait(lambda: all(job["status"] in workflow_jobs.FINISHED for job in jobs.list()))
+
+
+@pytest.fixture
+def write_config(tmp_path):
+    def write(name, service, exit_code=0):
+        path = tmp_path / f"{name}.yaml"
+        path.write_text(yaml.safe_dump({"source": {"serviceName": service}, "exit_code": exit_code}))
+        return str(path)
+    return write
+
+
+def _release(job):
+    open(job.config_path + ".release", "w").close()
+
+
+def test_finished_jobs_record_a_result_row_without_a_template(db, manager, write_config):
+    succeeded = manager.submit("metadata", write_config("ingest", "svc-a"))
+    failed = manager.submit("profiler", write_config("profile", "svc-b", exit_code=3))
+    _release(succeeded)
+    _release(failed)
+
+    _wait(lambda: succeeded.result_recorded and failed.result_recorded)
+
+    assert (succeeded.status, failed.status) == ("Succeeded", "Failed")
+    assert [(row.dbservice_fqn, row.status) for row in db.query(models.MetadataIngestionEntity)] == [("svc-a", "Succeeded")]
+    profiled = db.query(models.ProfilingEntity).one()
+    assert (profiled.dbservice_fqn, profiled.test_type, profiled.result) == ("svc-b", "workflowRun", "Failed")
+    assert manager.tail(succeeded.job_id) == ["running svc-a"]
+
+
+def test_jobs_of_the_same_service_run_one_at_a_time(manager, write_config):
+    first = manager.submit("metadata", write_config("ingest", "svc-a"))
+    second = manager.submit("usage", write_config("usage", "svc-a"))
+    other = manager.submit("profiler", write_config("profile", "svc-b"))
+
+    _wait(lambda: first.status == "Running" and other.status == "Running")
+    assert second.status == "Queued"
+
+    _release(first)
+    _wait(lambda: second.status == "Running")
+    assert first.status == "Succeeded"
+
+
+def test_submitted_service_overrides_the_yaml(manager, write_config):
+    job = manager.submit("metadata", write_config("ingest", "svc-a"), service_fqn="p||t||svc-a")
+
+    assert manager.list(service_fqn="p||t||svc-a")[0]["job_id"] == job.job_id
+
+
+def test_cancelled_jobs_are_recorded(db, manager, write_config):
+    running = manager.submit("metadata", write_config("ingest", "svc-a"))
+    queued = manager.submit("metadata", write_config("again", "svc-a"))
+    _wait(lambda: running.status == "Running" and running.process is not None)
+
+    manager.cancel(queued.job_id)
+    manager.cancel(running.job_id)
+
+    _wait(lambda: running.result_recorded and queued.result_recorded)
+    assert (running.status, queued.status) == ("Cancelled", "Cancelled")
+    assert {row.status for row in db.query(models.MetadataIngestionEntity)} == {"Cancelled"}
+    assert db.query(models.MetadataIngestionEntity).count() == 2
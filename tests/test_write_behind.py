@@ -0,0 +1,73 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from sqlalchemy.orm import Session
+
+pytest.importorskip("app.models.table_model")
+pytest.importorskip("app.schemas.schemas")
+
+import app.models.table_model as models
+from app.services import write_behind as write_behind_module
+from app.services.alerts import alert_engine
+from app.services.write_behind import WriteBehindBuffer
+
+
+def _profiling_row(value):
+    return {"dbservice_fqn": "svc", "table_name": "orders", "column_name": "amount",
+            "test_type": "columnValuesToBeBetween", "result": "Success", "value": value}
+
+
+@pytest.fixture
+def buffer(engine):
+    #Long enough for the rows submitted together to share a batch
+    rows = WriteBehindBuffer(lambda: Session(engine), durability="flush", flush_ms=200, max_rows=10)
+    rows.start()
+    yield rows
+    rows.shutdown()
+
+
+def _submit_together(buffer, values):
+    with ThreadPoolExecutor(max_workers=len(values)) as pool:
+        return list(pool.map(lambda value: buffer.submit(models.ProfilingEntity, _profiling_row(value)), values))
+
+
+def test_rows_are_saved_in_one_batch(db, buffer):
+    saved = _submit_together(buffer, [1.0, 2.0, 3.0])
+
+    assert sorted(row["value"] for row in saved) == [1.0, 2.0, 3.0]
+    assert all(row["id"] is not None and row["created_at"] is not None for row in saved)
+    assert buffer.stats()["batches"] == 1
+
+
+def test_alert_failure_after_the_commit_does_not_write_the_batch_again(db, buffer, monkeypatch):
+    def fail(*args, **kwargs):
+        raise RuntimeError("alert rules unavailable")
+    monkeypatch.setattr(alert_engine, "observe", fail)
+
+    saved = _submit_together(buffer, [1.0, 2.0, 3.0])
+
+    assert len(saved) == 3
+    assert db.query(models.ProfilingEntity).count() == 3
+    assert buffer.stats()["failed"] == 0
+
+
+def test_read_back_failure_answers_with_the_values_sent(db, buffer, monkeypatch):
+    def fail(obj):
+        raise RuntimeError("connection lost")
+    monkeypatch.setattr(write_behind_module, "row_dict", fail)
+
+    saved = _submit_together(buffer, [1.0, 2.0])
+
+    assert sorted(row["value"] for row in saved) == [1.0, 2.0]
+    assert db.query(models.ProfilingEntity).count() == 2
+
+
+def test_a_bad_row_does_not_fail_the_rest_of_its_batch(db, buffer):
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        good = [pool.submit(buffer.submit, models.ProfilingEntity, _profiling_row(value)) for value in (1.0, 2.0)]
+        bad = pool.submit(buffer.submit, models.ProfilingEntity, {"no_such_column": 1})
+
+    assert [future.result()["value"] for future in good] == [1.0, 2.0]
+    with pytest.raises(Exception):
+        bad.result()
+    assert db.query(models.ProfilingEntity).count() == 2